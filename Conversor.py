@@ -3,7 +3,7 @@
 
 This script provides a complete workflow for voice conversion:
 1. Separates vocals from a song
-2. Trains a voice model or uses an existing one
+2. Trains a voice model, reusing a registered one for a previously seen voice sample
 3. Converts the vocals to match your voice
 4. Merges the converted vocals with the instrumental
 5. Saves all intermediate files for further use
@@ -12,7 +12,9 @@ This script provides a complete workflow for voice conversion:
 import os
 import sys
 import argparse
-from scripts.full_conversion_workflow import full_conversion_workflow
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from scripts.full_conversion_workflow import full_conversion_workflow, separate_song
 
 def main():
     parser = argparse.ArgumentParser(description='Run the full voice conversion workflow')
@@ -22,24 +24,93 @@ def main():
     parser.add_argument('-c', '--config-path', default='so-vits-svc/configs/config.json', help='Path to the model configuration file')
     parser.add_argument('-o', '--output-dir', default='output', help='Directory where all output files will be saved')
     parser.add_argument('-d', '--so-vits-svc-dir', default='so-vits-svc', help='Path to the so-vits-svc directory')
+    parser.add_argument('--registry', help='Path to the trained model registry (default: <so-vits-svc-dir>/logs/model_registry.json)')
+    parser.add_argument('-b', '--base-model', help='Pretrained generator checkpoint (G_*.pth) to fine-tune a new model from')
+    parser.add_argument('--max-minutes', type=float, help='Stop training a new model after this many minutes')
+    parser.add_argument('--max-steps', type=int, help='Stop training a new model after this many steps')
+    parser.add_argument('--patience', type=int, help='Stop training a new model after this many checkpoints without the loss improving')
+    parser.add_argument('--train-ranks', type=int, help='Train a new model on the CPU with this many data-parallel processes')
+    parser.add_argument('--train-telemetry', help="Write JSON-lines training events (steps, losses, ETA, checkpoints) to this file")
+    parser.add_argument('--preview', action='store_true', help='Render a 30-second preview of the conversion while the full song renders')
+    parser.add_argument('--vocal-volume', type=float, default=-2, help='Volume adjustment for the vocals in the final mix, in dB')
+    parser.add_argument('--instrumental-volume', type=float, default=-1, help='Volume adjustment for the instrumental in the final mix, in dB')
+    parser.add_argument('--force', action='store_true', help='Re-run every conversion stage even if its previous outputs in the output directory are still valid')
+    parser.add_argument('--no-registry', action='store_true', help='Always train a new model instead of reusing one trained on the same voice sample')
     
     args = parser.parse_args()
+    if args.train_telemetry == '-':
+        parser.error("--train-telemetry - would mix the events into the log; write them to a file, or train with scripts/train_model.py --events jsonl")
     
     # Create output directory if it doesn't exist
     os.makedirs(args.output_dir, exist_ok=True)
     
-    # If no model path is provided, train a new model
-    if not args.model_path:
-        print("\n===== TRAINING NEW VOICE MODEL =====\n")
-        from scripts.train_model import train_voice_model
+    # Options for training a new model; they are part of the registry key
+    train_options = {
+        'base_model': os.path.abspath(args.base_model) if args.base_model else None,
+        'max_minutes': args.max_minutes,
+        'max_steps': args.max_steps,
+        'patience': args.patience,
+        'num_ranks': args.train_ranks,
+    }
+    
+    # If no model path is provided, look for a model already trained on this voice sample
+    fingerprint = None
+    train_config = None
+    registry_path = None
+    if not args.model_path and not args.no_registry:
+        from scripts.model_registry import default_registry_path, fingerprint_voice_sample, lookup_model
+        from scripts.train_model import training_config
+        registry_path = args.registry or default_registry_path(args.so_vits_svc_dir)
         try:
-            model_name = os.path.splitext(os.path.basename(args.voice_sample))[0]
-            args.model_path = train_voice_model(args.voice_sample, model_name, args.so_vits_svc_dir)
-            print(f"Trained new model: {args.model_path}")
+            train_config = training_config(args.so_vits_svc_dir, **train_options)
+            fingerprint = fingerprint_voice_sample(args.voice_sample, train_config)
+            registered = lookup_model(registry_path, fingerprint)
+            if registered:
+                # The config must be the one the model was trained with
+                args.model_path, args.config_path = registered
+                print(f"Reusing model already trained on this voice sample: {args.model_path}")
         except Exception as e:
-            print(f"Error during model training: {str(e)}")
-            print("Please provide a pre-trained model using the -m option.")
-            return 1
+            print(f"Warning: could not check the model registry: {str(e)}")
+            fingerprint = None
+    
+    # If there is still no model, train a new one
+    if not args.model_path:
+        # Separation does not need the model, so run it in another process while training.
+        # The workflow finds it in its pipeline state and does not separate again.
+        # A separate process keeps Demucs clear of the training's chdir, and spawn
+        # avoids forking a process that has already imported torch.
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            separation = pool.submit(separate_song, os.path.abspath(args.input_song), os.path.abspath(args.output_dir))
+            
+            print("\n===== TRAINING NEW VOICE MODEL =====\n")
+            from scripts.train_model import train_voice_model
+            try:
+                model_name = os.path.splitext(os.path.basename(args.voice_sample))[0]
+                args.model_path = train_voice_model(args.voice_sample, model_name, args.so_vits_svc_dir,
+                                                    telemetry=args.train_telemetry, **train_options)
+                print(f"Trained new model: {args.model_path}")
+            except Exception as e:
+                print(f"Error during model training: {str(e)}")
+                print("Please provide a pre-trained model using the -m option.")
+                print("Waiting for the song separation to finish so the next run can reuse it...")
+                return 1
+            
+            if fingerprint:
+                from scripts.model_registry import register_model
+                try:
+                    # train.py reads and writes configs/config.json in the so-vits-svc directory
+                    entry = register_model(registry_path, fingerprint, args.model_path,
+                                           os.path.join(args.so_vits_svc_dir, 'configs', 'config.json'),
+                                           args.voice_sample, train_config)
+                    args.model_path, args.config_path = entry['model_path'], entry['config_path']
+                except Exception as e:
+                    print(f"Warning: could not register the trained model: {str(e)}")
+            
+            try:
+                separation.result()
+            except Exception as e:
+                # The workflow runs the separation again and reports the error itself
+                print(f"Error during background vocal separation: {str(e)}")
     
     try:
         # Run the full workflow
@@ -49,7 +120,11 @@ def main():
             args.model_path,
             args.config_path,
             args.output_dir,
-            args.so_vits_svc_dir
+            args.so_vits_svc_dir,
+            preview=args.preview,
+            vocal_volume=args.vocal_volume,
+            instrumental_volume=args.instrumental_volume,
+            force=args.force
         )
         
         # Print summary of all output files
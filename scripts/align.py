@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Latency alignment between converted vocals and the separated instrumental.
+
+so-vits-svc inference can delay or pad the converted vocals. The offset is
+estimated against the original separated vocals, which are sample-aligned
+with the instrumental: both tracks are reduced to a ~2 kHz amplitude envelope
+(robust to the change of timbre), and the highest-energy window of the
+reference is located in the converted track by FFT cross-correlation.
+"""
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.mixer import decode_audio, iter_audio_blocks, probe_audio, write_audio
+
+# Rate of the envelopes that are correlated
+ENVELOPE_RATE = 2000
+
+# Length of the reference excerpt that is searched for
+WINDOW_SECONDS = 30.0
+
+# Below this normalized correlation the tracks are not treated as the same performance
+MIN_CONFIDENCE = 0.3
+
+def decimation_factor(sample_rate):
+    """Number of input frames averaged into each envelope sample."""
+    return max(1, int(sample_rate // ENVELOPE_RATE))
+
+def envelope(samples, factor):
+    """Amplitude envelope of float32 samples: mean of |x| over `factor` frames and all channels."""
+    if samples.ndim == 1:
+        samples = samples[:, None]
+    usable = len(samples) - len(samples) % factor
+    return np.abs(samples[:usable]).reshape(-1, factor * samples.shape[1]).mean(axis=1, dtype=np.float32)
+
+def envelope_from_blocks(blocks, factor):
+    """Like `envelope`, for a block iterator (see `iter_audio_blocks`)."""
+    parts = []
+    carry = None
+    for block in blocks:
+        if carry is not None and len(carry):
+            block = np.concatenate([carry, block])
+        usable = len(block) - len(block) % factor
+        parts.append(envelope(block[:usable], factor))
+        carry = block[usable:]
+    return np.concatenate(parts) if parts else np.zeros(0, dtype=np.float32)
+
+def estimate_offset_envelopes(reference, candidate, factor, envelope_rate, max_offset_seconds=1.0,
+                              window_seconds=WINDOW_SECONDS):
+    """Estimate how many frames `candidate` lags behind `reference`.
+
+    Args:
+        reference (np.ndarray): Envelope of the original vocals.
+        candidate (np.ndarray): Envelope of the converted vocals.
+        factor (int): Frames per envelope sample.
+        envelope_rate (float): Sample rate of the envelopes.
+        max_offset_seconds (float): Largest offset searched, in either direction.
+        window_seconds (float): Length of the reference excerpt that is matched.
+
+    Returns:
+        tuple: (offset_frames, confidence). A positive offset means the
+        candidate starts late; confidence is the normalized correlation peak.
+    """
+    max_lag = int(max_offset_seconds * envelope_rate)
+    window = min(int(window_seconds * envelope_rate), len(reference))
+    if window < 2 or not len(candidate):
+        return 0, 0.0
+
+    # The reference excerpt with the most energy gives the sharpest peak
+    energy = np.concatenate([[0.0], np.cumsum(reference.astype(np.float64) ** 2)])
+    start = int(np.argmax(energy[window:] - energy[:-window])) if len(reference) > window else 0
+    excerpt = reference[start:start + window].astype(np.float64)
+    excerpt -= excerpt.mean()
+
+    # Candidate region covering every lag in [-max_lag, max_lag], zero-padded past its ends
+    padded = np.concatenate([np.zeros(max_lag), candidate.astype(np.float64), np.zeros(max_lag + window)])
+    segment = padded[start:start + window + 2 * max_lag]
+    segment = segment - segment.mean()
+
+    # Cross-correlation for every lag in one FFT product
+    size = 1 << int(np.ceil(np.log2(len(segment) + window)))
+    correlation = np.fft.irfft(np.fft.rfft(segment, size) * np.conj(np.fft.rfft(excerpt, size)), size)
+    correlation = correlation[:2 * max_lag + 1]
+
+    # Normalize by the energy of each candidate window so silence cannot win
+    segment_energy = np.concatenate([[0.0], np.cumsum(segment ** 2)])
+    local_energy = segment_energy[window:window + 2 * max_lag + 1] - segment_energy[:2 * max_lag + 1]
+    norm = np.sqrt(np.maximum(local_energy, 1e-12) * max(float(np.dot(excerpt, excerpt)), 1e-12))
+    normalized = correlation / norm
+
+    peak = int(np.argmax(normalized))
+    position = float(peak)
+    if 0 < peak < len(normalized) - 1:
+        # Parabolic interpolation for sub-envelope-sample resolution
+        left, center, right = normalized[peak - 1:peak + 2]
+        denominator = left - 2 * center + right
+        if denominator < 0:
+            position += 0.5 * (left - right) / denominator
+    return int(round((position - max_lag) * factor)), float(normalized[peak])
+
+def estimate_offset(reference_file, candidate_file, sample_rate=None, max_offset_seconds=1.0):
+    """Estimate the latency of `candidate_file` relative to `reference_file`.
+
+    Both files are streamed block by block into their envelopes, so memory use
+    is a few MB per hour of audio.
+
+    Returns:
+        tuple: (offset_frames at `sample_rate`, confidence).
+    """
+    sample_rate = sample_rate or probe_audio(reference_file)[0]
+    factor = decimation_factor(sample_rate)
+    reference = envelope_from_blocks(iter_audio_blocks(reference_file, sample_rate), factor)
+    candidate = envelope_from_blocks(iter_audio_blocks(candidate_file, sample_rate), factor)
+    return estimate_offset_envelopes(reference, candidate, factor, sample_rate / factor, max_offset_seconds)
+
+def shift(samples, offset):
+    """Advance `samples` by `offset` frames (or delay them, if negative), keeping the length."""
+    if offset > 0:
+        return np.concatenate([samples[offset:], np.zeros((min(offset, len(samples)),) + samples.shape[1:], samples.dtype)])
+    if offset < 0:
+        return np.concatenate([np.zeros((min(-offset, len(samples)),) + samples.shape[1:], samples.dtype), samples[:offset]])
+    return samples
+
+def shift_blocks(blocks, offset, channels):
+    """Advance a block iterator by `offset` frames (or delay it, if negative)."""
+    if offset < 0:
+        yield np.zeros((-offset, channels), dtype=np.float32)
+    skip = max(offset, 0)
+    for block in blocks:
+        if skip:
+            dropped = min(skip, len(block))
+            block = block[dropped:]
+            skip -= dropped
+        if len(block):
+            yield block
+
+def main():
+    parser = argparse.ArgumentParser(description='Estimate the latency of converted vocals against the original separated vocals')
+    parser.add_argument('reference_file', help='Path to the original separated vocals')
+    parser.add_argument('candidate_file', help='Path to the converted vocals')
+    parser.add_argument('--max-offset', type=float, default=1.0, help='Largest offset to search for, in seconds')
+    parser.add_argument('-o', '--output-file', help='Also write the aligned converted vocals to this file')
+
+    args = parser.parse_args()
+
+    try:
+        sample_rate = probe_audio(args.candidate_file)[0]
+        offset, confidence = estimate_offset(args.reference_file, args.candidate_file, sample_rate, args.max_offset)
+        print(f"Converted vocals are {offset / sample_rate * 1000:+.1f} ms late (confidence {confidence:.2f})")
+        if args.output_file:
+            samples, _ = decode_audio(args.candidate_file)
+            write_audio(args.output_file, shift(samples, offset), sample_rate)
+            print(f"Aligned vocals saved to: {args.output_file}")
+        print(f'OFFSET_FRAMES={offset}')
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
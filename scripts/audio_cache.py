@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Decoded-audio cache shared by all stages.
+
+Decoding the same MP3/M4A again in every stage costs an ffmpeg process each
+time. `load_audio` decodes a file once per (content, sample rate, channels),
+stores the float32 samples as a .npy file and returns it memory-mapped, so
+later loads in this process or any other are a page-cache read. Entries are
+keyed by a hash of the file contents, not its path, so renamed or copied
+files hit the cache and modified files miss it.
+
+The returned arrays are read-only; stages that need to modify the samples
+must copy them first.
+"""
+
+import os
+import sys
+import hashlib
+import argparse
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.mixer import decode_audio, probe_audio
+
+HASH_CHUNK_SIZE = 1 << 20
+
+# Least recently used entries are removed beyond this size
+DEFAULT_MAX_BYTES = 8 << 30
+
+# Decoded arrays kept open in this process (memory-mapped unless the disk cache is off)
+MAX_MEMORY_ENTRIES = 32
+
+_lock = threading.Lock()
+_digests = {}
+_formats = {}
+_arrays = OrderedDict()
+
+def default_cache_dir():
+    """Cache directory: $AUDIO_CACHE_DIR, or a directory under the system temp dir."""
+    return os.environ.get('AUDIO_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'conversor_audio_cache')
+
+def file_digest(path):
+    """SHA-256 of the file contents, remembered per (path, size, mtime) for this process."""
+    stat = os.stat(path)
+    stamp = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    with _lock:
+        digest = _digests.get(stamp)
+    if digest is None:
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        digest = hasher.hexdigest()
+        with _lock:
+            _digests[stamp] = digest
+    return digest
+
+def _entry_path(cache_dir, digest, sample_rate, channels):
+    return os.path.join(cache_dir, f"{digest}_{sample_rate}_{channels}.npy")
+
+def load_audio(path, sample_rate=None, channels=None, cache_dir=None):
+    """Decode an audio file through the cache.
+
+    Args:
+        path (str): Path to the audio file.
+        sample_rate (int): Sample rate to decode to (default: the file's rate).
+        channels (int): Channel count to decode to (default: the file's layout).
+        cache_dir (str): On-disk cache directory (default: `default_cache_dir()`).
+            Pass False to only use the in-process cache.
+
+    Returns:
+        tuple: (samples, sample_rate) where samples is a read-only float32
+        array of shape (frames, channels).
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Audio file not found: {path}")
+    digest = file_digest(path)
+    if not sample_rate or not channels:
+        with _lock:
+            file_format = _formats.get(digest)
+        if file_format is None:
+            file_format = probe_audio(path)
+            with _lock:
+                _formats[digest] = file_format
+        sample_rate = sample_rate or file_format[0]
+        channels = channels or file_format[1]
+
+    key = (digest, sample_rate, channels)
+    with _lock:
+        samples = _arrays.get(key)
+        if samples is not None:
+            _arrays.move_to_end(key)
+    if samples is not None:
+        return samples, sample_rate
+
+    entry = None
+    if cache_dir is not False:
+        cache_dir = cache_dir or default_cache_dir()
+        entry = _entry_path(cache_dir, *key)
+        if os.path.exists(entry):
+            try:
+                samples = np.load(entry, mmap_mode='r')
+                os.utime(entry)
+            except (OSError, ValueError):
+                # Truncated or corrupt entry; decode again
+                samples = None
+
+    if samples is None:
+        samples, _ = decode_audio(path, sample_rate, channels)
+        samples = np.ascontiguousarray(samples, dtype=np.float32)
+        if entry is not None:
+            samples = _store(entry, samples)
+        else:
+            samples.flags.writeable = False
+
+    with _lock:
+        _arrays[key] = samples
+        while len(_arrays) > MAX_MEMORY_ENTRIES:
+            _arrays.popitem(last=False)
+    return samples, sample_rate
+
+def _store(entry, samples):
+    """Write `samples` to `entry` atomically and return it memory-mapped."""
+    cache_dir = os.path.dirname(entry)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, samples)
+        os.replace(temp_path, entry)
+    except OSError as e:
+        # A full or read-only cache must not fail the stage
+        print(f"Warning: could not cache decoded audio: {str(e)}")
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        samples.flags.writeable = False
+        return samples
+    prune_cache(cache_dir, int(os.environ.get('AUDIO_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES)))
+    return np.load(entry, mmap_mode='r')
+
+def prune_cache(cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+    """Delete the least recently used entries until the cache fits in `max_bytes`.
+
+    Returns:
+        int: Number of entries removed.
+    """
+    cache_dir = cache_dir or default_cache_dir()
+    if not os.path.isdir(cache_dir):
+        return 0
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.npy'):
+            stat = os.stat(os.path.join(cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except OSError:
+            continue
+        total -= size
+        removed += 1
+    return removed
+
+def clear_memory_cache():
+    """Forget the arrays and digests cached in this process."""
+    with _lock:
+        _arrays.clear()
+        _digests.clear()
+        _formats.clear()
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect or clean the decoded-audio cache')
+    parser.add_argument('command', choices=['stats', 'prune', 'clear'], help='Show the cache size, prune it to --max-mb, or empty it')
+    parser.add_argument('--cache-dir', help='Cache directory (default: $AUDIO_CACHE_DIR or the system temp dir)')
+    parser.add_argument('--max-mb', type=float, default=DEFAULT_MAX_BYTES / (1 << 20), help='Size to prune the cache to, in MB')
+
+    args = parser.parse_args()
+
+    try:
+        cache_dir = args.cache_dir or default_cache_dir()
+        if args.command == 'prune':
+            print(f"Removed {prune_cache(cache_dir, int(args.max_mb * (1 << 20)))} entries")
+        elif args.command == 'clear':
+            print(f"Removed {prune_cache(cache_dir, 0)} entries")
+        entries = [os.path.join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith('.npy')] if os.path.isdir(cache_dir) else []
+        total = sum(os.path.getsize(entry) for entry in entries)
+        print(f"{cache_dir}: {len(entries)} entries, {total / (1 << 20):.1f} MB")
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Convert a playlist with the workflow's stages overlapped across songs.
+
+Each stage (separate, convert, merge) has its own worker pool and a bounded
+queue in front of it. Song N+1 is separated while song N is converted and
+song N-1 is merged, so a batch takes about as long as its slowest stage
+rather than the sum of all of them. When a queue is full, the stage feeding
+it waits, which caps the number of songs held between stages.
+
+Every song is processed by the same stage graph as `full_conversion_workflow`
+(see scripts/pipeline.py), in its own output directory. Each worker runs its
+stage of that graph with the outputs of the earlier stages handed along, and
+every finished stage is recorded in the song's pipeline state, so re-running a
+batch skips the work that is already done.
+"""
+
+import os
+import sys
+import queue
+import argparse
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.full_conversion_workflow import build_pipeline, track_paths_from
+
+# Songs waiting in front of each stage
+DEFAULT_QUEUE_SIZE = 2
+
+def _run_stage(job, stage, upstream):
+    """Run one stage of a song's workflow graph in a worker.
+
+    `upstream` has the outputs of the song's earlier stages, so they are not
+    checked or run again here. Returns the pipeline outputs so far.
+    """
+    print(f"\n===== {os.path.basename(job['input_song'])}: {stage.upper()} =====\n", flush=True)
+    pipeline = build_pipeline(job['input_song'], job['voice_sample'], job['model_path'], job['config_path'],
+                              job['output_dir'], job['so_vits_svc_dir'], job['vocal_volume'],
+                              job['instrumental_volume'])
+    # The last stage also runs the stages nothing depends on (the voice sample copy)
+    return pipeline.run(targets=[stage] if stage != 'merge' else None, outputs=upstream)
+
+def song_output_dirs(input_songs, output_dir):
+    """Return one output directory per song, named after the song and unique within the batch."""
+    output_dirs = []
+    used = set()
+    for song in input_songs:
+        name = os.path.splitext(os.path.basename(song))[0]
+        candidate, index = name, 2
+        while candidate in used:
+            candidate = f"{name}_{index}"
+            index += 1
+        used.add(candidate)
+        output_dirs.append(os.path.join(output_dir, candidate))
+    return output_dirs
+
+def batch_conversion_workflow(input_songs, voice_sample, model_path, config_path, output_dir, so_vits_svc_dir,
+                              vocal_volume=-2, instrumental_volume=-1, separate_workers=1, convert_workers=1,
+                              merge_workers=2, queue_size=DEFAULT_QUEUE_SIZE):
+    """Run the conversion workflow for several songs with the stages pipelined across songs.
+
+    Separation runs in spawned processes: it patches tqdm to report progress
+    and keeps the Demucs model loaded, so it cannot share a process with
+    another song. Conversion (which waits on a so-vits-svc subprocess) and
+    merging run in threads.
+
+    Args:
+        input_songs (list): Paths to the input song files.
+        voice_sample (str): Path to the voice sample file (if None, skip conversion).
+        model_path (str): Path to the trained model (if None, skip conversion).
+        config_path (str): Path to the model configuration file.
+        output_dir (str): Directory where each song's output directory is created.
+        so_vits_svc_dir (str): Path to the so-vits-svc directory.
+        vocal_volume (float): Volume adjustment for the vocals in dB.
+        instrumental_volume (float): Volume adjustment for the instrumental in dB.
+        separate_workers (int): Songs separated at the same time.
+        convert_workers (int): Songs converted at the same time.
+        merge_workers (int): Songs merged at the same time.
+        queue_size (int): Songs that may wait in front of each stage.
+
+    Returns:
+        list: One dict per song, in input order, with 'input_song', 'output_dir'
+        and either 'track_paths' or 'error'.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    # Workers run in other processes and threads, so pass absolute paths
+    jobs = [{
+        'input_song': os.path.abspath(song),
+        'voice_sample': os.path.abspath(voice_sample) if voice_sample else None,
+        'model_path': os.path.abspath(model_path) if model_path else None,
+        'config_path': os.path.abspath(config_path),
+        'output_dir': os.path.abspath(song_dir),
+        'so_vits_svc_dir': os.path.abspath(so_vits_svc_dir),
+        'vocal_volume': vocal_volume,
+        'instrumental_volume': instrumental_volume,
+    } for song, song_dir in zip(input_songs, song_output_dirs(input_songs, output_dir))]
+
+    spawn = multiprocessing.get_context('spawn')
+    stages = [('separate', ProcessPoolExecutor(max_workers=separate_workers, mp_context=spawn), separate_workers)]
+    if model_path and voice_sample:
+        stages.append(('convert', ThreadPoolExecutor(max_workers=convert_workers), convert_workers))
+    stages.append(('merge', ThreadPoolExecutor(max_workers=merge_workers), merge_workers))
+
+    results = [{'input_song': song, 'output_dir': job['output_dir']} for song, job in zip(input_songs, jobs)]
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages] + [None]
+
+    def stage_worker(index):
+        name, executor, _ = stages[index]
+        while True:
+            entry = queues[index].get()
+            if entry is None:
+                # Pass the end marker on to the next worker of this stage
+                queues[index].put(None)
+                return
+            item, upstream = entry
+            try:
+                outputs = executor.submit(_run_stage, jobs[item], name, upstream).result()
+            except Exception as e:
+                print(f"Error during {name} of {results[item]['input_song']}: {str(e)}")
+                results[item]['error'] = f"{name}: {str(e)}"
+                continue
+            if queues[index + 1] is not None:
+                queues[index + 1].put((item, outputs))
+            else:
+                results[item]['track_paths'] = track_paths_from(outputs)
+
+    threads = []
+    try:
+        for index, (_, _, workers) in enumerate(stages):
+            stage_threads = [threading.Thread(target=stage_worker, args=(index,), daemon=True) for _ in range(workers)]
+            for thread in stage_threads:
+                thread.start()
+            threads.append(stage_threads)
+
+        # Blocks while the separation queue is full
+        for item in range(len(jobs)):
+            queues[0].put((item, {}))
+        queues[0].put(None)
+
+        # Close each stage once every worker of the stage before it has finished
+        for index, stage_threads in enumerate(threads):
+            for thread in stage_threads:
+                thread.join()
+            if queues[index + 1] is not None:
+                queues[index + 1].put(None)
+    finally:
+        for _, executor, _ in stages:
+            executor.shutdown()
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the voice conversion workflow for several songs, overlapping their stages')
+    parser.add_argument('input_songs', nargs='+', help='Paths to the input song files')
+    parser.add_argument('--voice-sample', help='Path to the voice sample file')
+    parser.add_argument('-m', '--model-path', help='Path to the trained model')
+    parser.add_argument('-c', '--config-path', default='configs/config.json', help='Path to the model configuration file')
+    parser.add_argument('-o', '--output-dir', default='output', help='Directory where each song gets its own output directory')
+    parser.add_argument('-d', '--so-vits-svc-dir', default='so-vits-svc', help='Path to the so-vits-svc directory')
+    parser.add_argument('--vocal-volume', type=float, default=-2, help='Volume adjustment for the vocals in dB')
+    parser.add_argument('--instrumental-volume', type=float, default=-1, help='Volume adjustment for the instrumental in dB')
+    parser.add_argument('--separate-workers', type=int, default=1, help='Songs separated at the same time')
+    parser.add_argument('--convert-workers', type=int, default=1, help='Songs converted at the same time')
+    parser.add_argument('--merge-workers', type=int, default=2, help='Songs merged at the same time')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help='Songs that may wait in front of each stage')
+
+    args = parser.parse_args()
+
+    try:
+        results = batch_conversion_workflow(
+            args.input_songs,
+            args.voice_sample,
+            args.model_path,
+            args.config_path,
+            args.output_dir,
+            args.so_vits_svc_dir,
+            vocal_volume=args.vocal_volume,
+            instrumental_volume=args.instrumental_volume,
+            separate_workers=args.separate_workers,
+            convert_workers=args.convert_workers,
+            merge_workers=args.merge_workers,
+            queue_size=args.queue_size
+        )
+
+        print("\n===== BATCH COMPLETE =====\n")
+        failed = 0
+        for result in results:
+            if 'error' in result:
+                failed += 1
+                print(f"- {result['input_song']}: failed ({result['error']})")
+            else:
+                print(f"- {result['input_song']}: {result['track_paths']['final_song']}")
+                # Print the output file paths to stdout for the TypeScript code to capture
+                print(f'OUTPUT_FILE="{result["track_paths"]["final_song"].replace(os.sep, "/")}"')
+        return 1 if failed else 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import argparse
+import subprocess
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Entry points whose `--help` must not load any heavy module
+ENTRY_POINTS = [
+    'Conversor.py',
+    'scripts/full_conversion_workflow.py',
+    'scripts/batch_workflow.py',
+    'scripts/separate_vocals.py',
+    'scripts/merge_audio.py',
+    'scripts/preview.py',
+    'scripts/rpc_worker.py',
+]
+
+# Packages that only the stage using them may import
+HEAVY_MODULES = ['torch', 'torchaudio', 'demucs', 'tqdm', 'pydub', 'scipy']
+
+def import_profile(script, runs=5):
+    """Run `script --help` with -X importtime and return its timings and modules.
+
+    Returns:
+        dict: 'seconds' (best wall time over `runs`), 'import_seconds' (total
+        cumulative import time of the top-level imports), 'heavy' (heavy
+        packages that were imported) and 'slowest' ((seconds, module) of the
+        five slowest top-level imports).
+    """
+    best = None
+    for _ in range(runs):
+        start_time = time.perf_counter()
+        result = subprocess.run([sys.executable, '-X', 'importtime', script, '--help'], cwd=ROOT_DIR,
+                                capture_output=True, text=True)
+        seconds = time.perf_counter() - start_time
+        if result.returncode != 0:
+            raise RuntimeError(f"{script} --help failed: {result.stderr.strip().splitlines()[-1]}")
+        if best is None or seconds < best[0]:
+            best = (seconds, result.stderr)
+
+    seconds, log = best
+    imported = set()
+    top_level = []
+    for line in log.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        # import time: self [us] | cumulative | imported package (indented by nesting depth)
+        _, cumulative, name = line[len('import time:'):].split('|')
+        module = name.strip()
+        imported.add(module.split('.')[0])
+        if not name[1:].startswith(' '):
+            top_level.append((int(cumulative) / 1e6, module))
+
+    return {
+        'seconds': seconds,
+        'import_seconds': sum(cumulative for cumulative, _ in top_level),
+        'heavy': sorted(imported.intersection(HEAVY_MODULES)),
+        'slowest': sorted(top_level, reverse=True)[:5],
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the startup time of the entry points and check they load no heavy module')
+    parser.add_argument('scripts', nargs='*', default=ENTRY_POINTS, help='Entry points to benchmark, relative to the repository root')
+    parser.add_argument('--runs', type=int, default=5, help='Runs per entry point; the fastest is reported')
+    parser.add_argument('--max-seconds', type=float, help='Fail if any `--help` takes longer than this')
+    parser.add_argument('--verbose', action='store_true', help='Show the slowest imports of each entry point')
+
+    args = parser.parse_args()
+
+    try:
+        failures = []
+        print("seconds  imports  heavy modules  entry point")
+        for script in args.scripts:
+            profile = import_profile(script, args.runs)
+            heavy = ', '.join(profile['heavy']) or '-'
+            print(f"{profile['seconds']:>7.3f}  {profile['import_seconds']:>7.3f}  {heavy:>13}  {script}")
+            if args.verbose:
+                for seconds, module in profile['slowest']:
+                    print(f"         {seconds:>7.3f}  {module}")
+            if profile['heavy']:
+                failures.append(f"{script} imports {heavy} at startup")
+            if args.max_seconds and profile['seconds'] > args.max_seconds:
+                failures.append(f"{script} --help took {profile['seconds']:.3f} s (limit {args.max_seconds:g} s)")
+
+        for failure in failures:
+            print(f"FAIL: {failure}")
+        return 1 if failures else 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import time
+import wave
+import argparse
+import tempfile
+
+import numpy as np
+
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.merge_audio import merge_audio
+from scripts.mixer import BLOCK_FRAMES, decode_audio
+
+SAMPLE_RATE = 44100
+CHANNELS = 2
+
+def write_test_track(path, minutes, frequency, seed):
+    """Write a synthetic 16-bit stereo WAV (a tone plus noise) without holding it in memory."""
+    rng = np.random.default_rng(seed)
+    total_frames = int(minutes * 60 * SAMPLE_RATE)
+    with wave.open(path, 'wb') as wav:
+        wav.setnchannels(CHANNELS)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        for start in range(0, total_frames, BLOCK_FRAMES):
+            frames = np.arange(start, min(start + BLOCK_FRAMES, total_frames))
+            tone = 0.4 * np.sin(2 * np.pi * frequency * frames / SAMPLE_RATE)
+            block = tone[:, None] + 0.05 * rng.standard_normal((len(frames), CHANNELS))
+            wav.writeframes((block * 32767).astype('<i2').tobytes())
+    return path
+
+def benchmark_merge(minutes_list, engines, work_dir):
+    """Time `merge_audio` for each engine on synthetic tracks of each length.
+
+    Returns:
+        list: One dict per (minutes, engine) with 'seconds' and, for engines
+        other than the first, 'max_difference' from the first engine's output.
+    """
+    results = []
+    for minutes in minutes_list:
+        vocal_file = write_test_track(os.path.join(work_dir, f'vocals_{minutes}.wav'), minutes, 440.0, 1)
+        instrumental_file = write_test_track(os.path.join(work_dir, f'instrumental_{minutes}.wav'), minutes, 110.0, 2)
+        reference = None
+        for engine in engines:
+            output_file = os.path.join(work_dir, f'merged_{minutes}_{engine}.wav')
+            start_time = time.perf_counter()
+            merge_audio(vocal_file, instrumental_file, output_file, engine=engine, dither=False)
+            seconds = time.perf_counter() - start_time
+            result = {'minutes': minutes, 'engine': engine, 'seconds': seconds}
+
+            # Outputs should agree to within rounding of the 16-bit samples
+            output, _ = decode_audio(output_file)
+            if reference is None:
+                reference = output
+            else:
+                length = min(len(reference), len(output))
+                result['max_difference'] = float(np.abs(reference[:length] - output[:length]).max() * 32768)
+            del output
+            os.remove(output_file)
+            results.append(result)
+        reference = None
+        os.remove(vocal_file)
+        os.remove(instrumental_file)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the numpy merge engine against the pydub overlay')
+    parser.add_argument('--minutes', type=float, nargs='+', default=[3, 10, 60], help='Track lengths to benchmark, in minutes')
+    parser.add_argument('--engines', nargs='+', choices=['numpy', 'pydub'], default=['numpy', 'pydub'], help='Engines to benchmark')
+    parser.add_argument('--work-dir', help='Directory for the temporary tracks (default: system temp directory)')
+
+    args = parser.parse_args()
+
+    try:
+        with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+            results = benchmark_merge(args.minutes, args.engines, work_dir)
+
+        print("\nminutes  engine  seconds  speedup  max diff (LSB)")
+        baselines = {}
+        for result in results:
+            if result['engine'] == 'pydub':
+                baselines[result['minutes']] = result['seconds']
+        for result in results:
+            baseline = baselines.get(result['minutes'])
+            speedup = f"{baseline / result['seconds']:.1f}x" if baseline else '-'
+            difference = f"{result['max_difference']:.0f}" if 'max_difference' in result else '-'
+            print(f"{result['minutes']:>7g}  {result['engine']:>6}  {result['seconds']:>7.2f}  {speedup:>7}  {difference:>14}")
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,7 +6,11 @@ import sys
 import argparse
 import subprocess
 
-def convert_voice(vocal_file, model_path, config_path, output_file, so_vits_svc_dir):
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.events import EVENT_MODES, open_stdout_events
+
+def convert_voice(vocal_file, model_path, config_path, output_file, so_vits_svc_dir, events=None):
     """Convert vocals using a trained so-vits-svc model.
     
     Args:
@@ -15,6 +19,7 @@ def convert_voice(vocal_file, model_path, config_path, output_file, so_vits_svc_
         config_path (str): Path to the model configuration file.
         output_file (str): Path where the converted vocals will be saved.
         so_vits_svc_dir (str): Path to the so-vits-svc directory.
+        events (EventWriter): Receives 'progress' events (see scripts/events.py).
     
     Returns:
         str: Path to the converted vocal file.
@@ -40,31 +45,34 @@ def convert_voice(vocal_file, model_path, config_path, output_file, so_vits_svc_
         print(f"Directory contents of parent folder: {os.listdir(os.path.dirname(config_path) if os.path.dirname(config_path) else '.')}")
         raise FileNotFoundError(f"Config file not found at {config_path}")
     
-    # Change to so-vits-svc directory
-    original_dir = os.getcwd()
-    os.chdir(so_vits_svc_dir)
+    # inference_main.py runs inside the so-vits-svc directory, so hand it absolute paths.
+    # The process-wide working directory is left alone, so conversions can run in
+    # threads next to other stages.
+    vocal_file = os.path.abspath(vocal_file)
+    model_path = os.path.abspath(model_path)
+    config_path = os.path.abspath(config_path)
+    output_file = os.path.abspath(output_file)
     
-    try:
-        # Run inference
-        print(f"Converting vocals using model {model_path}...")
-        subprocess.run([
-            'python', 'inference_main.py',
-            '-m', model_path,
-            '-c', config_path,
-            '-n', vocal_file,
-            '-o', output_file
-        ], check=True)
-        
-        # Verify that the output file exists
-        if not os.path.exists(output_file):
-            raise FileNotFoundError(f"Converted vocals not found at expected location: {output_file}")
-        
-        print(f"Vocals converted successfully and saved to: {output_file}")
-        return output_file
+    # Run inference
+    print(f"Converting vocals using model {model_path}...")
+    if events:
+        events.emit('progress', stage='convert', percent=0, message='Converting vocals')
+    subprocess.run([
+        'python', 'inference_main.py',
+        '-m', model_path,
+        '-c', config_path,
+        '-n', vocal_file,
+        '-o', output_file
+    ], check=True, cwd=so_vits_svc_dir)
+    
+    # Verify that the output file exists
+    if not os.path.exists(output_file):
+        raise FileNotFoundError(f"Converted vocals not found at expected location: {output_file}")
     
-    finally:
-        # Change back to the original directory
-        os.chdir(original_dir)
+    print(f"Vocals converted successfully and saved to: {output_file}")
+    if events:
+        events.emit('progress', stage='convert', percent=100, message='Conversion complete')
+    return output_file
 
 def main():
     parser = argparse.ArgumentParser(description='Convert vocals using a trained so-vits-svc model')
@@ -73,15 +81,23 @@ def main():
     parser.add_argument('-c', '--config-path', default='/content/so-vits-svc/configs/config.json', help='Path to the model configuration file')
     parser.add_argument('-o', '--output-file', default='converted_vocals.wav', help='Path where the converted vocals will be saved')
     parser.add_argument('-d', '--so-vits-svc-dir', default='/content/so-vits-svc', help='Path to the so-vits-svc directory')
+    parser.add_argument('--events', choices=EVENT_MODES, default='text', help='jsonl: write only JSON-lines events (progress, result, error) to stdout and the log to stderr')
     
     args = parser.parse_args()
     
+    events = open_stdout_events(args.events)
     try:
-        output_file = convert_voice(args.vocal_file, args.model_path, args.config_path, args.output_file, args.so_vits_svc_dir)
+        output_file = convert_voice(args.vocal_file, args.model_path, args.config_path, args.output_file, args.so_vits_svc_dir,
+                                    events=events)
+        if events:
+            events.emit('result', output_file=output_file)
         # Print the output file path to stdout for the TypeScript code to capture
-        print(f"OUTPUT_FILE:{output_file}")
+        # Use double quotes, like the other scripts
+        print(f'OUTPUT_FILE="{output_file.replace(os.sep, "/")}"')
         return 0
     except Exception as e:
+        if events:
+            events.emit('error', error=str(e))
         print(f"Error: {str(e)}", file=sys.stderr)
         return 1
 
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Machine-readable JSON-lines events.
+
+Each event is one JSON object per line with at least an `event` name and a
+`time` (seconds since the epoch), so schedulers can follow long-running jobs
+incrementally and notice when they stall.
+
+With `--events jsonl`, separate_vocals.py, convert_voice.py, merge_audio.py,
+train_model.py and full_conversion_workflow.py write only events to stdout.
+Their log output goes to stderr. The events they share are:
+    progress  stage, percent (0-100), message
+    stage     stage, status ('started', then 'run', 'skipped', 'fallback' or 'failed')
+    preview   path (full_conversion_workflow.py --preview; sent before the full render)
+    result    the script's outputs, e.g. vocals/instrumental, output_file or model_path
+    error     error (the message); the script then exits with status 1
+Training adds its own events (step, epoch, checkpoint, ...; see train_model.py).
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+
+class EventWriter:
+    """Write JSON-lines events to a text stream, one flushed line per event."""
+
+    def __init__(self, stream, close_stream=False):
+        self.stream = stream
+        self.close_stream = close_stream
+        self._lock = threading.Lock()
+
+    def format(self, record):
+        """Return the line written for `record`."""
+        return json.dumps(record, default=str)
+
+    def emit(self, event, **fields):
+        record = {'event': event, 'time': round(time.time(), 3)}
+        record.update(fields)
+        line = self.format(record)
+        with self._lock:
+            self.stream.write(line + '\n')
+            self.stream.flush()
+        return record
+
+    def close(self):
+        if self.close_stream:
+            self.stream.close()
+
+def open_event_writer(target):
+    """Return an EventWriter for `target`.
+
+    Args:
+        target: A file path (appended to), an EventWriter (returned unchanged)
+            or None (returns None). '-' is rejected: events on stdout would be
+            interleaved with the log, so scripts offer `--events jsonl` instead.
+    """
+    if target is None or isinstance(target, EventWriter):
+        return target
+    if target == '-':
+        raise ValueError("Events cannot share stdout with the log; use --events jsonl or write them to a file")
+    return EventWriter(open(target, 'a', encoding='utf-8', buffering=1), close_stream=True)
+
+# Values of the scripts' --events option
+EVENT_MODES = ['text', 'jsonl']
+
+def reserve_stdout():
+    """Keep stdout for machine-readable output and send everything else to stderr.
+
+    File descriptor 1, and with it `print` and any child process, is pointed at
+    stderr, so log output cannot end up between the machine-readable lines.
+
+    Returns:
+        file: Text stream writing to the original stdout.
+    """
+    sys.stdout.flush()
+    stream = os.fdopen(os.dup(1), 'w', encoding='utf-8', buffering=1)
+    os.dup2(2, 1)
+    sys.stdout = os.fdopen(1, 'w', encoding='utf-8', buffering=1, closefd=False)
+    return stream
+
+def open_stdout_events(mode):
+    """Return the EventWriter for a script's `--events` option.
+
+    Args:
+        mode (str): 'jsonl' to write events to stdout (see `reserve_stdout`),
+            or 'text' for the plain log output (returns None).
+    """
+    if mode != 'jsonl':
+        return None
+    return EventWriter(reserve_stdout())
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Packed feature shards for so-vits-svc training.
+
+After preprocess_hubert_f0.py every clip of a speaker has its own .wav,
+.soft.pt, .f0.npy, .spec.pt (and .vol.npy) file, and the training data loader
+opens all of them every epoch. `pack_speaker_features` writes them into one
+file per speaker with a JSON offset index, and `install_feature_shards` makes
+so-vits-svc's data_utils read those files from the memory-mapped shard instead.
+"""
+
+import os
+import sys
+import json
+import argparse
+
+import numpy as np
+
+SHARD_NAME = 'features.shard'
+INDEX_SUFFIX = '.json'
+SHARD_VERSION = 1
+
+# Per-clip files written by so-vits-svc preprocessing, in addition to the .wav itself
+FEATURE_SUFFIXES = ('.soft.pt', '.f0.npy', '.spec.pt', '.vol.npy')
+
+# Keep every array aligned so views into the memory map are aligned too
+ALIGNMENT = 64
+
+def _load_feature(path):
+    """Load a preprocessed file as (array, kind, extra), or None if it cannot be packed."""
+    if path.endswith('.wav'):
+        from scipy.io import wavfile
+        sample_rate, data = wavfile.read(path)
+        return np.ascontiguousarray(data), 'wav', {'sample_rate': int(sample_rate)}
+    if path.endswith('.pt'):
+        import torch
+        value = torch.load(path, map_location='cpu')
+        if not isinstance(value, torch.Tensor):
+            return None
+        return np.ascontiguousarray(value.numpy()), 'torch', {}
+    if path.endswith('.npy'):
+        value = np.load(path, allow_pickle=True)
+        if value.dtype == object:
+            # f0 files hold an (f0, uv) pair of equal-length arrays
+            try:
+                value = np.stack([np.asarray(part, dtype=np.float64) for part in value])
+            except ValueError:
+                return None
+        return np.ascontiguousarray(value), 'numpy', {}
+    return None
+
+def _clip_files(speaker_dir):
+    files = []
+    for name in sorted(os.listdir(speaker_dir)):
+        if name.endswith('.wav') or name.endswith(FEATURE_SUFFIXES):
+            files.append(name)
+    return files
+
+def pack_speaker_features(speaker_dir, shard_path=None):
+    """Pack every preprocessed clip of one speaker into a single shard.
+
+    Args:
+        speaker_dir (str): Directory with the speaker's preprocessed clips
+            (so-vits-svc/dataset/44k/<speaker>).
+        shard_path (str): Where to write the shard (default: <speaker_dir>/features.shard).
+            The index is written next to it with a .json suffix.
+
+    Returns:
+        str: Path to the shard.
+    """
+    shard_path = shard_path or os.path.join(speaker_dir, SHARD_NAME)
+    root = os.path.dirname(os.path.abspath(shard_path))
+    entries = {}
+    skipped = 0
+
+    tmp_path = f"{shard_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        for name in _clip_files(speaker_dir):
+            path = os.path.join(speaker_dir, name)
+            loaded = _load_feature(path)
+            if loaded is None:
+                skipped += 1
+                continue
+            array, kind, extra = loaded
+            padding = -f.tell() % ALIGNMENT
+            if padding:
+                f.write(b'\0' * padding)
+            entry = {
+                'offset': f.tell(),
+                'dtype': array.dtype.str,
+                'shape': list(array.shape),
+                'kind': kind,
+            }
+            entry.update(extra)
+            f.write(array.tobytes())
+            entries[os.path.relpath(os.path.abspath(path), root).replace(os.sep, '/')] = entry
+    os.replace(tmp_path, shard_path)
+
+    # The index is written last, so a shard without an index is never used
+    index_path = shard_path + INDEX_SUFFIX
+    with open(index_path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump({'version': SHARD_VERSION, 'entries': entries}, f)
+    os.replace(index_path + '.tmp', index_path)
+
+    print(f"Packed {len(entries)} files from {speaker_dir} into {shard_path} ({os.path.getsize(shard_path) / 2**20:.1f} MB)")
+    if skipped:
+        print(f"Warning: {skipped} files could not be packed and will be read from disk")
+    return shard_path
+
+def pack_dataset(dataset_dir):
+    """Pack every speaker directory under `dataset_dir` (so-vits-svc/dataset/44k).
+
+    Returns:
+        list: Paths to the shards that were written.
+    """
+    shards = []
+    for name in sorted(os.listdir(dataset_dir)):
+        speaker_dir = os.path.join(dataset_dir, name)
+        if os.path.isdir(speaker_dir):
+            shards.append(pack_speaker_features(speaker_dir))
+    return shards
+
+def find_shards(dataset_dir):
+    """Return the packed shards (with an index) of every speaker under `dataset_dir`."""
+    shards = []
+    for name in sorted(os.listdir(dataset_dir)):
+        shard_path = os.path.join(dataset_dir, name, SHARD_NAME)
+        if os.path.exists(shard_path + INDEX_SUFFIX):
+            shards.append(shard_path)
+    return shards
+
+class FeatureShard:
+    """Read-only view of a packed shard, memory-mapped on first access."""
+
+    def __init__(self, shard_path):
+        self.shard_path = shard_path
+        self.root = os.path.dirname(os.path.abspath(shard_path))
+        with open(shard_path + INDEX_SUFFIX, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('version') != SHARD_VERSION:
+            raise ValueError(f"Unsupported feature shard version in {shard_path}")
+        self.entries = index['entries']
+        self._data = None
+
+    def entry(self, path):
+        """Return the index entry for an original file path, or None."""
+        relative_path = os.path.relpath(os.path.abspath(path), self.root).replace(os.sep, '/')
+        return self.entries.get(relative_path)
+
+    def read(self, entry):
+        """Return a copy of the packed array described by `entry`."""
+        if self._data is None:
+            self._data = np.memmap(self.shard_path, dtype=np.uint8, mode='r')
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        start = entry['offset']
+        view = self._data[start:start + count * dtype.itemsize].view(dtype).reshape(entry['shape'])
+        # Copy so callers get an ordinary writable array, like the original loaders return
+        return np.array(view)
+
+class _ShardedModule:
+    """Stand-in for a module whose `load` is served from the shards when possible."""
+
+    def __init__(self, module, load):
+        self._module = module
+        self.load = load
+
+    def __getattr__(self, name):
+        return getattr(self._module, name)
+
+def install_feature_shards(shard_paths, data_utils_module=None):
+    """Make so-vits-svc's data_utils read packed files from the shards.
+
+    data_utils loads clips through `load_wav_to_torch`, `torch.load` and
+    `np.load`; those names are replaced inside data_utils only, and fall back
+    to the originals for anything that is not in a shard.
+    """
+    if data_utils_module is None:
+        import data_utils as data_utils_module
+    if isinstance(data_utils_module.np, _ShardedModule):
+        return
+
+    import torch
+    shards = [FeatureShard(path) for path in shard_paths]
+
+    def lookup(path):
+        if not isinstance(path, (str, os.PathLike)):
+            return None, None
+        for shard in shards:
+            entry = shard.entry(path)
+            if entry is not None:
+                return shard, entry
+        return None, None
+
+    original_torch_load = torch.load
+    original_np_load = np.load
+    original_load_wav = getattr(data_utils_module, 'load_wav_to_torch', None)
+
+    def torch_load(path, *args, **kwargs):
+        shard, entry = lookup(path)
+        if entry is None or entry['kind'] != 'torch':
+            return original_torch_load(path, *args, **kwargs)
+        return torch.from_numpy(shard.read(entry))
+
+    def np_load(path, *args, **kwargs):
+        shard, entry = lookup(path)
+        if entry is None or entry['kind'] != 'numpy':
+            return original_np_load(path, *args, **kwargs)
+        return shard.read(entry)
+
+    def load_wav_to_torch(path):
+        shard, entry = lookup(path)
+        if entry is None or entry['kind'] != 'wav':
+            return original_load_wav(path)
+        return torch.FloatTensor(shard.read(entry).astype(np.float32)), entry['sample_rate']
+
+    data_utils_module.torch = _ShardedModule(torch, torch_load)
+    data_utils_module.np = _ShardedModule(np, np_load)
+    if original_load_wav is not None:
+        data_utils_module.load_wav_to_torch = load_wav_to_torch
+
+def shard_worker_init_fn(shard_paths, worker_id):
+    """DataLoader `worker_init_fn` (bind `shard_paths` with functools.partial).
+
+    Forked workers inherit the patched data_utils, but spawned ones re-import it.
+    """
+    install_feature_shards(shard_paths)
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack preprocessed so-vits-svc training features into memory-mapped shards')
+    parser.add_argument('dataset_dir', help='Preprocessed dataset directory (so-vits-svc/dataset/44k)')
+
+    args = parser.parse_args()
+
+    try:
+        pack_dataset(args.dataset_dir)
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,7 +4,8 @@
 import os
 import sys
 import argparse
-import shutil
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 # Import our modules
@@ -12,11 +13,202 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from scripts.separate_vocals import separate_vocals
 from scripts.convert_voice import convert_voice
 from scripts.merge_audio import merge_audio
+from scripts.preview import PREVIEW_SECONDS, render_preview
+from scripts.pipeline import Pipeline, Stage
+from scripts.publish import MANIFEST_FILE, publish_file, update_manifest
+from scripts.metrics import REPORT_FILE, measure, update_report
+from scripts.events import EVENT_MODES, open_stdout_events
 
-def full_conversion_workflow(input_song, voice_sample, model_path, config_path, output_dir, so_vits_svc_dir):
+DEMUCS_MODEL = 'htdemucs_ft'
+
+# Cache keys and outputs of the completed stages, kept in the output directory
+PIPELINE_STATE_FILE = 'pipeline_state.json'
+
+def separation_stage(input_song, output_dir, events=None):
+    """Pipeline stage separating `input_song` and publishing the stems to `output_dir` with descriptive names."""
+    def separate(inputs, params):
+        separation_dir = os.path.join(output_dir, "separated")
+        os.makedirs(separation_dir, exist_ok=True)
+        all_tracks = separate_vocals(inputs["song"], separation_dir, params["model"], events=events)
+        if not all_tracks.get("vocals"):
+            raise ValueError("No vocals track found in separated tracks")
+        instrumental_path = all_tracks.get("instrumental", all_tracks.get("accompaniment"))
+        if not instrumental_path:
+            raise ValueError("No instrumental track found in separated tracks")
+        
+        outputs = {}
+        artifacts = {}
+        with measure() as metrics:
+            for track_name, track_path in all_tracks.items():
+                # Get file extension
+                ext = os.path.splitext(track_path)[1]
+                # Create new path with descriptive name
+                new_path = os.path.join(output_dir, f"original_{track_name}{ext}")
+                # The stems are intermediate files, so rename them into place instead of copying
+                method = publish_file(track_path, new_path, move=True)
+                outputs[f"original_{track_name}"] = new_path
+                artifacts[f"original_{track_name}"] = {"path": new_path, "source": track_path, "method": method}
+                print(f"Saved {track_name} to {new_path}")
+        update_report(os.path.join(output_dir, REPORT_FILE), {"publish_stems": dict(metrics, status="run")})
+        # Later stages read the published stems
+        outputs["vocals"] = outputs["original_vocals"]
+        outputs["instrumental"] = outputs["original_instrumental" if "instrumental" in all_tracks else "original_accompaniment"]
+        update_manifest(output_dir, artifacts)
+        return outputs
+    
+    return Stage("separate", separate, inputs={"song": input_song}, params={"model": DEMUCS_MODEL},
+                 title="Separating vocals")
+
+def separate_song(input_song, output_dir):
+    """Run only the separation stage of the workflow for `input_song`.
+    
+    The result is recorded in the pipeline state of `output_dir`, so a later
+    `full_conversion_workflow` with the same song and output directory reuses
+    it instead of separating again. Used to separate while a model trains.
+    
+    Returns:
+        dict: Outputs of the separation stage (track name -> path).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    pipeline = Pipeline(os.path.join(output_dir, PIPELINE_STATE_FILE))
+    pipeline.add(separation_stage(input_song, output_dir))
+    return pipeline.run()["separate"]
+
+def build_pipeline(input_song, voice_sample, model_path, config_path, output_dir, so_vits_svc_dir,
+                   vocal_volume=-2, instrumental_volume=-1, events=None):
+    """Return the workflow's stage graph for one song (see `full_conversion_workflow`).
+    
+    Stages: "separate", "convert" (only with a model and a voice sample),
+    "merge" and "voice_sample" (only with a voice sample). Their resource use
+    is recorded in `<output_dir>/performance_report.json`, and their progress
+    is sent to `events` (an EventWriter), if given.
+    """
+    pipeline = Pipeline(os.path.join(output_dir, PIPELINE_STATE_FILE), os.path.join(output_dir, REPORT_FILE), events)
+    
+    pipeline.add(separation_stage(input_song, output_dir, events))
+    
+    # Convert vocals if model and voice sample are provided
+    convert_stage = None
+    if model_path and voice_sample:
+        def convert(inputs, params):
+            converted_vocals_path = os.path.join(output_dir, "converted_vocals.wav")
+            convert_voice(inputs["vocals"], inputs["model"], inputs["config"], converted_vocals_path, so_vits_svc_dir,
+                          events=events)
+            update_manifest(output_dir, {"converted_vocals": {"path": converted_vocals_path, "method": "written"}})
+            print(f"Saved converted vocals to {converted_vocals_path}")
+            return {"converted_vocals": converted_vocals_path}
+        
+        def use_original_vocals(inputs, params, error):
+            print("Skipping conversion, will use original vocals for merging")
+            return {"converted_vocals": inputs["vocals"]}
+        
+        convert_stage = pipeline.add(Stage(
+            "convert", convert,
+            inputs={"vocals": ("separate", "vocals"), "model": model_path, "config": config_path},
+            params={"so_vits_svc_dir": os.path.abspath(so_vits_svc_dir)},
+            title="Converting vocals", fallback=use_original_vocals))
+    
+    # Merge converted vocals with instrumental, removing any latency the conversion added
+    def merge(inputs, params):
+        merged_audio_path = os.path.join(output_dir, "final_song.wav")
+        reference_vocals = inputs["reference"] if inputs["reference"] != inputs["vocals"] else None
+        merge_audio(inputs["vocals"], inputs["instrumental"], merged_audio_path, params["vocal_volume"],
+                    params["instrumental_volume"], reference_vocal_file=reference_vocals, events=events)
+        update_manifest(output_dir, {"final_song": {"path": merged_audio_path, "method": "written"}})
+        print(f"Saved final song to {merged_audio_path}")
+        return {"final_song": merged_audio_path}
+    
+    pipeline.add(Stage(
+        "merge", merge,
+        inputs={
+            "vocals": ("convert", "converted_vocals") if convert_stage else ("separate", "vocals"),
+            "instrumental": ("separate", "instrumental"),
+            "reference": ("separate", "vocals"),
+        },
+        params={"vocal_volume": vocal_volume, "instrumental_volume": instrumental_volume},
+        title="Merging audio"))
+    
+    # Copy the voice sample to the output directory
+    if voice_sample:
+        def copy_voice_sample(inputs, params):
+            voice_sample_path = os.path.join(output_dir, f"voice_sample{os.path.splitext(inputs['voice_sample'])[1]}")
+            method = publish_file(inputs["voice_sample"], voice_sample_path)
+            update_manifest(output_dir, {"voice_sample": {"path": voice_sample_path, "source": inputs["voice_sample"],
+                                                          "method": method}})
+            print(f"Saved voice sample to {voice_sample_path}")
+            return {"voice_sample": voice_sample_path}
+        
+        def skip_voice_sample(inputs, params, error):
+            return {}
+        
+        pipeline.add(Stage("voice_sample", copy_voice_sample, inputs={"voice_sample": voice_sample},
+                           title="Copying voice sample", fallback=skip_voice_sample))
+    
+    return pipeline
+
+def track_paths_from(outputs):
+    """Map the outputs of a workflow pipeline run to the workflow's named output files."""
+    track_paths = {}
+    for name, path in outputs["separate"].items():
+        if name.startswith("original_"):
+            track_paths[name] = path
+    if "convert" in outputs:
+        track_paths["converted_vocals"] = outputs["convert"]["converted_vocals"]
+    else:
+        track_paths["converted_vocals"] = outputs["separate"]["vocals"]
+    track_paths["final_song"] = outputs["merge"]["final_song"]
+    if outputs.get("voice_sample"):
+        track_paths["voice_sample"] = outputs["voice_sample"]["voice_sample"]
+    return track_paths
+
+def _render_preview_job(input_song, preview_dir, voice_sample, model_path, config_path, so_vits_svc_dir, seconds):
+    """Render the preview in a worker process and measure it there.
+    
+    Returns:
+        tuple: (`render_preview` result or None, error message or None, metrics dict).
+    """
+    result = None
+    error = None
+    with measure() as metrics:
+        try:
+            result = render_preview(input_song, preview_dir, voice_sample, model_path, config_path,
+                                    so_vits_svc_dir, seconds)
+        except Exception as e:
+            error = str(e)
+    return result, error, metrics
+
+def _finish_preview(job, track_paths, report_path, events):
+    """Publish the preview as soon as its worker process is done."""
+    metrics = {}
+    try:
+        preview_result, error, metrics = job.result()
+    except Exception as e:
+        preview_result, error = None, str(e)
+    if preview_result:
+        status = "run"
+        track_paths["preview"] = preview_result["preview"]
+        # Flushed right away so callers can play the preview while the full render runs
+        print(f'PREVIEW_PATH="{preview_result["preview"].replace(os.sep, "/")}"', flush=True)
+        if events:
+            events.emit("preview", path=os.path.abspath(preview_result["preview"]))
+    else:
+        status = "failed"
+        print(f"Error during preview rendering: {error}")
+    update_report(report_path, {"preview": dict(metrics, status=status)})
+    if events:
+        events.emit("stage", stage="preview", status=status)
+
+def full_conversion_workflow(input_song, voice_sample, model_path, config_path, output_dir, so_vits_svc_dir,
+                             preview=False, preview_seconds=PREVIEW_SECONDS, vocal_volume=-2, instrumental_volume=-1,
+                             force=False, events=None):
     """
     Run the full voice conversion workflow and save all intermediate files.
     
+    The workflow is a stage graph (see scripts/pipeline.py) whose state is kept
+    in `output_dir`. Running it again skips every stage whose inputs and
+    settings did not change, so e.g. changing only the vocal volume re-runs
+    only the merge.
+    
     Args:
         input_song (str): Path to the input song file.
         voice_sample (str): Path to the voice sample file (if None, skip conversion).
@@ -24,100 +216,52 @@ def full_conversion_workflow(input_song, voice_sample, model_path, config_path,
         config_path (str): Path to the model configuration file.
         output_dir (str): Directory where all output files will be saved.
         so_vits_svc_dir (str): Path to the so-vits-svc directory.
+        preview (bool): Also render a short excerpt with faster settings, next to the
+            full render, and print its path (PREVIEW_PATH=...) as soon as it is ready.
+        preview_seconds (float): Length of the preview excerpt.
+        vocal_volume (float): Volume adjustment for the vocals in the final mix, in dB.
+        instrumental_volume (float): Volume adjustment for the instrumental in the final mix, in dB.
+        force (bool): Run every stage even if its previous outputs are still valid.
+        events (EventWriter): Receives 'stage' and 'progress' events, and a
+            'preview' event with the preview's path (see scripts/events.py).
         
     Returns:
         dict: Paths to all output files.
     """
     # Create output directory if it doesn't exist
     os.makedirs(output_dir, exist_ok=True)
+    track_paths = {}
+    report_path = os.path.join(output_dir, REPORT_FILE)
     
-    # Step 1: Separate vocals from the song
-    print("\n===== STEP 1: SEPARATING VOCALS =====\n")
-    separation_dir = os.path.join(output_dir, "separated")
-    os.makedirs(separation_dir, exist_ok=True)
-    
-    try:
-        all_tracks = separate_vocals(input_song, separation_dir)
+    with measure() as total:
+        # Step 0: Render a quick preview next to the full render, so there is something to
+        # listen to early. Separation patches tqdm process-wide, so the preview needs its
+        # own process; spawn avoids forking a process that may have imported torch.
+        preview_pool = None
+        if preview:
+            print("\n===== STEP 0: RENDERING PREVIEW IN THE BACKGROUND =====\n")
+            if events:
+                events.emit("stage", stage="preview", status="started")
+            preview_pool = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+            preview_job = preview_pool.submit(_render_preview_job, input_song, os.path.join(output_dir, "preview"),
+                                              voice_sample, model_path, config_path, so_vits_svc_dir, preview_seconds)
+            preview_job.add_done_callback(lambda job: _finish_preview(job, track_paths, report_path, events))
         
-        # Copy all separated tracks to the output directory with descriptive names
-        track_paths = {}
-        for track_name, track_path in all_tracks.items():
-            # Get file extension
-            ext = os.path.splitext(track_path)[1]
-            # Create new path with descriptive name
-            new_path = os.path.join(output_dir, f"original_{track_name}{ext}")
-            # Copy the file
-            shutil.copy(track_path, new_path)
-            # Store the new path
-            track_paths[f"original_{track_name}"] = new_path
-            print(f"Saved {track_name} to {new_path}")
-        
-        # Get the vocals path for conversion
-        vocals_path = all_tracks.get("vocals")
-        if not vocals_path:
-            raise ValueError("No vocals track found in separated tracks")
-    except Exception as e:
-        print(f"Error during vocal separation: {str(e)}")
-        raise
-    
-    # Step 2: Convert vocals if model and voice sample are provided
-    if model_path and voice_sample:
-        print("\n===== STEP 2: CONVERTING VOCALS =====\n")
         try:
-            # Path for converted vocals
-            converted_vocals_path = os.path.join(output_dir, "converted_vocals.wav")
-            
-            # Convert vocals
-            convert_voice(vocals_path, model_path, config_path, converted_vocals_path, so_vits_svc_dir)
+            if not (model_path and voice_sample):
+                print("\nSkipping vocal conversion (no model or voice sample provided)")
             
-            # Store the path
-            track_paths["converted_vocals"] = converted_vocals_path
-            print(f"Saved converted vocals to {converted_vocals_path}")
-        except Exception as e:
-            print(f"Error during vocal conversion: {str(e)}")
-            print("Skipping conversion, will use original vocals for merging")
-            converted_vocals_path = vocals_path
-            track_paths["converted_vocals"] = vocals_path
-    else:
-        print("\nSkipping vocal conversion (no model or voice sample provided)")
-        converted_vocals_path = vocals_path
-        track_paths["converted_vocals"] = vocals_path
+            pipeline = build_pipeline(input_song, voice_sample, model_path, config_path, output_dir, so_vits_svc_dir,
+                                      vocal_volume, instrumental_volume, events)
+            track_paths.update(track_paths_from(pipeline.run(force=force)))
+            track_paths["manifest"] = os.path.join(output_dir, MANIFEST_FILE)
+        finally:
+            if preview_pool:
+                # Wait for the preview, so the summary and the report include it
+                preview_pool.shutdown(wait=True)
     
-    # Step 3: Merge converted vocals with instrumental
-    print("\n===== STEP 3: MERGING AUDIO =====\n")
-    try:
-        # Get the instrumental path
-        instrumental_path = all_tracks.get("instrumental", all_tracks.get("accompaniment"))
-        if not instrumental_path:
-            raise ValueError("No instrumental track found in separated tracks")
-        
-        # Path for merged audio
-        merged_audio_path = os.path.join(output_dir, "final_song.wav")
-        
-        # Merge audio
-        merge_audio(converted_vocals_path, instrumental_path, merged_audio_path)
-        
-        # Store the path
-        track_paths["final_song"] = merged_audio_path
-        print(f"Saved final song to {merged_audio_path}")
-    except Exception as e:
-        print(f"Error during audio merging: {str(e)}")
-        raise
-    
-    # Step 4: Copy the voice sample to the output directory
-    if voice_sample:
-        try:
-            # Get file extension
-            ext = os.path.splitext(voice_sample)[1]
-            # Path for voice sample
-            voice_sample_path = os.path.join(output_dir, f"voice_sample{ext}")
-            # Copy the file
-            shutil.copy(voice_sample, voice_sample_path)
-            # Store the path
-            track_paths["voice_sample"] = voice_sample_path
-            print(f"Saved voice sample to {voice_sample_path}")
-        except Exception as e:
-            print(f"Error copying voice sample: {str(e)}")
+    track_paths["performance_report"] = update_report(report_path, {"workflow": dict(total, status="run")})
+    print(f"Workflow took {total['wall_seconds']:.1f} s ({total['cpu_seconds']:.1f} s CPU)")
     
     # Print summary of all output files
     print("\n===== WORKFLOW COMPLETE =====\n")
@@ -135,9 +279,16 @@ def main():
     parser.add_argument('-c', '--config-path', default='configs/config.json', help='Path to the model configuration file')
     parser.add_argument('-o', '--output-dir', default='output', help='Directory where all output files will be saved')
     parser.add_argument('-d', '--so-vits-svc-dir', default='so-vits-svc', help='Path to the so-vits-svc directory')
+    parser.add_argument('--preview', action='store_true', help='Render a short preview next to the full render and print PREVIEW_PATH as soon as it is ready')
+    parser.add_argument('--preview-seconds', type=float, default=PREVIEW_SECONDS, help='Length of the preview excerpt in seconds')
+    parser.add_argument('--vocal-volume', type=float, default=-2, help='Volume adjustment for the vocals in dB')
+    parser.add_argument('--instrumental-volume', type=float, default=-1, help='Volume adjustment for the instrumental in dB')
+    parser.add_argument('--force', action='store_true', help='Re-run every stage even if its previous outputs are still valid')
+    parser.add_argument('--events', choices=EVENT_MODES, default='text', help='jsonl: write only JSON-lines events (stage, progress, preview, result, error) to stdout and the log to stderr')
     
     args = parser.parse_args()
     
+    events = open_stdout_events(args.events)
     try:
         track_paths = full_conversion_workflow(
             args.input_song,
@@ -145,8 +296,16 @@ def main():
             args.model_path,
             args.config_path,
             args.output_dir,
-            args.so_vits_svc_dir
+            args.so_vits_svc_dir,
+            preview=args.preview,
+            preview_seconds=args.preview_seconds,
+            vocal_volume=args.vocal_volume,
+            instrumental_volume=args.instrumental_volume,
+            force=args.force,
+            events=events
         )
+        if events:
+            events.emit('result', **{name: os.path.abspath(path) for name, path in track_paths.items()})
         
         # Print the output file paths in a format that can be easily parsed
         for name, path in track_paths.items():
@@ -154,6 +313,8 @@ def main():
         
         return 0
     except Exception as e:
+        if events:
+            events.emit('error', error=str(e))
         print(f"Error: {str(e)}", file=sys.stderr)
         return 1
 
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.align import decimation_factor, envelope, estimate_offset_envelopes, shift, MIN_CONFIDENCE
+from scripts.audio_cache import load_audio
+from scripts.mixer import BLOCK_FRAMES, ENCODERS, common_format, db_to_gain, open_writer
+
+def variant_name(vocal_db, instrumental_db):
+    """File name stem of the variant rendered with these gains, e.g. 'mix_v-2_i-1'."""
+    return f"mix_v{vocal_db:g}_i{instrumental_db:g}"
+
+def render_gain_sweep(vocal_file, instrumental_file, gain_pairs, output_dir, output_format='wav',
+                      dither=False, bitrate=None, reference_vocal_file=None, max_workers=None):
+    """Render one mix per (vocal_db, instrumental_db) pair from a single decode.
+
+    Both tracks are decoded once. Every block of every variant is computed in
+    one broadcasted multiply-add over a (variants, frames, channels) array, and
+    the variants are quantized/encoded concurrently in a thread pool (NumPy and
+    the ffmpeg pipes release the GIL). Like `merge_audio`, each mix has the
+    instrumental's length.
+
+    Args:
+        vocal_file (str): Path to the vocal audio file.
+        instrumental_file (str): Path to the instrumental audio file.
+        gain_pairs (list): (vocal_db, instrumental_db) pairs, one per variant.
+        output_dir (str): Directory where the variants will be saved.
+        output_format (str): 'wav', 'mp3', 'flac', 'opus' or 'aac'.
+        dither (bool): Add TPDF dither when quantizing WAV output to 16 bits.
+        bitrate (str): Encoder bitrate for lossy formats, e.g. '256k'.
+        reference_vocal_file (str): Original separated vocals to align the vocals to (see scripts/align.py).
+        max_workers (int): Encoder threads (default: one per variant, up to the CPU count).
+
+    Returns:
+        list: Path of each variant, in the order of `gain_pairs`. Pairs that
+        share a file name (see `variant_name`) are rendered once and share its path.
+    """
+    if not gain_pairs:
+        raise ValueError("No gain pairs to render")
+    if output_format not in ENCODERS:
+        raise ValueError(f"Unsupported output format: {output_format}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    # Decode both tracks once for every variant
+    sample_rate, channels = common_format([vocal_file, instrumental_file])
+    print(f"Loading vocal track from {vocal_file} and instrumental track from {instrumental_file}...")
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        vocal_load = pool.submit(load_audio, vocal_file, sample_rate, channels)
+        instrumental_load = pool.submit(load_audio, instrumental_file, sample_rate, channels)
+        reference_load = pool.submit(load_audio, reference_vocal_file, sample_rate) if reference_vocal_file else None
+        voz, _ = vocal_load.result()
+        musica, _ = instrumental_load.result()
+
+    if reference_load is not None:
+        factor = decimation_factor(sample_rate)
+        reference = envelope(reference_load.result()[0], factor)
+        offset, confidence = estimate_offset_envelopes(reference, envelope(voz, factor), factor, sample_rate / factor)
+        if confidence >= MIN_CONFIDENCE:
+            print(f"Aligning vocals: converted vocals are {offset / sample_rate * 1000:+.1f} ms late")
+            voz = shift(voz, offset)
+
+    # One variant per file name, so no two writers share a file; the first pair with a name is rendered
+    extension = {'opus': 'ogg'}.get(output_format, output_format)
+    requested_files = [os.path.join(output_dir, f"{variant_name(vocal_db, instrumental_db)}.{extension}")
+                       for vocal_db, instrumental_db in gain_pairs]
+    unique = {}
+    for path, pair in zip(requested_files, gain_pairs):
+        unique.setdefault(path, pair)
+    output_files = list(unique)
+    gain_pairs = list(unique.values())
+
+    # Per-variant gains, shaped to broadcast over (variants, frames, channels)
+    vocal_gains = np.array([db_to_gain(vocal_db) for vocal_db, _ in gain_pairs], dtype=np.float32)[:, None, None]
+    instrumental_gains = np.array([db_to_gain(instrumental_db) for _, instrumental_db in gain_pairs], dtype=np.float32)[:, None, None]
+
+    workers = max_workers or min(len(output_files), os.cpu_count() or 1)
+
+    print(f"Rendering {len(gain_pairs)} variants with {workers} encoder threads...")
+    variants = np.empty((len(gain_pairs), BLOCK_FRAMES, channels), dtype=np.float32)
+    scratch = np.empty_like(variants)
+    writers = []
+    try:
+        for path in output_files:
+            writers.append(open_writer(path, sample_rate, channels, output_format, dither, bitrate))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for start in range(0, len(musica), BLOCK_FRAMES):
+                end = min(start + BLOCK_FRAMES, len(musica))
+                block = variants[:, :end - start]
+                np.multiply(instrumental_gains, musica[start:end], out=block)
+                vocals = voz[start:end]
+                if len(vocals):
+                    np.multiply(vocal_gains, vocals, out=scratch[:, :len(vocals)])
+                    block[:, :len(vocals)] += scratch[:, :len(vocals)]
+                # Every variant's block must be written before the buffer is reused
+                for future in [pool.submit(writer.write, block[index]) for index, writer in enumerate(writers)]:
+                    future.result()
+        for writer in writers:
+            writer.close()
+    except BaseException:
+        # Stop the encoders and delete the partial files instead of finalizing truncated variants
+        for writer in writers:
+            writer.abort()
+        raise
+
+    for (vocal_db, instrumental_db), path in zip(gain_pairs, output_files):
+        print(f"- vocals {vocal_db:+g} dB, instrumental {instrumental_db:+g} dB: {path}")
+    return requested_files
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a song at several vocal/instrumental balances from a single decode')
+    parser.add_argument('vocal_file', help='Path to the vocal audio file')
+    parser.add_argument('instrumental_file', help='Path to the instrumental audio file')
+    parser.add_argument('-g', '--gains', nargs=2, type=float, action='append', required=True, metavar=('VOCAL_DB', 'INSTRUMENTAL_DB'),
+                        help='Gains of one variant in dB; repeat for each variant')
+    parser.add_argument('-o', '--output-dir', default='gain_sweep', help='Directory where the variants will be saved')
+    parser.add_argument('--format', choices=list(ENCODERS), default='wav', help='Output format')
+    parser.add_argument('--bitrate', help="Encoder bitrate for lossy formats, e.g. '256k'")
+    parser.add_argument('--dither', action='store_true', help='Add TPDF dither when quantizing WAV output to 16 bits')
+    parser.add_argument('--align-to', help='Original separated vocals; remove the latency of the vocal file against them')
+    parser.add_argument('--workers', type=int, help='Encoder threads (default: one per variant, up to the CPU count)')
+
+    args = parser.parse_args()
+
+    try:
+        output_files = render_gain_sweep(args.vocal_file, args.instrumental_file, [tuple(pair) for pair in args.gains],
+                                         args.output_dir, args.format, args.dither, args.bitrate, args.align_to, args.workers)
+        # Print the output file paths to stdout for the TypeScript code to capture
+        for output_file in output_files:
+            print(f'OUTPUT_FILE="{output_file.replace(os.sep, "/")}"')
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Loudness normalization (EBU R128 / ITU-R BS.1770) and a true-peak limiter.
+
+Both work on the float32 mix in memory, before it is quantized or encoded, so
+normalizing a merge needs no second decode/loudnorm/encode pass. Everything is
+vectorized: the K-weighting and oversampling filters run in large chunks, the
+gated loudness comes from per-100 ms energy sums, and the limiter gain is a
+running minimum followed by a moving average.
+"""
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.audio_cache import load_audio
+from scripts.mixer import db_to_gain, write_audio
+
+# Frames filtered per chunk, to keep the float64 filter state small
+CHUNK_FRAMES = 1 << 18
+
+# BS.1770 gating: 400 ms blocks overlapping by 75%
+BLOCK_SECONDS = 0.4
+HOP_SECONDS = 0.1
+ABSOLUTE_GATE_LUFS = -70.0
+RELATIVE_GATE_LU = -10.0
+
+# True peak is measured on the 4x oversampled signal, in segments of this many
+# frames whose sample peak is within the margin of the level of interest
+OVERSAMPLING = 4
+SEGMENT_FRAMES = 4096
+TRUE_PEAK_MARGIN_DB = 6.0
+
+def k_weighting_sos(sample_rate):
+    """BS.1770 K-weighting (high shelf + high pass) as second-order sections for any sample rate."""
+    # Pre-filter: high shelf of ~+4 dB above ~1.7 kHz
+    k = np.tan(np.pi * 1681.974450955533 / sample_rate)
+    q = 0.7071752369554196
+    vh = 10.0 ** (3.999843853973347 / 20.0)
+    vb = vh ** 0.4996667741545416
+    a0 = 1.0 + k / q + k * k
+    shelf = [(vh + vb * k / q + k * k) / a0, 2.0 * (k * k - vh) / a0, (vh - vb * k / q + k * k) / a0,
+             1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0]
+
+    # RLB weighting: second-order high pass at ~38 Hz
+    k = np.tan(np.pi * 38.13547087602444 / sample_rate)
+    q = 0.5003270373238773
+    a0 = 1.0 + k / q + k * k
+    high_pass = [1.0, -2.0, 1.0, 1.0, 2.0 * (k * k - 1.0) / a0, (1.0 - k / q + k * k) / a0]
+    return np.array([shelf, high_pass])
+
+def _channel_weights(channels):
+    # BS.1770 weights: surround channels count 1.41x, the LFE of a 5.1 mix is ignored
+    if channels == 5:
+        return np.array([1.0, 1.0, 1.0, 1.41, 1.41])
+    if channels == 6:
+        return np.array([1.0, 1.0, 1.0, 0.0, 1.41, 1.41])
+    return np.ones(channels)
+
+def integrated_loudness(samples, sample_rate):
+    """Gated integrated loudness of float32 samples (frames, channels), in LUFS.
+
+    Returns -inf for silence or audio shorter than one 400 ms block.
+    """
+    # SciPy is imported where it is used so importing merge_audio stays fast
+    from scipy.signal import sosfilt
+    
+    hop = int(round(HOP_SECONDS * sample_rate))
+    hops_per_block = int(round(BLOCK_SECONDS / HOP_SECONDS))
+    usable = len(samples) - len(samples) % hop
+    chunk = max(hop, CHUNK_FRAMES - CHUNK_FRAMES % hop)
+
+    # K-weighted energy of every 100 ms hop, per channel
+    sos = k_weighting_sos(sample_rate)
+    state = np.zeros((sos.shape[0], 2, samples.shape[1]))
+    hop_energy = []
+    for start in range(0, usable, chunk):
+        weighted, state = sosfilt(sos, samples[start:min(start + chunk, usable)], axis=0, zi=state)
+        weighted *= weighted
+        hop_energy.append(weighted.reshape(-1, hop, samples.shape[1]).sum(axis=1))
+    if sum(len(energy) for energy in hop_energy) < hops_per_block:
+        return float('-inf')
+    hop_energy = np.concatenate(hop_energy)
+
+    # Mean square of each overlapping 400 ms block, weighted over channels
+    cumulative = np.concatenate([np.zeros((1, samples.shape[1])), np.cumsum(hop_energy, axis=0)])
+    block_energy = (cumulative[hops_per_block:] - cumulative[:-hops_per_block]) / (hops_per_block * hop)
+    block_power = block_energy @ _channel_weights(samples.shape[1])
+    with np.errstate(divide='ignore'):
+        block_loudness = -0.691 + 10.0 * np.log10(block_power)
+
+    # Absolute gate, then a relative gate 10 LU below the absolute-gated loudness
+    gated = block_power[block_loudness > ABSOLUTE_GATE_LUFS]
+    if not len(gated):
+        return float('-inf')
+    relative_gate = -0.691 + 10.0 * np.log10(gated.mean()) + RELATIVE_GATE_LU
+    gated = block_power[(block_loudness > ABSOLUTE_GATE_LUFS) & (block_loudness > relative_gate)]
+    return float(-0.691 + 10.0 * np.log10(gated.mean()))
+
+def _frame_peaks(samples):
+    # Channel by channel: much faster than a max over the short last axis
+    peaks = np.abs(samples[:, 0])
+    for channel in range(1, samples.shape[1]):
+        np.maximum(peaks, np.abs(samples[:, channel]), out=peaks)
+    return peaks
+
+def oversampled_peaks(samples, floor=0.0):
+    """Per-frame peak of |x| over all channels of the 4x oversampled signal.
+
+    Inter-sample peaks are at most a few dB above the sample peaks, so only
+    segments whose sample peak exceeds `floor` are oversampled (in batches);
+    elsewhere the sample peak is returned.
+    """
+    from scipy.signal import resample_poly
+    
+    peaks = _frame_peaks(samples)
+    segments = -(-len(peaks) // SEGMENT_FRAMES)
+    segment_peaks = np.zeros(segments * SEGMENT_FRAMES, dtype=peaks.dtype)
+    segment_peaks[:len(peaks)] = peaks
+    selected = np.flatnonzero(segment_peaks.reshape(segments, SEGMENT_FRAMES).max(axis=1) > floor)
+
+    margin = 32
+    window = SEGMENT_FRAMES + 2 * margin
+    for batch in np.array_split(selected, -(-len(selected) // 64)) if len(selected) else []:
+        windows = np.zeros((len(batch), window, samples.shape[1]), dtype=np.float32)
+        for index, segment in enumerate(batch):
+            start = segment * SEGMENT_FRAMES - margin
+            low, high = max(0, start), min(len(samples), start + window)
+            windows[index, low - start:high - start] = samples[low:high]
+        upsampled = resample_poly(windows, OVERSAMPLING, 1, axis=1)
+        upsampled = upsampled[:, margin * OVERSAMPLING:(margin + SEGMENT_FRAMES) * OVERSAMPLING]
+        upsampled_peaks = np.abs(upsampled).reshape(len(batch), SEGMENT_FRAMES, -1).max(axis=2)
+        for segment, values in zip(batch, upsampled_peaks):
+            view = peaks[segment * SEGMENT_FRAMES:(segment + 1) * SEGMENT_FRAMES]
+            np.maximum(view, values[:len(view)], out=view)
+    return peaks
+
+def true_peak(samples):
+    """True peak of float32 samples, in dBTP."""
+    if not len(samples):
+        return float('-inf')
+    floor = float(_frame_peaks(samples).max()) / db_to_gain(TRUE_PEAK_MARGIN_DB)
+    peak = float(oversampled_peaks(samples, floor).max())
+    return 20.0 * np.log10(peak) if peak > 0 else float('-inf')
+
+def _limiter_gain(required, lookahead, release):
+    from scipy.ndimage import minimum_filter1d
+    
+    # held[n] = min(required[n - release : n + lookahead])
+    size = lookahead + release
+    held = minimum_filter1d(required, size=size, mode='nearest', origin=release - size // 2)
+
+    # gain[n] = mean(held[n - lookahead + 1 : n + 1])
+    padded = np.concatenate([np.full(lookahead - 1, held[0]), held])
+    cumulative = np.concatenate([[0.0], np.cumsum(padded, dtype=np.float64)])
+    return ((cumulative[lookahead:] - cumulative[:-lookahead]) / lookahead).astype(np.float32)
+
+def limit_true_peak(samples, sample_rate, ceiling_db=-1.0, lookahead_ms=5.0, release_ms=50.0):
+    """Look-ahead limiter keeping the true peak of `samples` below `ceiling_db`.
+
+    The gain each frame needs is held for the look-ahead before and the
+    release after every peak (a running minimum), then smoothed with a moving
+    average as long as the look-ahead. Because the average only covers held
+    values, the smoothed gain never exceeds what any frame needs, so peaks are
+    caught without overshoot and without delaying the signal. The gain curve
+    is only computed around the frames that are over the ceiling.
+
+    Returns:
+        tuple: (limited samples, maximum gain reduction in dB).
+    """
+    ceiling = db_to_gain(ceiling_db)
+    peaks = oversampled_peaks(samples, ceiling / db_to_gain(TRUE_PEAK_MARGIN_DB))
+    over = np.flatnonzero(peaks > ceiling)
+    if not len(over):
+        return samples, 0.0
+
+    lookahead = max(1, int(lookahead_ms * sample_rate / 1000.0))
+    release = max(0, int(release_ms * sample_rate / 1000.0))
+    reach = lookahead + release
+
+    # Group the frames over the ceiling into regions no gain ramp crosses
+    breaks = np.flatnonzero(np.diff(over) > 2 * reach)
+    firsts = over[np.concatenate([[0], breaks + 1])]
+    lasts = over[np.concatenate([breaks, [len(over) - 1]])]
+
+    limited = samples.copy()
+    lowest_gain = 1.0
+    for first, last in zip(firsts, lasts):
+        low, high = max(0, first - reach), min(len(samples), last + reach + 1)
+        required = (ceiling / np.maximum(peaks[low:high], ceiling)).astype(np.float32)
+        gain = _limiter_gain(required, lookahead, release)
+        limited[low:high] *= gain[:, None]
+        lowest_gain = min(lowest_gain, float(gain.min()))
+    return limited, float(-20.0 * np.log10(lowest_gain))
+
+def normalize_loudness(samples, sample_rate, target_lufs=None, true_peak_db=-1.0):
+    """Normalize a float32 mix to `target_lufs` and limit its true peak to `true_peak_db`.
+
+    Either step is skipped when its target is None.
+
+    Returns:
+        np.ndarray: The normalized samples.
+    """
+    if target_lufs is not None:
+        loudness = integrated_loudness(samples, sample_rate)
+        if np.isfinite(loudness):
+            gain_db = target_lufs - loudness
+            print(f"Normalizing loudness: {loudness:.1f} LUFS -> {target_lufs:.1f} LUFS ({gain_db:+.1f} dB)")
+            samples = samples * np.float32(db_to_gain(gain_db))
+        else:
+            print("Skipping loudness normalization: the mix is silent")
+    if true_peak_db is not None:
+        samples, reduction_db = limit_true_peak(samples, sample_rate, true_peak_db)
+        if reduction_db > 0:
+            print(f"Limiting true peak to {true_peak_db:.1f} dBTP (up to {reduction_db:.1f} dB of gain reduction)")
+    return samples
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure (and optionally normalize) the loudness of an audio file')
+    parser.add_argument('input_file', help='Path to the audio file')
+    parser.add_argument('-o', '--output-file', help='Write the normalized audio to this file')
+    parser.add_argument('--target-lufs', type=float, default=-14.0, help='Integrated loudness target in LUFS')
+    parser.add_argument('--true-peak', type=float, default=-1.0, help='True-peak ceiling in dBTP')
+
+    args = parser.parse_args()
+
+    try:
+        samples, sample_rate = load_audio(args.input_file)
+        print(f"Integrated loudness: {integrated_loudness(samples, sample_rate):.1f} LUFS")
+        print(f"True peak: {true_peak(samples):.1f} dBTP")
+        if args.output_file:
+            samples = normalize_loudness(samples, sample_rate, args.target_lufs, args.true_peak)
+            write_audio(args.output_file, samples, sample_rate)
+            print(f"Normalized audio saved to: {args.output_file}")
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,47 +4,179 @@
 import os
 import sys
 import argparse
-from pydub import AudioSegment
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 
-def merge_audio(vocal_file, instrumental_file, output_file, vocal_volume=-2, instrumental_volume=-1):
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.align import MIN_CONFIDENCE, decimation_factor, envelope, estimate_offset, estimate_offset_envelopes, shift, shift_blocks
+from scripts.audio_cache import load_audio
+from scripts.events import EVENT_MODES, open_stdout_events
+from scripts.loudness import normalize_loudness
+from scripts.mixer import ENCODERS, common_format, iter_audio_blocks, mix, mix_streams, open_writer, output_format_for, write_audio
+
+def merge_audio(vocal_file, instrumental_file, output_file, vocal_volume=-2, instrumental_volume=-1,
+                engine='numpy', dither=False, streaming=False, output_format=None, bitrate=None,
+                reference_vocal_file=None, max_offset_seconds=1.0, target_lufs=None, true_peak_db=None, events=None):
     """Merge vocal and instrumental tracks into a single audio file.
     
     Args:
         vocal_file (str): Path to the vocal audio file.
         instrumental_file (str): Path to the instrumental audio file.
-        output_file (str): Path where the merged audio will be saved.
+        output_file (str): Path where the merged audio will be saved, or '-' to
+            write the encoded audio to stdout.
         vocal_volume (int): Volume adjustment for vocals in dB (negative values reduce volume).
         instrumental_volume (int): Volume adjustment for instrumental in dB (negative values reduce volume).
+        engine (str): 'numpy' for the float32 mixer, 'pydub' for the AudioSegment overlay.
+        dither (bool): Add TPDF dither when quantizing the numpy mix to 16 bits.
+        streaming (bool): Read, mix and write block by block (numpy engine) so
+            memory use stays constant however long the tracks are.
+        output_format (str): Delivery format: 'wav', 'mp3', 'flac', 'opus' or 'aac'
+            (default: from the output file extension, WAV for stdout). The numpy
+            engine pipes the float mix straight into the ffmpeg encoder.
+        bitrate (str): Encoder bitrate for lossy formats, e.g. '256k'.
+        reference_vocal_file (str): The original separated vocals. When given, the
+            latency of `vocal_file` against them is estimated and removed before mixing.
+        max_offset_seconds (float): Largest latency searched for when aligning.
+        target_lufs (float): Normalize the mix to this integrated loudness (EBU R128).
+        true_peak_db (float): Limit the true peak of the mix to this level in dBTP
+            (default -1 when `target_lufs` is given). Loudness normalization and
+            limiting need the whole mix, so they require the in-memory numpy engine.
+        events (EventWriter): Receives 'progress' events (see scripts/events.py).
     
     Returns:
         str: Path to the merged audio file.
     """
-    # Load the audio files
-    print(f"Loading vocal track from {vocal_file}...")
-    try:
-        if vocal_file.lower().endswith('.mp3'):
-            voz = AudioSegment.from_mp3(vocal_file)
-        elif vocal_file.lower().endswith('.wav'):
-            voz = AudioSegment.from_wav(vocal_file)
-        else:
-            voz = AudioSegment.from_file(vocal_file)
-    except Exception as e:
-        print(f"Error loading vocal file: {str(e)}")
-        print(f"Trying alternative loading method...")
-        voz = AudioSegment.from_file(vocal_file)
+    output_format = output_format_for(output_file, output_format)
+    if target_lufs is not None and true_peak_db is None:
+        true_peak_db = -1.0
+    if (target_lufs is not None or true_peak_db is not None) and (streaming or engine != 'numpy'):
+        raise ValueError("Loudness normalization requires the in-memory numpy engine")
+    if events:
+        events.emit('progress', stage='merge', percent=0, message='Merging')
+    if engine == 'numpy' and streaming:
+        _merge_streaming(vocal_file, instrumental_file, output_file, vocal_volume, instrumental_volume, dither,
+                         output_format, bitrate, reference_vocal_file, max_offset_seconds)
+    elif streaming:
+        raise ValueError("Streaming merge requires the numpy engine")
+    elif engine == 'numpy':
+        _merge_with_numpy(vocal_file, instrumental_file, output_file, vocal_volume, instrumental_volume, dither,
+                          output_format, bitrate, reference_vocal_file, max_offset_seconds, target_lufs, true_peak_db)
+    elif engine == 'pydub':
+        _merge_with_pydub(vocal_file, instrumental_file, output_file, vocal_volume, instrumental_volume,
+                          output_format, bitrate, reference_vocal_file, max_offset_seconds)
+    else:
+        raise ValueError(f"Unknown merge engine: {engine}")
+    
+    if output_file == '-':
+        if events:
+            events.emit('progress', stage='merge', percent=100, message='Merge complete')
+        print(f"Audio merged successfully and written to stdout as {output_format}")
+        return output_file
+    
+    # Verify that the output file exists
+    if not os.path.exists(output_file):
+        raise FileNotFoundError(f"Merged audio not found at expected location: {output_file}")
+    
+    if events:
+        events.emit('progress', stage='merge', percent=100, message='Merge complete')
+    print(f"Audio merged successfully and saved to: {output_file}")
+    return output_file
+
+def _accept_offset(offset, confidence, sample_rate):
+    """Return the offset to apply, or 0 if the alignment is not trustworthy."""
+    if confidence < MIN_CONFIDENCE:
+        print(f"Skipping vocal alignment: no reliable match against the original vocals (confidence {confidence:.2f})")
+        return 0
+    print(f"Aligning vocals: converted vocals are {offset / sample_rate * 1000:+.1f} ms late (confidence {confidence:.2f})")
+    return offset
+
+def _merge_with_numpy(vocal_file, instrumental_file, output_file, vocal_volume, instrumental_volume, dither,
+                      output_format, bitrate, reference_vocal_file=None, max_offset_seconds=1.0,
+                      target_lufs=None, true_peak_db=None):
+    # Decode both tracks once, to the format the overlay needs, each in its own
+    # thread so the ffmpeg decodes run side by side
+    sample_rate, channels = common_format([vocal_file, instrumental_file])
+    print(f"Loading vocal track from {vocal_file} and instrumental track from {instrumental_file}...")
+    with ThreadPoolExecutor(max_workers=3) as pool:
+        vocal_load = pool.submit(load_audio, vocal_file, sample_rate, channels)
+        instrumental_load = pool.submit(load_audio, instrumental_file, sample_rate, channels)
+        reference_load = pool.submit(load_audio, reference_vocal_file, sample_rate) if reference_vocal_file else None
+        voz, _ = vocal_load.result()
+        musica, _ = instrumental_load.result()
+    
+    if reference_load is not None:
+        factor = decimation_factor(sample_rate)
+        reference = envelope(reference_load.result()[0], factor)
+        offset, confidence = estimate_offset_envelopes(reference, envelope(voz, factor), factor,
+                                                       sample_rate / factor, max_offset_seconds)
+        voz = shift(voz, _accept_offset(offset, confidence, sample_rate))
     
-    print(f"Loading instrumental track from {instrumental_file}...")
+    # Apply both gains and sum in one pass; like overlay, the result has the instrumental's length
+    print("Merging tracks...")
+    final = mix([musica, voz], [instrumental_volume, vocal_volume], length=len(musica))
+    
+    # Normalize and limit the float mix before it is quantized, instead of a separate loudnorm pass
+    if target_lufs is not None or true_peak_db is not None:
+        final = normalize_loudness(final, sample_rate, target_lufs, true_peak_db)
+    
+    # Clip and quantize (or encode) once, while writing
+    print(f"Exporting merged audio to {output_file}...")
+    write_audio(output_file, final, sample_rate, output_format, dither=dither, bitrate=bitrate)
+
+def _merge_streaming(vocal_file, instrumental_file, output_file, vocal_volume, instrumental_volume, dither,
+                     output_format, bitrate, reference_vocal_file=None, max_offset_seconds=1.0):
+    sample_rate, channels = common_format([vocal_file, instrumental_file])
+    offset = 0
+    if reference_vocal_file:
+        # Costs one extra streamed pass over the vocals, still in constant memory
+        offset = _accept_offset(*estimate_offset(reference_vocal_file, vocal_file, sample_rate, max_offset_seconds),
+                                sample_rate)
+    print(f"Streaming {instrumental_file} and {vocal_file} into {output_file}...")
+    streams = [
+        iter_audio_blocks(instrumental_file, sample_rate, channels),
+        shift_blocks(iter_audio_blocks(vocal_file, sample_rate, channels), offset, channels),
+    ]
+    with open_writer(output_file, sample_rate, channels, output_format, dither, bitrate) as writer:
+        frames = mix_streams(streams, [instrumental_volume, vocal_volume], writer)
+    print(f"Merged {frames / sample_rate:.1f} seconds of audio")
+
+def _load_segment(path, kind):
+    """Load an AudioSegment, falling back to ffmpeg's format detection."""
+    from pydub import AudioSegment
     try:
-        if instrumental_file.lower().endswith('.mp3'):
-            musica = AudioSegment.from_mp3(instrumental_file)
-        elif instrumental_file.lower().endswith('.wav'):
-            musica = AudioSegment.from_wav(instrumental_file)
+        if path.lower().endswith('.mp3'):
+            return AudioSegment.from_mp3(path)
+        elif path.lower().endswith('.wav'):
+            return AudioSegment.from_wav(path)
         else:
-            musica = AudioSegment.from_file(instrumental_file)
+            return AudioSegment.from_file(path)
     except Exception as e:
-        print(f"Error loading instrumental file: {str(e)}")
+        print(f"Error loading {kind} file: {str(e)}")
         print(f"Trying alternative loading method...")
-        musica = AudioSegment.from_file(instrumental_file)
+        return AudioSegment.from_file(path)
+
+def _merge_with_pydub(vocal_file, instrumental_file, output_file, vocal_volume, instrumental_volume,
+                      output_format='wav', bitrate=None, reference_vocal_file=None, max_offset_seconds=1.0):
+    # Only the pydub engine needs pydub, so it is not imported with the module
+    from pydub import AudioSegment
+    
+    # Load the audio files; each load waits on its own ffmpeg process, so run them concurrently
+    print(f"Loading vocal track from {vocal_file} and instrumental track from {instrumental_file}...")
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        vocal_load = pool.submit(_load_segment, vocal_file, "vocal")
+        instrumental_load = pool.submit(_load_segment, instrumental_file, "instrumental")
+        voz = vocal_load.result()
+        musica = instrumental_load.result()
+    
+    if reference_vocal_file:
+        offset = _accept_offset(*estimate_offset(reference_vocal_file, vocal_file, voz.frame_rate, max_offset_seconds),
+                                voz.frame_rate)
+        offset_ms = int(round(offset * 1000 / voz.frame_rate))
+        if offset_ms > 0:
+            voz = voz[offset_ms:]
+        elif offset_ms < 0:
+            voz = AudioSegment.silent(duration=-offset_ms, frame_rate=voz.frame_rate) + voz
     
     # Adjust volumes
     voz = voz + vocal_volume  # Reduce vocal volume by 2dB
@@ -56,32 +188,60 @@ def merge_audio(vocal_file, instrumental_file, output_file, vocal_volume=-2, ins
     
     # Export the merged audio
     print(f"Exporting merged audio to {output_file}...")
-    final.export(output_file, format="wav")
-    
-    # Verify that the output file exists
-    if not os.path.exists(output_file):
-        raise FileNotFoundError(f"Merged audio not found at expected location: {output_file}")
-    
-    print(f"Audio merged successfully and saved to: {output_file}")
-    return output_file
+    codec_args, muxer = ENCODERS[output_format]
+    codec = codec_args[1] if output_format != 'wav' else None
+    # stdout may be redirected to stderr for progress messages; the audio goes to the real stdout
+    target = sys.__stdout__.buffer if output_file == '-' else output_file
+    final.export(target, format=muxer, codec=codec, bitrate=bitrate)
 
 def main():
     parser = argparse.ArgumentParser(description='Merge vocal and instrumental tracks into a single audio file')
     parser.add_argument('vocal_file', help='Path to the vocal audio file')
     parser.add_argument('instrumental_file', help='Path to the instrumental audio file')
-    parser.add_argument('-o', '--output-file', default='merged_audio.wav', help='Path where the merged audio will be saved')
+    parser.add_argument('-o', '--output-file', default='merged_audio.wav', help="Path where the merged audio will be saved ('-' for stdout)")
     parser.add_argument('-vv', '--vocal-volume', type=int, default=-2, help='Volume adjustment for vocals in dB')
     parser.add_argument('-iv', '--instrumental-volume', type=int, default=-1, help='Volume adjustment for instrumental in dB')
+    parser.add_argument('--engine', choices=['numpy', 'pydub'], default='numpy', help='Mixing engine')
+    parser.add_argument('--dither', action='store_true', help='Add TPDF dither when quantizing the mix to 16 bits')
+    parser.add_argument('--stream', action='store_true', help='Merge block by block with constant memory use (for very long tracks)')
+    parser.add_argument('--format', choices=['wav', 'mp3', 'flac', 'opus', 'aac'], help='Output format (default: from the output file extension)')
+    parser.add_argument('--bitrate', help="Encoder bitrate for lossy formats, e.g. '256k'")
+    parser.add_argument('--align-to', help='Original separated vocals; remove the latency of the vocal file against them before mixing')
+    parser.add_argument('--max-offset', type=float, default=1.0, help='Largest latency searched for when aligning, in seconds')
+    parser.add_argument('--target-lufs', type=float, help='Normalize the mix to this integrated loudness in LUFS (e.g. -14)')
+    parser.add_argument('--true-peak', type=float, help='Limit the true peak of the mix to this level in dBTP (default -1 with --target-lufs)')
+    parser.add_argument('--events', choices=EVENT_MODES, default='text', help='jsonl: write only JSON-lines events (progress, result, error) to stdout and the log to stderr')
     
     args = parser.parse_args()
+    if args.output_file == '-' and args.events == 'jsonl':
+        parser.error("--events jsonl needs stdout, so it cannot be used with -o -")
     
+    events = open_stdout_events(args.events)
     try:
-        output_file = merge_audio(args.vocal_file, args.instrumental_file, args.output_file, args.vocal_volume, args.instrumental_volume)
+        if args.output_file == '-':
+            # stdout carries the encoded audio; progress messages go to stderr
+            sys.stdout.flush()
+            with contextlib.redirect_stdout(sys.stderr):
+                merge_audio(args.vocal_file, args.instrumental_file, '-', args.vocal_volume, args.instrumental_volume,
+                            engine=args.engine, dither=args.dither, streaming=args.stream,
+                            output_format=args.format, bitrate=args.bitrate,
+                            reference_vocal_file=args.align_to, max_offset_seconds=args.max_offset,
+                            target_lufs=args.target_lufs, true_peak_db=args.true_peak)
+            return 0
+        output_file = merge_audio(args.vocal_file, args.instrumental_file, args.output_file, args.vocal_volume, args.instrumental_volume,
+                                  engine=args.engine, dither=args.dither, streaming=args.stream,
+                                  output_format=args.format, bitrate=args.bitrate,
+                                  reference_vocal_file=args.align_to, max_offset_seconds=args.max_offset,
+                                  target_lufs=args.target_lufs, true_peak_db=args.true_peak, events=events)
+        if events:
+            events.emit('result', output_file=os.path.abspath(output_file))
         # Print the output file path to stdout for the TypeScript code to capture
         # Use double quotes to ensure proper parsing in TypeScript
         print(f'OUTPUT_FILE="{output_file.replace("\\", "/")}"')
         return 0
     except Exception as e:
+        if events:
+            events.emit('error', error=str(e))
         print(f"Error: {str(e)}", file=sys.stderr)
         return 1
 
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Per-stage resource measurements: wall time, CPU time, peak RSS and I/O.
+
+`measure()` wraps a block of work and fills a dict with what it cost.
+- CPU time includes the child processes the block waited for, such as
+  ffmpeg, Demucs or so-vits-svc.
+- Bytes read and written come from /proc/self/io, which also counts the
+  waited-for children.
+- Peak RSS comes from VmHWM. It is reset through /proc/self/clear_refs at the
+  start of each measurement, so it is the peak of that block rather than of
+  the whole process. Where VmHWM cannot be reset, the process-lifetime peak
+  is reported and 'peak_rss_scope' says so.
+
+These counters are per process. Stages measured concurrently in threads of
+the same process therefore share their peak RSS and I/O numbers.
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; CPU time falls back to this process only
+    resource = None
+
+REPORT_FILE = 'performance_report.json'
+
+_lock = threading.Lock()
+# Measurements in progress, outermost first, so nested ones can reset VmHWM without losing the outer peaks
+_active = []
+
+def _read_proc(path):
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except OSError:
+        return None
+
+def _peak_rss():
+    """Return VmHWM in bytes, or None where /proc is not available."""
+    status = _read_proc('/proc/self/status')
+    if status:
+        for line in status.splitlines():
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) * 1024
+    return None
+
+def _reset_peak_rss():
+    """Reset VmHWM to the current RSS (Linux 4.0+). Returns False if not possible."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+def _io_counters():
+    io = _read_proc('/proc/self/io')
+    if not io:
+        return {}
+    counters = {}
+    for line in io.splitlines():
+        key, _, value = line.partition(':')
+        counters[key.strip()] = int(value)
+    return counters
+
+def _maxrss_bytes(usage):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    return usage.ru_maxrss if sys.platform == 'darwin' else usage.ru_maxrss * 1024
+
+def _cpu_times():
+    if resource is None:
+        times = os.times()
+        return times.user + times.system, None
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu = own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+    return cpu, _maxrss_bytes(children)
+
+@contextmanager
+def measure():
+    """Measure the enclosed block.
+
+    Yields a dict that is filled in when the block exits with 'wall_seconds',
+    'cpu_seconds', 'peak_rss_bytes', 'peak_rss_scope' ('stage' or 'process'),
+    'max_child_rss_bytes' (None unless a child process exceeded every earlier
+    child), 'read_bytes', 'write_bytes' (storage I/O) and 'read_chars',
+    'write_chars' (all reads and writes, including the page cache).
+    """
+    metrics = {}
+    frame = {'peak': 0}
+    with _lock:
+        hwm = _peak_rss()
+        for outer in _active:
+            outer['peak'] = max(outer['peak'], hwm or 0)
+        reset = _reset_peak_rss()
+        _active.append(frame)
+    start_wall = time.perf_counter()
+    start_cpu, start_child_rss = _cpu_times()
+    start_io = _io_counters()
+    try:
+        yield metrics
+    finally:
+        end_cpu, end_child_rss = _cpu_times()
+        end_io = _io_counters()
+        with _lock:
+            hwm = _peak_rss()
+            # By identity: frames with equal peaks compare equal
+            del _active[next(index for index, active in enumerate(_active) if active is frame)]
+            for outer in _active:
+                outer['peak'] = max(outer['peak'], hwm or 0)
+        metrics.update({
+            'wall_seconds': round(time.perf_counter() - start_wall, 3),
+            'cpu_seconds': round(end_cpu - start_cpu, 3),
+            'peak_rss_bytes': max(frame['peak'], hwm) if hwm is not None else None,
+            'peak_rss_scope': 'stage' if reset else 'process',
+            'max_child_rss_bytes': end_child_rss if end_child_rss and end_child_rss != start_child_rss else None,
+        })
+        for key, name in [('read_bytes', 'read_bytes'), ('write_bytes', 'write_bytes'),
+                          ('rchar', 'read_chars'), ('wchar', 'write_chars')]:
+            metrics[name] = end_io[key] - start_io[key] if key in end_io and key in start_io else None
+
+def update_report(report_path, stages):
+    """Record stage measurements in a JSON report, keeping the entries of other stages.
+
+    Args:
+        report_path (str): Path to the report (usually `<output_dir>/performance_report.json`).
+        stages (dict): Stage name -> metrics dict from `measure()`, plus any extra fields.
+
+    Returns:
+        str: Path to the report.
+    """
+    report = {'stages': {}}
+    with _lock:
+        if os.path.exists(report_path):
+            try:
+                with open(report_path, 'r', encoding='utf-8') as f:
+                    report = json.load(f)
+                report.setdefault('stages', {})
+            except (OSError, ValueError) as e:
+                print(f"Warning: rewriting unreadable performance report {report_path}: {str(e)}")
+                report = {'stages': {}}
+        for name, metrics in stages.items():
+            report['stages'][name] = dict(metrics, recorded_at=time.strftime('%Y-%m-%dT%H:%M:%S%z'))
+
+        os.makedirs(os.path.dirname(os.path.abspath(report_path)), exist_ok=True)
+        # Write to a temporary file and rename it so readers never see a half-written report
+        tmp_path = f"{report_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, report_path)
+    return report_path
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.audio_cache import load_audio
+from scripts.loudness import normalize_loudness
+from scripts.mixer import ENCODERS, match_channels, mix, output_format_for, probe_audio, write_audio
+
+def mix_stems(stems, output_file, sample_rate=None, dither=False, target_lufs=None, true_peak_db=None,
+              output_format=None, bitrate=None):
+    """Remix any number of stems with per-stem gains in a single pass.
+
+    Args:
+        stems (dict): {name: (path_or_array, gain_db)}. Arrays are float32 samples
+            of shape (frames, channels) or (frames,) at `sample_rate`.
+        output_file (str): Path where the remix will be saved.
+        sample_rate (int): Sample rate of the array stems. Files are decoded to it;
+            if only files are given, the highest file sample rate is used.
+        dither (bool): Add TPDF dither when quantizing to 16 bits.
+        target_lufs (float): Normalize the remix to this integrated loudness (EBU R128).
+        true_peak_db (float): Limit the true peak of the remix to this level in dBTP
+            (default -1 when `target_lufs` is given).
+        output_format (str): Delivery format: 'wav', 'mp3', 'flac', 'opus' or 'aac'
+            (default: from the output file extension).
+        bitrate (str): Encoder bitrate for lossy formats, e.g. '256k'.
+
+    Returns:
+        str: Path to the remixed audio file.
+    """
+    if not stems:
+        raise ValueError("No stems to mix")
+    output_format = output_format_for(output_file, output_format)
+
+    paths = [source for source, _ in stems.values() if isinstance(source, (str, os.PathLike))]
+    arrays = [np.asarray(source) for source, _ in stems.values() if not isinstance(source, (str, os.PathLike))]
+    if arrays and not sample_rate:
+        raise ValueError("sample_rate is required when stems are given as arrays")
+
+    # Decode every file once, to the common sample rate and channel layout
+    formats = [probe_audio(path) for path in paths]
+    sample_rate = sample_rate or max(rate for rate, _ in formats)
+    channels = max([file_channels for _, file_channels in formats] +
+                   [array.shape[1] if array.ndim == 2 else 1 for array in arrays])
+
+    tracks = []
+    gains_db = []
+    for name, (source, gain_db) in stems.items():
+        if isinstance(source, (str, os.PathLike)):
+            print(f"Loading {name} from {source}...")
+            samples, _ = load_audio(source, sample_rate, channels)
+        else:
+            samples = np.asarray(source, dtype=np.float32)
+            if samples.ndim == 1:
+                samples = samples[:, None]
+            samples = match_channels(samples, channels)
+        tracks.append(samples)
+        gains_db.append(gain_db)
+        print(f"- {name}: {gain_db:+.1f} dB")
+
+    # One fused multiply-add pass over the output, as long as the longest stem
+    print(f"Mixing {len(tracks)} stems...")
+    remix = mix(tracks, gains_db, length=max(len(track) for track in tracks))
+    if target_lufs is not None and true_peak_db is None:
+        true_peak_db = -1.0
+    if target_lufs is not None or true_peak_db is not None:
+        remix = normalize_loudness(remix, sample_rate, target_lufs, true_peak_db)
+
+    print(f"Exporting remix to {output_file}...")
+    write_audio(output_file, remix, sample_rate, output_format, dither=dither, bitrate=bitrate)
+
+    # Verify that the output file exists
+    if not os.path.exists(output_file):
+        raise FileNotFoundError(f"Remix not found at expected location: {output_file}")
+
+    print(f"Stems mixed successfully and saved to: {output_file}")
+    return output_file
+
+def main():
+    parser = argparse.ArgumentParser(description='Remix separated stems (vocals, drums, bass, other, ...) with per-stem gains')
+    parser.add_argument('-s', '--stem', nargs='+', action='append', required=True, metavar='NAME PATH [GAIN_DB]',
+                        help='A stem to mix: its name, its audio file and an optional gain in dB (default 0); repeat for each stem')
+    parser.add_argument('-o', '--output-file', default='remix.wav', help='Path where the remix will be saved')
+    parser.add_argument('--dither', action='store_true', help='Add TPDF dither when quantizing the mix to 16 bits')
+    parser.add_argument('--format', choices=list(ENCODERS), help='Output format (default: from the output file extension)')
+    parser.add_argument('--bitrate', help="Encoder bitrate for lossy formats, e.g. '256k'")
+    parser.add_argument('--target-lufs', type=float, help='Normalize the remix to this integrated loudness in LUFS (e.g. -14)')
+    parser.add_argument('--true-peak', type=float, help='Limit the true peak of the remix to this level in dBTP (default -1 with --target-lufs)')
+
+    args = parser.parse_args()
+
+    stems = {}
+    for stem in args.stem:
+        if len(stem) not in (2, 3):
+            parser.error(f"--stem expects NAME PATH [GAIN_DB], got: {' '.join(stem)}")
+        try:
+            gain_db = float(stem[2]) if len(stem) == 3 else 0.0
+        except ValueError:
+            parser.error(f"Invalid gain for stem {stem[0]}: {stem[2]}")
+        stems[stem[0]] = (stem[1], gain_db)
+
+    try:
+        output_file = mix_stems(stems, args.output_file, dither=args.dither,
+                                target_lufs=args.target_lufs, true_peak_db=args.true_peak,
+                                output_format=args.format, bitrate=args.bitrate)
+        # Print the output file path to stdout for the TypeScript code to capture
+        print(f'OUTPUT_FILE="{output_file.replace(os.sep, "/")}"')
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
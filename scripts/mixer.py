@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Float32 NumPy mixing engine.
+
+Tracks are decoded once into float32 arrays of shape (frames, channels) with
+samples in [-1, 1]. Gains are applied and tracks summed in a single fused
+multiply-add pass over cache-sized blocks, and the result is clipped (and
+optionally dithered) only once, when it is converted back to 16-bit PCM, or
+when it is piped as float PCM into an ffmpeg encoder.
+"""
+
+import os
+import json
+import wave
+import tempfile
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# Frames processed per block; small enough for the working set to stay in cache
+BLOCK_FRAMES = 1 << 16
+
+PCM16_SCALE = 32768.0
+
+def db_to_gain(db):
+    """Convert a gain in dB to a linear amplitude factor."""
+    return float(10.0 ** (db / 20.0))
+
+def probe_audio(path):
+    """Return (sample_rate, channels) of an audio file without decoding it."""
+    try:
+        with wave.open(path, 'rb') as wav:
+            return wav.getframerate(), wav.getnchannels()
+    except (wave.Error, EOFError):
+        pass
+
+    result = subprocess.run([
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'a:0',
+        '-show_entries', 'stream=sample_rate,channels',
+        '-of', 'json', path
+    ], capture_output=True, text=True, check=True)
+    stream = json.loads(result.stdout)['streams'][0]
+    return int(stream['sample_rate']), int(stream['channels'])
+
+def _pcm_to_float(raw, sample_width, channels):
+    if sample_width == 2:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32)
+        samples *= 1.0 / PCM16_SCALE
+    elif sample_width == 3:
+        data = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        samples = (data[:, 0] | (data[:, 1] << 8) | (data[:, 2] << 16)).astype(np.int32)
+        samples = np.where(samples >= 1 << 23, samples - (1 << 24), samples).astype(np.float32)
+        samples *= 1.0 / (1 << 23)
+    elif sample_width == 4:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32)
+        samples *= 1.0 / (1 << 31)
+    elif sample_width == 1:
+        samples = np.frombuffer(raw, dtype=np.uint8).astype(np.float32)
+        samples -= 128.0
+        samples *= 1.0 / 128.0
+    else:
+        raise ValueError(f"Unsupported WAV sample width: {sample_width} bytes")
+    return samples.reshape(-1, channels)
+
+def match_channels(samples, channels):
+    """Up-mix mono or down-mix to mono so `samples` has `channels` channels."""
+    if channels is None or samples.shape[1] == channels:
+        return samples
+    if samples.shape[1] == 1:
+        return np.repeat(samples, channels, axis=1)
+    if channels == 1:
+        return samples.mean(axis=1, keepdims=True, dtype=np.float32)
+    raise ValueError(f"Cannot convert {samples.shape[1]} channels to {channels}")
+
+def _decode_wav(path, sample_rate):
+    """Decode a PCM WAV with the stdlib, or return None if ffmpeg is needed."""
+    try:
+        with wave.open(path, 'rb') as wav:
+            if sample_rate and wav.getframerate() != sample_rate:
+                return None
+            raw = wav.readframes(wav.getnframes())
+            return _pcm_to_float(raw, wav.getsampwidth(), wav.getnchannels()), wav.getframerate()
+    except (wave.Error, EOFError):
+        # Float or compressed WAVs are not supported by the wave module
+        return None
+
+def _decode_ffmpeg(path, sample_rate, channels):
+    if not sample_rate or not channels:
+        probed_rate, probed_channels = probe_audio(path)
+        sample_rate = sample_rate or probed_rate
+        channels = channels or probed_channels
+    result = subprocess.run([
+        'ffmpeg', '-v', 'error', '-nostdin',
+        '-i', path,
+        '-f', 'f32le', '-acodec', 'pcm_f32le',
+        '-ac', str(channels), '-ar', str(sample_rate),
+        '-'
+    ], capture_output=True, check=True)
+    samples = np.frombuffer(result.stdout, dtype='<f4').reshape(-1, channels)
+    return samples, sample_rate
+
+def decode_audio(path, sample_rate=None, channels=None):
+    """Decode an audio file to float32 samples.
+
+    PCM WAV files are read directly; everything else (and WAVs that need
+    resampling) is decoded by a single ffmpeg process.
+
+    Args:
+        path (str): Path to the audio file.
+        sample_rate (int): Resample to this rate (default: keep the file's rate).
+        channels (int): Convert to this many channels (default: keep the file's layout).
+
+    Returns:
+        tuple: (samples, sample_rate) where samples has shape (frames, channels).
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Audio file not found: {path}")
+    decoded = _decode_wav(path, sample_rate) if path.lower().endswith('.wav') else None
+    if decoded is None:
+        decoded = _decode_ffmpeg(path, sample_rate, channels)
+    samples, rate = decoded
+    return match_channels(samples, channels), rate
+
+def common_format(paths):
+    """Return the (sample_rate, channels) all of `paths` should be decoded to.
+
+    Like pydub's overlay, the highest sample rate and channel count win. The
+    files are probed concurrently, one ffprobe process each.
+    """
+    with ThreadPoolExecutor(max_workers=max(len(paths), 1)) as pool:
+        formats = list(pool.map(probe_audio, paths))
+    return max(rate for rate, _ in formats), max(channels for _, channels in formats)
+
+def iter_audio_blocks(path, sample_rate=None, channels=None, block_frames=BLOCK_FRAMES):
+    """Decode an audio file incrementally.
+
+    Yields float32 blocks of shape (<= block_frames, channels), so only one
+    block of the file is held in memory at a time. PCM WAVs at the requested
+    rate are read with the wave module, anything else is streamed from ffmpeg.
+    If ffmpeg fails part-way through, `subprocess.CalledProcessError` is raised
+    after the last block instead of the stream just ending early.
+    """
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Audio file not found: {path}")
+
+    if path.lower().endswith('.wav'):
+        try:
+            wav = wave.open(path, 'rb')
+        except (wave.Error, EOFError):
+            wav = None
+        if wav is not None:
+            with wav:
+                if not sample_rate or wav.getframerate() == sample_rate:
+                    while True:
+                        raw = wav.readframes(block_frames)
+                        if not raw:
+                            return
+                        block = _pcm_to_float(raw, wav.getsampwidth(), wav.getnchannels())
+                        yield match_channels(block, channels)
+
+    if not sample_rate or not channels:
+        probed_rate, probed_channels = probe_audio(path)
+        sample_rate = sample_rate or probed_rate
+        channels = channels or probed_channels
+    # A file rather than a pipe, so a flood of decode errors cannot block ffmpeg
+    errors = tempfile.TemporaryFile()
+    process = subprocess.Popen([
+        'ffmpeg', '-v', 'error', '-nostdin',
+        '-i', path,
+        '-f', 'f32le', '-acodec', 'pcm_f32le',
+        '-ac', str(channels), '-ar', str(sample_rate),
+        '-'
+    ], stdout=subprocess.PIPE, stderr=errors)
+    block_bytes = block_frames * channels * 4
+    finished = False
+    try:
+        while True:
+            raw = process.stdout.read(block_bytes)
+            if not raw:
+                break
+            yield np.frombuffer(raw, dtype='<f4').reshape(-1, channels)
+        finished = True
+    finally:
+        process.stdout.close()
+        # Only a consumer that stopped early leaves ffmpeg running on purpose
+        if not finished and process.poll() is None:
+            process.terminate()
+        returncode = process.wait()
+        errors.seek(0)
+        stderr = errors.read()
+        errors.close()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, 'ffmpeg', stderr=stderr)
+
+def _accumulate(out, block, gain, scratch):
+    """out[:n] += gain * block[:n], without allocating a temporary."""
+    count = min(len(out), len(block))
+    if count:
+        np.multiply(block[:count], gain, out=scratch[:count])
+        out[:count] += scratch[:count]
+
+def mix(tracks, gains_db, length=None):
+    """Sum tracks with per-track gains in one fused multiply-add pass.
+
+    Args:
+        tracks (list): float32 arrays of shape (frames, channels), same channel count.
+        gains_db (list): Gain in dB for each track.
+        length (int): Output length in frames (default: length of the first track).
+            Shorter tracks are treated as silence past their end; longer ones are cut.
+
+    Returns:
+        np.ndarray: The mix, float32 of shape (length, channels), not clipped.
+    """
+    if len(tracks) != len(gains_db):
+        raise ValueError("Expected one gain per track")
+    length = len(tracks[0]) if length is None else length
+    channels = tracks[0].shape[1]
+    gains = [np.float32(db_to_gain(db)) for db in gains_db]
+    out = np.zeros((length, channels), dtype=np.float32)
+    scratch = np.empty((BLOCK_FRAMES, channels), dtype=np.float32)
+
+    for start in range(0, length, BLOCK_FRAMES):
+        end = min(start + BLOCK_FRAMES, length)
+        for track, gain in zip(tracks, gains):
+            _accumulate(out[start:end], track[start:end], gain, scratch)
+    return out
+
+def mix_streams(streams, gains_db, writer, block_frames=BLOCK_FRAMES):
+    """Mix block iterators (see `iter_audio_blocks`) into `writer` incrementally.
+
+    The output has the length of the first stream; the others are treated as
+    silence past their end and cut if longer. Memory use is a few blocks,
+    independent of the track length.
+
+    Returns:
+        int: Number of frames written.
+    """
+    if len(streams) != len(gains_db):
+        raise ValueError("Expected one gain per stream")
+    gains = [np.float32(db_to_gain(db)) for db in gains_db]
+    buffers = [_Rebuffer(stream, block_frames) for stream in streams]
+    out = None
+    scratch = None
+    frames_written = 0
+
+    try:
+        while True:
+            first = buffers[0].take()
+            if first is None:
+                break
+            if out is None:
+                out = np.empty((block_frames, first.shape[1]), dtype=np.float32)
+                scratch = np.empty_like(out)
+            block = out[:len(first)]
+            np.multiply(first, gains[0], out=block)
+            for buffer, gain in zip(buffers[1:], gains[1:]):
+                other = buffer.take(len(first))
+                if other is not None:
+                    _accumulate(block, other, gain, scratch)
+            writer.write(block)
+            frames_written += len(block)
+    finally:
+        for stream in streams:
+            close = getattr(stream, 'close', None)
+            if close:
+                close()
+    return frames_written
+
+class _Rebuffer:
+    """Re-chunk a block iterator so several streams can be consumed in lockstep."""
+
+    def __init__(self, stream, block_frames):
+        self.stream = iter(stream)
+        self.block_frames = block_frames
+        self.pending = None
+
+    def take(self, frames=None):
+        """Return the next `frames` frames (fewer at the end), or None when exhausted."""
+        frames = frames or self.block_frames
+        parts = []
+        needed = frames
+        while needed > 0:
+            if self.pending is None or not len(self.pending):
+                self.pending = next(self.stream, None)
+                if self.pending is None:
+                    break
+            part = self.pending[:needed]
+            self.pending = self.pending[needed:]
+            parts.append(part)
+            needed -= len(part)
+        if not parts:
+            return None
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+def to_pcm16(samples, dither=True, rng=None):
+    """Clip float samples to [-1, 1] and quantize to int16 in one pass.
+
+    With `dither`, triangular (TPDF) dither of +/-1 LSB is added before
+    rounding to decorrelate the quantization error from the signal. It is the
+    high-passed variant (difference of consecutive uniform samples), which
+    needs one random number per sample instead of two.
+    """
+    scaled = samples * np.float32(PCM16_SCALE)
+    if dither:
+        rng = rng or np.random.default_rng()
+        noise = rng.random((len(scaled) + 1,) + scaled.shape[1:], dtype=np.float32)
+        scaled += noise[1:]
+        scaled -= noise[:-1]
+    np.rint(scaled, out=scaled)
+    np.clip(scaled, -PCM16_SCALE, PCM16_SCALE - 1, out=scaled)
+    return scaled.astype('<i2')
+
+class WavWriter:
+    """Incremental 16-bit PCM WAV writer for float32 blocks."""
+
+    def __init__(self, path, sample_rate, channels, dither=False):
+        self.path = path
+        self.dither = dither
+        self.rng = np.random.default_rng() if dither else None
+        self.wav = wave.open(path, 'wb')
+        self.wav.setnchannels(channels)
+        self.wav.setsampwidth(2)
+        self.wav.setframerate(sample_rate)
+
+    def write(self, block):
+        self.wav.writeframes(to_pcm16(block, self.dither, self.rng).tobytes())
+
+    def close(self):
+        self.wav.close()
+
+    def abort(self):
+        """Stop writing and delete the partial file."""
+        try:
+            self.wav.close()
+        except (OSError, wave.Error):
+            pass
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def write_wav(path, samples, sample_rate, dither=False):
+    """Write float32 samples as a 16-bit PCM WAV, converting block by block."""
+    with WavWriter(path, sample_rate, samples.shape[1], dither) as writer:
+        for start in range(0, len(samples), BLOCK_FRAMES):
+            writer.write(samples[start:start + BLOCK_FRAMES])
+    return path
+
+# ffmpeg codec arguments and muxer for each delivery format
+ENCODERS = {
+    'wav': (['-acodec', 'pcm_s16le'], 'wav'),
+    'mp3': (['-acodec', 'libmp3lame', '-b:a', '192k'], 'mp3'),
+    'flac': (['-acodec', 'flac'], 'flac'),
+    'opus': (['-acodec', 'libopus', '-b:a', '128k', '-ar', '48000'], 'ogg'),
+    'aac': (['-acodec', 'aac', '-b:a', '192k'], 'adts'),
+}
+
+def output_format_for(path, output_format=None):
+    """Return the delivery format for `path` (from its extension unless given)."""
+    if output_format:
+        output_format = output_format.lower()
+    elif path == '-':
+        output_format = 'wav'
+    else:
+        output_format = os.path.splitext(path)[1].lstrip('.').lower() or 'wav'
+        output_format = {'ogg': 'opus'}.get(output_format, output_format)
+    if output_format not in ENCODERS:
+        raise ValueError(f"Unsupported output format: {output_format} (expected one of {', '.join(ENCODERS)})")
+    return output_format
+
+class FfmpegWriter:
+    """Pipe float32 blocks into an ffmpeg encoder writing `path` ('-' for stdout).
+
+    The mix is clipped once and sent as float PCM; ffmpeg does the quantization
+    and encoding, so no intermediate WAV is written or read back. For '-' the
+    encoder inherits file descriptor 1, so callers should keep their own
+    output off stdout while it runs.
+    """
+
+    def __init__(self, path, sample_rate, channels, output_format=None, bitrate=None):
+        self.path = path
+        self.output_format = output_format_for(path, output_format)
+        codec_args, muxer = ENCODERS[self.output_format]
+        codec_args = list(codec_args)
+        if bitrate and '-b:a' in codec_args:
+            codec_args[codec_args.index('-b:a') + 1] = bitrate
+        self.channels = channels
+        self.process = subprocess.Popen([
+            'ffmpeg', '-v', 'error', '-y',
+            '-f', 'f32le', '-ar', str(sample_rate), '-ac', str(channels),
+            '-i', 'pipe:0'
+        ] + codec_args + [
+            '-f', muxer,
+            'pipe:1' if path == '-' else path
+        ], stdin=subprocess.PIPE, stdout=None if path == '-' else subprocess.DEVNULL)
+        self.clipped = None
+
+    def write(self, block):
+        if self.clipped is None or len(self.clipped) < len(block):
+            self.clipped = np.empty((len(block), self.channels), dtype='<f4')
+        clipped = self.clipped[:len(block)]
+        np.clip(block, -1.0, 1.0, out=clipped)
+        self.process.stdin.write(clipped.tobytes())
+
+    def close(self):
+        if self.process.stdin.closed:
+            return
+        self.process.stdin.close()
+        returncode = self.process.wait()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, 'ffmpeg')
+
+    def abort(self):
+        """Kill the encoder and delete the partial file."""
+        if self.process.poll() is None:
+            self.process.kill()
+        self.process.wait()
+        try:
+            self.process.stdin.close()
+        except OSError:
+            pass
+        if self.path != '-' and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def open_writer(path, sample_rate, channels, output_format=None, dither=False, bitrate=None):
+    """Return a block writer for `path` in the delivery format.
+
+    WAV files are written directly with the wave module; other formats, and
+    anything sent to stdout ('-'), are encoded by a piped ffmpeg process.
+    """
+    output_format = output_format_for(path, output_format)
+    if output_format == 'wav' and path != '-':
+        return WavWriter(path, sample_rate, channels, dither)
+    return FfmpegWriter(path, sample_rate, channels, output_format, bitrate)
+
+def write_audio(path, samples, sample_rate, output_format=None, dither=False, bitrate=None):
+    """Write float32 samples to `path` ('-' for stdout) in the delivery format."""
+    with open_writer(path, sample_rate, samples.shape[1], output_format, dither, bitrate) as writer:
+        for start in range(0, len(samples), BLOCK_FRAMES):
+            writer.write(samples[start:start + BLOCK_FRAMES])
+    return path
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.audio_cache import load_audio
+from scripts.mixer import BLOCK_FRAMES, to_pcm16
+from scripts.publish import publish_file
+
+# Bump this when the fingerprint recipe changes so old entries stop matching
+FINGERPRINT_VERSION = 2
+
+# Canonical PCM format the voice sample is decoded to before hashing
+FINGERPRINT_SAMPLE_RATE = 44100
+FINGERPRINT_CHUNK_SIZE = 1 << 20
+
+def default_registry_path(so_vits_svc_dir):
+    """Return the default location of the model registry for a so-vits-svc checkout."""
+    return os.path.join(so_vits_svc_dir, 'logs', 'model_registry.json')
+
+def registered_model_dir(registry_path, fingerprint):
+    """Directory next to the registry holding the copies of a registered model and its config."""
+    return os.path.join(os.path.dirname(os.path.abspath(registry_path)), 'registry', fingerprint)
+
+def _hash_normalized_audio(voice_file, hasher):
+    """Feed the voice sample, decoded to mono 16-bit PCM, into `hasher`.
+
+    Decoding first means the same recording stored as MP3, M4A or WAV, or with
+    different tags, maps to the same key. The decode goes through the shared
+    audio cache, so training the sample afterwards does not decode it again.
+    Falls back to the raw file bytes if the sample cannot be decoded.
+
+    Returns:
+        str: 'pcm' if the decoded audio was hashed, 'raw' for the fallback.
+    """
+    try:
+        samples, _ = load_audio(voice_file, FINGERPRINT_SAMPLE_RATE, 1)
+    except (OSError, ValueError, subprocess.CalledProcessError) as e:
+        print(f"Warning: could not decode {voice_file} for fingerprinting: {str(e)}")
+        samples = None
+
+    if samples is not None:
+        pcm_hasher = hashlib.sha256()
+        for start in range(0, len(samples), BLOCK_FRAMES):
+            pcm_hasher.update(to_pcm16(samples[start:start + BLOCK_FRAMES], dither=False).tobytes())
+        hasher.update(b'pcm')
+        hasher.update(pcm_hasher.digest())
+        return 'pcm'
+
+    print("Warning: fingerprinting the raw voice sample bytes instead of the decoded audio")
+    hasher.update(b'raw')
+    with open(voice_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(FINGERPRINT_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return 'raw'
+
+def fingerprint_voice_sample(voice_file, training_config=None):
+    """Compute the registry key for a voice sample and a training configuration.
+
+    Args:
+        voice_file (str): Path to the voice sample.
+        training_config (dict): Everything that influences the trained weights
+            (see `scripts.train_model.training_config`). Must be JSON serializable.
+
+    Returns:
+        str: Hex digest identifying the (voice, config) pair.
+    """
+    if not os.path.exists(voice_file):
+        raise FileNotFoundError(f"Voice sample not found at {voice_file}")
+
+    hasher = hashlib.sha256()
+    hasher.update(f"v{FINGERPRINT_VERSION}".encode())
+    config_blob = json.dumps(training_config or {}, sort_keys=True, separators=(',', ':'))
+    hasher.update(hashlib.sha256(config_blob.encode('utf-8')).digest())
+    _hash_normalized_audio(voice_file, hasher)
+    return hasher.hexdigest()
+
+def _load_registry(registry_path):
+    if not os.path.exists(registry_path):
+        return {'version': FINGERPRINT_VERSION, 'models': {}}
+    with open(registry_path, 'r', encoding='utf-8') as f:
+        registry = json.load(f)
+    registry.setdefault('models', {})
+    return registry
+
+def _save_registry(registry_path, registry):
+    # Write to a temporary file and rename it so readers never see a half-written registry
+    registry_dir = os.path.dirname(os.path.abspath(registry_path))
+    os.makedirs(registry_dir, exist_ok=True)
+    tmp_path = f"{registry_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(registry, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, registry_path)
+
+def _checkpoint_stamp(model_path):
+    stat = os.stat(model_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def lookup_model(registry_path, fingerprint):
+    """Return the model and config registered for `fingerprint`, or None.
+
+    Entries whose files were deleted or changed since they were registered are
+    ignored, as are entries from before configs were stored with the model.
+
+    Returns:
+        tuple: (model_path, config_path), or None.
+    """
+    registry = _load_registry(registry_path)
+    entry = registry['models'].get(fingerprint)
+    if not entry:
+        return None
+
+    model_path = entry.get('model_path')
+    config_path = entry.get('config_path')
+    if not config_path:
+        print(f"Registered model {model_path} has no stored config, ignoring registry entry")
+        return None
+    for path in (model_path, config_path):
+        if not path or not os.path.exists(path):
+            print(f"Registered file {path} no longer exists, ignoring registry entry")
+            return None
+    if _checkpoint_stamp(model_path) != entry.get('checkpoint'):
+        print(f"Registered model {model_path} has changed since it was registered, ignoring registry entry")
+        return None
+    return model_path, config_path
+
+def register_model(registry_path, fingerprint, model_path, config_path, voice_file=None, training_config=None):
+    """Record `model_path` and its config as the trained model for `fingerprint`.
+
+    so-vits-svc rotates, resumes from and rewrites the checkpoints in its log
+    directory, and rewrites configs/config.json on every training run, so both
+    files are copied to `registered_model_dir` and the copies are registered.
+
+    Returns:
+        dict: The registry entry that was written.
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"Model file not found at {model_path}")
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"Config file not found at {config_path}")
+
+    model_dir = registered_model_dir(registry_path, fingerprint)
+    registered_model_path = os.path.join(model_dir, 'G.pth')
+    registered_config_path = os.path.join(model_dir, 'config.json')
+    # No hardlinks: train.py may rewrite its checkpoints and config in place
+    publish_file(model_path, registered_model_path, hardlink=False)
+    publish_file(config_path, registered_config_path, hardlink=False)
+
+    registry = _load_registry(registry_path)
+    entry = {
+        'model_path': registered_model_path,
+        'config_path': registered_config_path,
+        'checkpoint': _checkpoint_stamp(registered_model_path),
+        'trained_model_path': os.path.abspath(model_path),
+        'voice_sample': os.path.abspath(voice_file) if voice_file else None,
+        'training_config': training_config,
+        'registered_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+    registry['models'][fingerprint] = entry
+    _save_registry(registry_path, registry)
+    print(f"Registered model {model_path} under fingerprint {fingerprint[:12]} as {registered_model_path}")
+    return entry
+
+def main():
+    parser = argparse.ArgumentParser(description='Inspect the registry of trained voice models')
+    parser.add_argument('command', choices=['list', 'lookup'], help='List all registered models, or look up the model for a voice sample')
+    parser.add_argument('voice_file', nargs='?', help='Path to the voice sample (for lookup)')
+    parser.add_argument('-d', '--so-vits-svc-dir', default='so-vits-svc', help='Path to the so-vits-svc directory')
+    parser.add_argument('-r', '--registry', help='Path to the registry file (default: <so-vits-svc-dir>/logs/model_registry.json)')
+
+    args = parser.parse_args()
+    registry_path = args.registry or default_registry_path(args.so_vits_svc_dir)
+
+    try:
+        if args.command == 'list':
+            registry = _load_registry(registry_path)
+            for fingerprint, entry in sorted(registry['models'].items(), key=lambda item: item[1].get('registered_at', '')):
+                print(f"{fingerprint[:12]}  {entry.get('registered_at', '?')}  {entry['model_path']}  ({entry.get('voice_sample')})")
+            return 0
+
+        if not args.voice_file:
+            parser.error('lookup requires a voice_file')
+        from scripts.train_model import training_config
+        fingerprint = fingerprint_voice_sample(args.voice_file, training_config(args.so_vits_svc_dir))
+        registered = lookup_model(registry_path, fingerprint)
+        if not registered:
+            print(f"No registered model for {args.voice_file}")
+            return 1
+        model_path, config_path = registered
+        print(f'MODEL_PATH="{model_path}"')
+        print(f'CONFIG_PATH="{config_path}"')
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
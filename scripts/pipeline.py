@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Small memoized stage graph.
+
+A Stage names its inputs (file paths, or outputs of other stages), the
+parameters that influence its result, and a function that produces its output
+files. The cache key of a stage hashes its name, its parameters and the
+contents of its input files. When the key matches the one recorded in the
+state file and the recorded outputs are still on disk unchanged, the stage is
+skipped and its previous outputs are reused. Keys hash file contents, not
+timestamps, so a stage that re-runs and writes identical files does not
+invalidate the stages after it.
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.audio_cache import file_digest
+from scripts.metrics import measure, update_report
+
+# Bump this when the cache key recipe changes so old state stops matching
+STATE_VERSION = 1
+
+class Stage:
+    """One step of a Pipeline.
+
+    Args:
+        name (str): Unique stage name.
+        run (callable): run(inputs, params) -> dict mapping output names to
+            file paths. `inputs` maps input names to resolved paths.
+        inputs (dict): Input name -> file path, or (stage name, output name)
+            for an output of another stage. None values are passed through.
+        params (dict): JSON-serializable values that influence the outputs.
+        title (str): Heading printed when the stage runs (default: the name).
+        fallback (callable): fallback(inputs, params, error) -> outputs to use
+            when `run` raises. Fallback outputs are not recorded, so the stage
+            is tried again on the next run.
+    """
+
+    def __init__(self, name, run, inputs=None, params=None, title=None, fallback=None):
+        self.name = name
+        self.run = run
+        self.inputs = inputs or {}
+        self.params = params or {}
+        self.title = title or name
+        self.fallback = fallback
+
+    def dependencies(self):
+        return [ref[0] for ref in self.inputs.values() if isinstance(ref, tuple)]
+
+class Pipeline:
+    """Run stages in dependency order, skipping the ones whose inputs did not change.
+
+    Args:
+        state_path (str): JSON file recording the cache key and outputs of
+            every completed stage.
+        report_path (str): JSON performance report; when given, the wall time,
+            CPU time, peak RSS and I/O of every stage are recorded in it
+            (see scripts/metrics.py).
+        events (EventWriter): Receives a 'stage' event when each stage starts
+            and when it ends, with its status (see scripts/events.py).
+    """
+
+    def __init__(self, state_path, report_path=None, events=None):
+        self.state_path = state_path
+        self.report_path = report_path
+        self.events = events
+        self.stages = {}
+        self.state = self._load_state()
+
+    def add(self, stage):
+        if stage.name in self.stages:
+            raise ValueError(f"Duplicate pipeline stage: {stage.name}")
+        self.stages[stage.name] = stage
+        return stage
+
+    def order(self, targets=None):
+        """Return the stage names with every stage after the stages it depends on.
+
+        Args:
+            targets (list): Only include these stages and the stages they depend on.
+        """
+        order = []
+        done = set()
+
+        def visit(name, chain):
+            if name in done:
+                return
+            if name in chain:
+                raise ValueError(f"Pipeline stages form a cycle: {' -> '.join(chain + [name])}")
+            if name not in self.stages:
+                raise ValueError(f"Stage {chain[-1]} depends on unknown stage {name}")
+            for dependency in self.stages[name].dependencies():
+                visit(dependency, chain + [name])
+            done.add(name)
+            order.append(name)
+
+        for name in targets or self.stages:
+            if name not in self.stages:
+                raise ValueError(f"Unknown pipeline stage: {name}")
+            visit(name, [])
+        return order
+
+    def run(self, force=False, targets=None, outputs=None):
+        """Run the pipeline.
+
+        Args:
+            force (bool): Run every stage even if its cache key is unchanged.
+            targets (list): Only run these stages and the stages they depend on
+                (which are usually skipped as unchanged).
+            outputs (dict): Outputs of stages that already ran in this session
+                (as returned by an earlier `run`); those stages are not run again.
+
+        Returns:
+            dict: Stage name -> that stage's outputs (output name -> path).
+        """
+        outputs = dict(outputs or {})
+        for step, name in enumerate(self.order(targets), 1):
+            if name in outputs:
+                continue
+            print(f"\n===== STEP {step}: {self.stages[name].title.upper()} =====\n")
+            if self.events:
+                self.events.emit('stage', stage=name, status='started')
+            status = 'failed'
+            try:
+                with measure() as metrics:
+                    status = self._run_stage(self.stages[name], outputs, force)
+            finally:
+                if self.report_path:
+                    update_report(self.report_path, {name: dict(metrics, status=status)})
+                if self.events:
+                    self.events.emit('stage', stage=name, status=status)
+        return outputs
+
+    def _run_stage(self, stage, outputs, force):
+        """Run or skip one stage, adding its outputs to `outputs`. Returns 'skipped', 'run' or 'fallback'."""
+        name = stage.name
+        inputs = {key: self._resolve(stage, ref, outputs) for key, ref in stage.inputs.items()}
+        key = self.cache_key(stage, inputs)
+
+        recorded = self.state['stages'].get(name)
+        if not force and recorded and recorded['key'] == key and self._outputs_intact(recorded['outputs']):
+            print(f"Inputs unchanged since the last run, reusing the previous outputs of {name}")
+            outputs[name] = {output: entry['path'] for output, entry in recorded['outputs'].items()}
+            return 'skipped'
+
+        try:
+            result = stage.run(inputs, dict(stage.params))
+        except Exception as e:
+            if stage.fallback is None:
+                raise
+            print(f"Error during {stage.title.lower()}: {str(e)}")
+            outputs[name] = stage.fallback(inputs, dict(stage.params), e)
+            self.state['stages'].pop(name, None)
+            self._save_state()
+            return 'fallback'
+
+        outputs[name] = result
+        self.state['stages'][name] = {
+            'key': key,
+            'outputs': {output: dict(path=path, **_stamp(path)) for output, path in result.items()},
+            'completed_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        }
+        # Saved after every stage so an interrupted run keeps the finished stages
+        self._save_state()
+        return 'run'
+
+    def cache_key(self, stage, inputs):
+        """Hash of the stage name, its parameters and the contents of its inputs."""
+        blob = json.dumps({
+            'version': STATE_VERSION,
+            'stage': stage.name,
+            'params': stage.params,
+            'inputs': {name: self._digest(path) for name, path in inputs.items()},
+        }, sort_keys=True, separators=(',', ':'), default=str)
+        return hashlib.sha256(blob.encode('utf-8')).hexdigest()
+
+    def _resolve(self, stage, ref, outputs):
+        if not isinstance(ref, tuple):
+            return ref
+        upstream, output = ref
+        if output not in outputs[upstream]:
+            raise ValueError(f"Stage {stage.name} needs output {output!r} of {upstream}, which did not produce it")
+        return outputs[upstream][output]
+
+    def _digest(self, path):
+        if path is None:
+            return None
+        if not os.path.isfile(path):
+            return f"missing:{os.path.abspath(path)}"
+        # Content hashes are remembered across runs while the file's size and mtime are unchanged
+        stamp = _stamp(path)
+        memo = self.state['digests'].get(os.path.abspath(path))
+        if memo and memo['size'] == stamp['size'] and memo['mtime_ns'] == stamp['mtime_ns']:
+            return memo['sha256']
+        digest = file_digest(path)
+        self.state['digests'][os.path.abspath(path)] = dict(sha256=digest, **stamp)
+        return digest
+
+    def _outputs_intact(self, recorded_outputs):
+        for entry in recorded_outputs.values():
+            if not os.path.isfile(entry['path']):
+                return False
+            stamp = _stamp(entry['path'])
+            if stamp['size'] != entry['size'] or stamp['mtime_ns'] != entry['mtime_ns']:
+                return False
+        return True
+
+    def _load_state(self):
+        if os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get('version') == STATE_VERSION:
+                    state.setdefault('stages', {})
+                    state.setdefault('digests', {})
+                    return state
+            except (OSError, ValueError) as e:
+                print(f"Warning: ignoring unreadable pipeline state {self.state_path}: {str(e)}")
+        return {'version': STATE_VERSION, 'stages': {}, 'digests': {}}
+
+    def _save_state(self):
+        # Write to a temporary file and rename it so an interrupted run never leaves half a state file
+        state_dir = os.path.dirname(os.path.abspath(self.state_path))
+        os.makedirs(state_dir, exist_ok=True)
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.state, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.state_path)
+
+def _stamp(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
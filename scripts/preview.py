@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Fast preview render: the whole pipeline on a short excerpt of the song.
+
+The excerpt is the window with the most energy in the vocal band of the mid
+(L+R) channel, where lead vocals usually sit. It is separated with the faster
+single htdemucs model into WAV stems (no MP3 encode), converted, and merged
+into a small MP3, so the user hears their voice within seconds while the full
+render continues.
+"""
+
+import os
+import sys
+import argparse
+
+import numpy as np
+
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.separate_vocals import separate_vocals
+from scripts.convert_voice import convert_voice
+from scripts.merge_audio import merge_audio
+from scripts.audio_cache import load_audio
+from scripts.mixer import write_audio
+
+PREVIEW_SECONDS = 30.0
+
+# Reduced settings for the preview
+PREVIEW_DEMUCS_MODEL = 'htdemucs'
+PREVIEW_FORMAT = 'mp3'
+PREVIEW_BITRATE = '128k'
+
+# Band where the energy of a lead vocal is concentrated
+VOCAL_BAND_HZ = (300.0, 3400.0)
+
+def vocal_excerpt_start(samples, sample_rate, seconds=PREVIEW_SECONDS):
+    """Return the start frame of the `seconds`-long window with the most vocal-band energy."""
+    from scipy.signal import butter, sosfilt
+    
+    window = int(seconds * sample_rate)
+    if len(samples) <= window:
+        return 0
+    mid = samples @ np.full(samples.shape[1], 1.0 / samples.shape[1], dtype=np.float32)
+    sos = butter(4, VOCAL_BAND_HZ, btype='bandpass', fs=sample_rate, output='sos')
+    band = sosfilt(sos, mid)
+    energy = np.concatenate([[0.0], np.cumsum(band * band)])
+    return int(np.argmax(energy[window:] - energy[:-window]))
+
+def extract_excerpt(input_file, output_file, seconds=PREVIEW_SECONDS):
+    """Write the most vocal `seconds` of `input_file` to `output_file` (WAV).
+
+    Returns:
+        float: Start of the excerpt in the song, in seconds.
+    """
+    samples, sample_rate = load_audio(input_file)
+    start = vocal_excerpt_start(samples, sample_rate, seconds)
+    write_audio(output_file, samples[start:start + int(seconds * sample_rate)], sample_rate)
+    return start / sample_rate
+
+def render_preview(input_song, output_dir, voice_sample=None, model_path=None, config_path=None,
+                   so_vits_svc_dir=None, seconds=PREVIEW_SECONDS):
+    """Separate, convert and merge only an excerpt of `input_song`.
+
+    Args:
+        input_song (str): Path to the input song file.
+        output_dir (str): Directory where the preview files will be saved.
+        voice_sample (str): Path to the voice sample file (if None, skip conversion).
+        model_path (str): Path to the trained model (if None, skip conversion).
+        config_path (str): Path to the model configuration file.
+        so_vits_svc_dir (str): Path to the so-vits-svc directory.
+        seconds (float): Length of the excerpt.
+
+    Returns:
+        dict: 'preview' (path to the preview MP3) and 'preview_start' (seconds into the song).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    print(f"Selecting the {seconds:g} most vocal seconds of {input_song}...")
+    excerpt_path = os.path.join(output_dir, "preview_excerpt.wav")
+    start = extract_excerpt(input_song, excerpt_path, seconds)
+    print(f"Preview excerpt starts at {start:.1f} s")
+
+    tracks = separate_vocals(excerpt_path, os.path.join(output_dir, "separated"), PREVIEW_DEMUCS_MODEL, mp3=False)
+    vocals_path = tracks.get("vocals")
+    instrumental_path = tracks.get("instrumental", tracks.get("accompaniment"))
+    if not vocals_path or not instrumental_path:
+        raise ValueError("Preview separation did not produce vocals and instrumental tracks")
+
+    converted_vocals_path = vocals_path
+    if model_path and voice_sample:
+        converted_vocals_path = convert_voice(vocals_path, model_path, config_path,
+                                              os.path.abspath(os.path.join(output_dir, "preview_converted_vocals.wav")),
+                                              so_vits_svc_dir)
+
+    preview_path = os.path.join(output_dir, f"preview.{PREVIEW_FORMAT}")
+    merge_audio(converted_vocals_path, instrumental_path, preview_path, bitrate=PREVIEW_BITRATE,
+                reference_vocal_file=vocals_path if converted_vocals_path != vocals_path else None)
+    return {"preview": preview_path, "preview_start": start}
+
+def main():
+    parser = argparse.ArgumentParser(description='Render a short preview of the voice conversion')
+    parser.add_argument('input_song', help='Path to the input song file')
+    parser.add_argument('--voice-sample', help='Path to the voice sample file')
+    parser.add_argument('-m', '--model-path', help='Path to the trained model')
+    parser.add_argument('-c', '--config-path', default='configs/config.json', help='Path to the model configuration file')
+    parser.add_argument('-o', '--output-dir', default='output/preview', help='Directory where the preview files will be saved')
+    parser.add_argument('-d', '--so-vits-svc-dir', default='so-vits-svc', help='Path to the so-vits-svc directory')
+    parser.add_argument('--seconds', type=float, default=PREVIEW_SECONDS, help='Length of the preview excerpt')
+
+    args = parser.parse_args()
+
+    try:
+        result = render_preview(args.input_song, args.output_dir, args.voice_sample, args.model_path,
+                                args.config_path, args.so_vits_svc_dir, args.seconds)
+        # Print the preview path to stdout for the TypeScript code to capture
+        print(f'PREVIEW_PATH="{result["preview"].replace(os.sep, "/")}"')
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
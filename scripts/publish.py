@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Publish artifacts into an output directory without duplicating their bytes.
+
+`publish_file` tries, in order:
+- an atomic rename, when the source is an intermediate file the caller owns;
+- a hardlink;
+- a reflink, i.e. a copy-on-write clone on filesystems such as Btrfs and XFS.
+
+It copies only when none of these is possible, e.g. across devices. The
+destination is always replaced atomically, so readers never see a partial
+file. `update_manifest` records where each artifact came from and how it was
+published.
+"""
+
+import os
+import sys
+import json
+import time
+import errno
+import shutil
+import argparse
+import tempfile
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; reflinks are skipped there
+    fcntl = None
+
+# ioctl(dest_fd, FICLONE, src_fd) clones a whole file on Linux
+FICLONE = 0x40049409
+
+MANIFEST_FILE = 'manifest.json'
+
+def _reflink(source, destination):
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, "Reflinks are not supported on this platform")
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+
+def publish_file(source, destination, move=False, hardlink=True):
+    """Make `source` available at `destination` as cheaply as the filesystem allows.
+
+    Args:
+        source (str): File to publish.
+        destination (str): Path to publish it at; replaced if it exists.
+        move (bool): The source is an intermediate file that is no longer
+            needed at its old path, so it may be renamed into place.
+        hardlink (bool): Allow a hardlink. Disable it when either path may
+            later be rewritten in place, which would change both.
+
+    Returns:
+        str: How the file was published: 'same', 'rename', 'hardlink', 'reflink' or 'copy'.
+    """
+    if not os.path.isfile(source):
+        raise FileNotFoundError(f"Artifact not found: {source}")
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        if move and os.path.abspath(source) != os.path.abspath(destination):
+            os.remove(source)
+        return 'same'
+
+    destination_dir = os.path.dirname(os.path.abspath(destination))
+    os.makedirs(destination_dir, exist_ok=True)
+
+    if move:
+        try:
+            os.replace(source, destination)
+            return 'rename'
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+
+    # Build the new file under a temporary name next to the destination, then rename it over
+    fd, temp_path = tempfile.mkstemp(dir=destination_dir, prefix='.publish_', suffix='.tmp')
+    os.close(fd)
+    os.remove(temp_path)
+    try:
+        method = None
+        if hardlink and not move:
+            try:
+                os.link(source, temp_path)
+                method = 'hardlink'
+            except OSError:
+                pass
+        if method is None:
+            try:
+                _reflink(source, temp_path)
+                method = 'reflink'
+            except OSError:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        if method is None:
+            shutil.copy2(source, temp_path)
+            method = 'copy'
+        os.replace(temp_path, destination)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    if move:
+        os.remove(source)
+    return method
+
+def update_manifest(output_dir, artifacts):
+    """Record artifacts in `<output_dir>/manifest.json`, keeping the entries of other artifacts.
+
+    Args:
+        output_dir (str): Directory the artifacts were published to.
+        artifacts (dict): Artifact name -> dict with at least 'path', and
+            optionally 'source' and 'method' (as returned by `publish_file`).
+
+    Returns:
+        str: Path to the manifest.
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    manifest = {'artifacts': {}}
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            manifest.setdefault('artifacts', {})
+        except (OSError, ValueError) as e:
+            print(f"Warning: rewriting unreadable manifest {manifest_path}: {str(e)}")
+            manifest = {'artifacts': {}}
+
+    for name, artifact in artifacts.items():
+        entry = dict(artifact)
+        entry['path'] = os.path.abspath(artifact['path'])
+        if entry.get('source'):
+            entry['source'] = os.path.abspath(entry['source'])
+        if os.path.exists(entry['path']):
+            entry['size'] = os.path.getsize(entry['path'])
+        entry['published_at'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+        manifest['artifacts'][name] = entry
+
+    os.makedirs(output_dir, exist_ok=True)
+    # Write to a temporary file and rename it so readers never see a half-written manifest
+    tmp_path = f"{manifest_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+    return manifest_path
+
+def main():
+    parser = argparse.ArgumentParser(description='Publish a file without copying its bytes where the filesystem allows it')
+    parser.add_argument('source', help='File to publish')
+    parser.add_argument('destination', help='Path to publish it at')
+    parser.add_argument('--move', action='store_true', help='Rename the source into place instead of linking it')
+    parser.add_argument('--no-hardlink', action='store_true', help='Only use reflinks or copies')
+
+    args = parser.parse_args()
+
+    try:
+        method = publish_file(args.source, args.destination, move=args.move, hardlink=not args.no_hardlink)
+        print(f"Published {args.source} to {args.destination} ({method})")
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
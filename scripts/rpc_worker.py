@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Long-lived JSON-RPC 2.0 worker exposing the pipeline stages.
+
+The web services used to spawn a fresh `python scripts/<stage>.py` per request
+and pay for Python, NumPy and torch imports every time. This worker is started
+once per worker slot and serves requests one after another, so imported
+modules and the Demucs models loaded by separation stay warm between
+requests. Conversion and training still run so-vits-svc's own scripts in a
+child process, which load their models again for every request.
+
+Messages are newline-delimited JSON-RPC 2.0 objects, read from stdin and
+written to stdout, or exchanged over a Unix socket with --socket. While a
+stage method runs, its events (see scripts/events.py) are sent as 'event'
+notifications whose params carry the event and the `request_id`. At startup
+the original stdout is set aside for the protocol, and fd 1 is pointed at
+stderr. Stage output, such as prints, progress lines and child processes,
+therefore goes to stderr and cannot corrupt the protocol stream.
+
+Methods:
+    separate(input_file, output_dir, model_name='htdemucs_ft', mp3=True) -> {track name: path}
+    convert(vocal_file, model_path, config_path, output_file, so_vits_svc_dir) -> {'output_file'}
+    merge(vocal_file, instrumental_file, output_file, **options) -> {'output_file'}
+    train(voice_file, model_name, so_vits_svc_dir, **options) -> {'model_path'}
+    create_job(artifacts=None) -> {'job_id', 'workspace', 'paths': {artifact name: exact path}}
+    release_job(job_id) -> null
+    ping() -> {'pid'}
+    shutdown() -> null, then the worker exits
+
+Requests are handled one at a time: separation and training patch
+process-wide state (tqdm, the working directory), so they must not
+run concurrently in one process. Run one worker per slot for parallelism.
+Concurrent requests keep their files apart by working in a job workspace (see
+scripts/workspace.py): create_job allocates one, the stage methods are given
+paths inside it, and release_job removes it. Jobs are directories, so any
+worker can release them.
+"""
+
+import os
+import sys
+import json
+import socket
+import argparse
+import traceback
+
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.events import EventWriter, reserve_stdout
+from scripts.workspace import Workspace, prune_workspaces
+
+# JSON-RPC 2.0 error codes
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+STAGE_ERROR = -32000
+
+class _Shutdown(Exception):
+    pass
+
+class _RequestEvents(EventWriter):
+    """Send a request's events to the client as JSON-RPC 'event' notifications."""
+
+    def __init__(self, stream, request_id):
+        super().__init__(stream)
+        self.request_id = request_id
+
+    def format(self, record):
+        return json.dumps({'jsonrpc': '2.0', 'method': 'event', 'params': dict(record, request_id=self.request_id)},
+                          default=str)
+
+def _separate(input_file, output_dir, model_name='htdemucs_ft', mp3=True, events=None):
+    from scripts.separate_vocals import separate_vocals
+    return separate_vocals(input_file, output_dir, model_name, mp3, events=events)
+
+def _convert(vocal_file, model_path, config_path, output_file, so_vits_svc_dir, events=None):
+    from scripts.convert_voice import convert_voice
+    return {'output_file': convert_voice(vocal_file, model_path, config_path, output_file, so_vits_svc_dir, events=events)}
+
+def _merge(vocal_file, instrumental_file, output_file, **options):
+    from scripts.merge_audio import merge_audio
+    if output_file == '-':
+        raise ValueError("The worker's stdout carries the protocol; merge to a file instead of '-'")
+    return {'output_file': merge_audio(vocal_file, instrumental_file, output_file, **options)}
+
+def _train(voice_file, model_name, so_vits_svc_dir, events=None, **options):
+    from scripts.train_model import train_voice_model
+    options.setdefault('telemetry', events)
+    return {'model_path': train_voice_model(voice_file, model_name, so_vits_svc_dir, **options)}
+
+def _create_job(artifacts=None):
+    workspace = Workspace()
+    try:
+        paths = workspace.paths(artifacts or [])
+    except Exception:
+        workspace.cleanup()
+        raise
+    return {'job_id': workspace.job_id, 'workspace': workspace.dir, 'paths': paths}
+
+def _release_job(job_id):
+    Workspace(job_id).cleanup()
+
+def _ping():
+    return {'pid': os.getpid()}
+
+def _shutdown():
+    raise _Shutdown()
+
+METHODS = {
+    'separate': _separate,
+    'convert': _convert,
+    'merge': _merge,
+    'train': _train,
+    'create_job': _create_job,
+    'release_job': _release_job,
+    'ping': _ping,
+    'shutdown': _shutdown,
+}
+
+# Methods whose progress is forwarded to the client as 'event' notifications
+EVENT_METHODS = {'separate', 'convert', 'merge', 'train'}
+
+def _error(request_id, code, message, data=None):
+    error = {'code': code, 'message': message}
+    if data is not None:
+        error['data'] = data
+    return {'jsonrpc': '2.0', 'id': request_id, 'error': error}
+
+def handle_request(line, writer=None):
+    """Handle one JSON-RPC message.
+
+    Args:
+        line (str): The message.
+        writer (file): Protocol stream; the events of a stage method are sent
+            to it as notifications while the method runs.
+
+    Returns:
+        tuple: (response dict, or None for notifications; True if the worker should exit).
+    """
+    try:
+        request = json.loads(line)
+    except ValueError as e:
+        return _error(None, PARSE_ERROR, f"Parse error: {str(e)}"), False
+    if not isinstance(request, dict) or request.get('jsonrpc') != '2.0' or not isinstance(request.get('method'), str):
+        return _error(request.get('id') if isinstance(request, dict) else None, INVALID_REQUEST, "Invalid request"), False
+
+    request_id = request.get('id')
+    method = METHODS.get(request['method'])
+    if method is None:
+        response = _error(request_id, METHOD_NOT_FOUND, f"Method not found: {request['method']}")
+        return (response if 'id' in request else None), False
+
+    params = request.get('params') or {}
+    if writer is not None and 'id' in request and request['method'] in EVENT_METHODS and isinstance(params, dict):
+        params = dict(params, events=_RequestEvents(writer, request_id))
+    shutdown = False
+    try:
+        if isinstance(params, list):
+            result = method(*params)
+        elif isinstance(params, dict):
+            result = method(**params)
+        else:
+            raise TypeError("params must be an array or an object")
+        response = {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+    except _Shutdown:
+        response = {'jsonrpc': '2.0', 'id': request_id, 'result': None}
+        shutdown = True
+    except TypeError as e:
+        # Most likely wrong or missing parameters; the traceback goes to stderr either way
+        traceback.print_exc()
+        response = _error(request_id, INVALID_PARAMS, str(e))
+    except Exception as e:
+        traceback.print_exc()
+        response = _error(request_id, STAGE_ERROR, str(e), {'type': type(e).__name__})
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+
+    # Notifications (no id) get no response
+    return (response if 'id' in request else None), shutdown
+
+def serve(reader, writer):
+    """Serve requests from the `reader` lines, writing responses to `writer`, until EOF or shutdown.
+
+    Returns:
+        bool: True if a shutdown request was received.
+    """
+    for line in reader:
+        if not line.strip():
+            continue
+        response, shutdown = handle_request(line, writer)
+        if response is not None:
+            writer.write(json.dumps(response, default=str) + '\n')
+            writer.flush()
+        if shutdown:
+            return True
+    return False
+
+def serve_socket(socket_path):
+    """Accept connections on a Unix socket and serve them one at a time."""
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen()
+    print(f"Worker {os.getpid()} listening on {socket_path}", file=sys.stderr)
+    try:
+        while True:
+            connection, _ = server.accept()
+            with connection, connection.makefile('r', encoding='utf-8') as reader, \
+                    connection.makefile('w', encoding='utf-8') as writer:
+                if serve(reader, writer):
+                    return
+    finally:
+        server.close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the pipeline stages over JSON-RPC (stdio or a Unix socket)')
+    parser.add_argument('--socket', help='Listen on this Unix socket path instead of stdin/stdout')
+
+    args = parser.parse_args()
+
+    try:
+        # Workspaces of jobs whose caller died without releasing them
+        removed = prune_workspaces()
+        if removed:
+            print(f"Removed {len(removed)} abandoned job workspace(s)", file=sys.stderr)
+        if args.socket:
+            reserve_stdout()
+            serve_socket(args.socket)
+        else:
+            protocol = reserve_stdout()
+            serve(sys.stdin, protocol)
+        return 0
+    except KeyboardInterrupt:
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -4,14 +4,19 @@
 import os
 import sys
 import argparse
-import demucs.separate
-import tqdm
 import logging
-import shutil
 import time
 import re
 from pathlib import Path
 
+import numpy as np
+
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.audio_cache import load_audio
+from scripts.events import EVENT_MODES, open_stdout_events
+from scripts.mixer import write_audio
+
 # Configure logging to show progress
 logging.basicConfig(level=logging.INFO, format='%(message)s')
 
@@ -23,69 +28,108 @@ def sanitize_path(path):
     # Convert to Path object and back to string to normalize
     return str(Path(path))
 
-def separate_vocals(input_file, output_dir):
+# Demucs models loaded in this process, by name; a long-lived worker loads each one once
+_models = {}
+
+def load_model(model_name='htdemucs_ft'):
+    """Return the Demucs model `model_name`, loading it on first use."""
+    from demucs.pretrained import get_model
+    
+    if model_name not in _models:
+        print(f"Loading Demucs model {model_name}...")
+        model = get_model(model_name)
+        model.cpu()
+        model.eval()
+        _models[model_name] = model
+    return _models[model_name]
+
+def separate_stems(input_file, model_name='htdemucs_ft', device=None, shifts=1, overlap=0.25):
+    """Run Demucs on a song and return its stems as arrays.
+    
+    Args:
+        input_file (str): Path to the input audio file.
+        model_name (str): Demucs model.
+        device (str): Torch device to separate on (default: CUDA if available, else CPU).
+        shifts (int): Random shifts averaged per prediction (more is slower and slightly better).
+        overlap (float): Overlap between the chunks the song is split into.
+    
+    Returns:
+        tuple: (stems, sample_rate) where stems maps each source of the model
+        ('vocals', 'drums', 'bass', 'other', ...) to a float32 array of shape (frames, channels).
+    """
+    # Imported here so the other stages and `--help` do not pay for loading torch
+    import torch
+    from demucs.apply import apply_model
+    
+    device = device or ('cuda' if torch.cuda.is_available() else 'cpu')
+    model = load_model(model_name)
+    samples, sample_rate = load_audio(input_file, model.samplerate, model.audio_channels)
+    
+    # Same normalization as the Demucs command line
+    wav = np.ascontiguousarray(samples.T)
+    ref = wav.mean(axis=0)
+    mean, std = ref.mean(), ref.std() or 1.0
+    wav = (wav - mean) / std
+    
+    with torch.no_grad():
+        sources = apply_model(model, torch.from_numpy(wav)[None], device=device, shifts=shifts, split=True,
+                              overlap=overlap, progress=True)[0]
+    sources = sources.cpu().numpy() * std + mean
+    return {name: np.ascontiguousarray(sources[index].T, dtype=np.float32)
+            for index, name in enumerate(model.sources)}, sample_rate
+
+def _rescale(samples):
+    # Like Demucs' default clip mode: scale the stem down instead of clipping it
+    peak = float(np.abs(samples).max()) if len(samples) else 0.0
+    return samples / max(1.01 * peak, 1.0)
+
+def separate_vocals(input_file, output_dir, model_name='htdemucs_ft', mp3=True, events=None):
     """
     Separate vocals from a song using Demucs.
     
+    The stems are written to `<output_dir>/<model_name>/<song name>/`, as
+    `vocals` and `no_vocals` (everything but the vocals).
+    
     Args:
         input_file (str): Path to the input audio file.
         output_dir (str): Directory where separated tracks will be saved.
+        model_name (str): Demucs model. htdemucs_ft (a bag of four fine-tuned models)
+            gives the best vocals; htdemucs is about four times faster.
+        mp3 (bool): Save the stems as 320 kbps MP3 instead of WAV.
+        events (EventWriter): Receives 'progress' events (see scripts/events.py).
     
     Returns:
-        dict: Paths to all separated tracks (vocals, instrumental, drums, bass, etc.).
+        dict: Paths of the separated tracks ('vocals' and 'instrumental').
     """
+    # Imported here so the other stages and `--help` do not pay for loading it
+    import tqdm
+    
+    def progress(percent, message):
+        print(f"PROGRESS:{percent}:{message}")
+        if events:
+            events.emit('progress', stage='separate', percent=percent, message=message)
+    
     # Sanitize and normalize paths
     input_file = sanitize_path(input_file)
     output_dir = sanitize_path(output_dir)
     
-    # Print debug info
-    print(f"DEBUG: Input file path: {input_file}")
-    print(f"DEBUG: Output directory path: {output_dir}")
-    print(f"DEBUG: Input file exists: {os.path.exists(input_file)}")
-    
-    # Ensure output directory exists
-    os.makedirs(output_dir, exist_ok=True)
+    if not os.path.exists(input_file):
+        raise FileNotFoundError(f"Input file not found: {input_file}")
     
     # Get the song name without extension
     song_name = os.path.basename(input_file)
     song_name = os.path.splitext(song_name)[0]
-    print(f"DEBUG: Song name: {song_name}")
-    
-    # Call demucs to separate the audio
-    print(f"Separating vocals from {input_file}...")
-    print(f"PROGRESS:0:Initializing")
-    
-    # Store original argv
-    original_argv = sys.argv.copy()
     
-    # Use custom arguments for demucs
-    # Use htdemucs_ft model which is optimized for vocals
-    # Specify two stems (vocals and accompaniment)
-    sys.argv = [
-        'demucs.separate',
-        '--verbose',
-        '--two-stems', 'vocals',
-        '-n', 'htdemucs_ft',  # Use -n for model name instead of --model
-        '--mp3',
-        '--mp3-bitrate', '320',
-        input_file,
-        '-o', output_dir
-    ]
+    # The exact paths of the stems are known up front
+    stem_dir = os.path.abspath(os.path.join(output_dir, model_name, song_name))
+    os.makedirs(stem_dir, exist_ok=True)
+    ext = 'mp3' if mp3 else 'wav'
+    vocals_path = os.path.join(stem_dir, f'vocals.{ext}')
+    instrumental_path = os.path.join(stem_dir, f'no_vocals.{ext}')
     
-    # Store the model name for later use
-    model_name = 'htdemucs_ft'
-    print(f"DEBUG: Demucs command: {' '.join(sys.argv)}")
-    
-    # Store the output name for later use
-    # With -n htdemucs_ft, the output will be in a directory named htdemucs_ft
-    # The subdirectory will be named after the input file
-    expected_output_dir = os.path.join(output_dir, model_name, song_name)
-    print(f"DEBUG: Expected output directory: {expected_output_dir}")
-    
-    # Make sure expected_output_dir is a valid path
-    if not os.path.isabs(expected_output_dir):
-        expected_output_dir = os.path.abspath(expected_output_dir)
-    print(f"DEBUG: Absolute expected output directory: {expected_output_dir}")
+    # Call demucs to separate the audio
+    print(f"Separating vocals from {input_file} with {model_name}...")
+    progress(0, "Initializing")
     
     # Store original tqdm class
     original_tqdm = tqdm.tqdm
@@ -118,176 +162,41 @@ def separate_vocals(input_file, output_dir):
                     print(f"\r{percentage}%|{bar}| {self.n}/{self.total} - {process_info}", end="")
                     
                     # Print progress for front-end
-                    print(f"\nPROGRESS:{percentage}:{process_info}")
+                    print()
+                    progress(percentage, process_info)
     
-    # Replace tqdm with our custom version
+    # Replace tqdm with our custom version (Demucs looks it up on every call)
     tqdm.tqdm = CustomTqdm
     
     try:
         # Run demucs
-        demucs.separate.main()
+        stems, sample_rate = separate_stems(input_file, model_name)
     except Exception as e:
         print(f"\nError during separation: {str(e)}")
         raise
     finally:
-        # Restore original tqdm and argv
+        # Restore original tqdm
         tqdm.tqdm = original_tqdm
-        sys.argv = original_argv
     
     print("\n")
-    print(f"PROGRESS:90:Finding output files")
-    
-    # Expected output directory structure
-    print(f"DEBUG: Expected output directory: {expected_output_dir}")
-    print(f"DEBUG: Output directory exists: {os.path.exists(expected_output_dir)}")
-    
-    # Check if the expected output directory exists, if not, try to find the actual output directory
-    if not os.path.exists(expected_output_dir):
-        # Try to find the actual output directory
-        print(f"Expected output directory not found, searching for alternatives...")
-        # Check if there's a directory named with the model name in the output directory
-        model_dir = os.path.join(output_dir, model_name)
-        if os.path.exists(model_dir):
-            print(f"Found {model_name} directory: {model_dir}")
-            # List subdirectories
-            subdirs = [d for d in os.listdir(model_dir) if os.path.isdir(os.path.join(model_dir, d))]
-            print(f"Subdirectories in {model_name}: {subdirs}")
-            if subdirs:
-                # Use the first subdirectory
-                expected_output_dir = os.path.join(model_dir, subdirs[0])
-                print(f"Using alternative output directory: {expected_output_dir}")
-        else:
-            # Check if there's a directory named 'htdemucs' in the output directory
-            htdemucs_dir = os.path.join(output_dir, 'htdemucs')
-            if os.path.exists(htdemucs_dir):
-                print(f"Found htdemucs directory: {htdemucs_dir}")
-                # List subdirectories
-                subdirs = [d for d in os.listdir(htdemucs_dir) if os.path.isdir(os.path.join(htdemucs_dir, d))]
-                print(f"Subdirectories in htdemucs: {subdirs}")
-                if subdirs:
-                    # Use the first subdirectory
-                    expected_output_dir = os.path.join(htdemucs_dir, subdirs[0])
-                    print(f"Using alternative output directory: {expected_output_dir}")
+    progress(90, "Writing stems")
     
-    # Initialize paths
-    vocals_path = None
-    instrumental_path = None
-    other_tracks = {}
+    # Two stems: the vocals, and everything else summed
+    vocals = stems.pop('vocals')
+    instrumental = np.sum(list(stems.values()), axis=0, dtype=np.float32)
+    write_audio(vocals_path, _rescale(vocals), sample_rate, ext, bitrate='320k')
+    write_audio(instrumental_path, _rescale(instrumental), sample_rate, ext, bitrate='320k')
     
-    # Get the paths to the separated tracks based on the output name
-    if os.path.exists(expected_output_dir) and os.path.isdir(expected_output_dir):
-        vocals_path = os.path.join(expected_output_dir, 'vocals.mp3')
-        if not os.path.exists(vocals_path):
-            vocals_path = os.path.join(expected_output_dir, 'vocals.wav')
-        
-        instrumental_path = os.path.join(expected_output_dir, 'accompaniment.mp3')
-        if not os.path.exists(instrumental_path):
-            instrumental_path = os.path.join(expected_output_dir, 'no_vocals.mp3')
-        if not os.path.exists(instrumental_path):
-            instrumental_path = os.path.join(expected_output_dir, 'accompaniment.wav')
-        if not os.path.exists(instrumental_path):
-            instrumental_path = os.path.join(expected_output_dir, 'no_vocals.wav')
-    
-    print(f"DEBUG: Expected vocals path: {vocals_path}")
-    print(f"DEBUG: Vocals file exists: {os.path.exists(vocals_path) if vocals_path else False}")
-    print(f"DEBUG: Expected instrumental path: {instrumental_path}")
-    print(f"DEBUG: Instrumental file exists: {os.path.exists(instrumental_path) if instrumental_path else False}")
-    
-    # If files not found, search more extensively
-    if not vocals_path or not instrumental_path or not os.path.exists(vocals_path) or not os.path.exists(instrumental_path):
-        print(f"PROGRESS:95:Searching for output files")
-        print(f"Files not found at expected locations, searching more extensively...")
-        
-        # List all audio files in the output directory
-        found_files = []
-        for root, _, files in os.walk(output_dir):
-            for file in files:
-                if file.endswith(('.wav', '.mp3')):
-                    found_files.append(os.path.join(root, file))
-        
-        print(f"DEBUG: Found {len(found_files)} audio files in output directory")
-        for file in found_files:
-            print(f"DEBUG: Found file: {file}")
-        
-        if found_files:
-            # Try to identify vocals and instrumental
-            for file_path in found_files:
-                file_name = os.path.basename(file_path).lower()
-                if 'vocals' in file_name:
-                    vocals_path = file_path
-                    print(f"DEBUG: Selected vocals file: {vocals_path}")
-                elif any(name in file_name for name in ['no_vocals', 'accompaniment']):
-                    instrumental_path = file_path
-                    print(f"DEBUG: Selected instrumental file: {instrumental_path}")
-                elif 'drums' in file_name:
-                    other_tracks['drums'] = file_path
-                    print(f"DEBUG: Selected drums file: {file_path}")
-                elif 'bass' in file_name:
-                    other_tracks['bass'] = file_path
-                    print(f"DEBUG: Selected bass file: {file_path}")
-                elif 'other' in file_name:
-                    other_tracks['other'] = file_path
-                    print(f"DEBUG: Selected other file: {file_path}")
-    
-    # If still not found, try to create them from the original
-    if not vocals_path or not instrumental_path or not os.path.exists(vocals_path) or not os.path.exists(instrumental_path):
-        # Create a directory for our custom output
-        custom_output_dir = os.path.join(output_dir, 'custom')
-        os.makedirs(custom_output_dir, exist_ok=True)
-        print(f"DEBUG: Created custom output directory: {custom_output_dir}")
-        
-        # If we have at least one file, we can use it
-        if vocals_path and os.path.exists(vocals_path) and (not instrumental_path or not os.path.exists(instrumental_path)):
-            instrumental_path = os.path.join(custom_output_dir, 'accompaniment.wav')
-            # Copy vocals as a placeholder
-            shutil.copy(vocals_path, instrumental_path)
-            print(f"Warning: Created dummy instrumental track at {instrumental_path}")
-        elif instrumental_path and os.path.exists(instrumental_path) and (not vocals_path or not os.path.exists(vocals_path)):
-            vocals_path = os.path.join(custom_output_dir, 'vocals.wav')
-            # Copy instrumental as a placeholder
-            shutil.copy(instrumental_path, vocals_path)
-            print(f"Warning: Created dummy vocals track at {vocals_path}")
-        else:
-            # If we have no files at all, we need to report the error
-            print(f"No output files found in {output_dir}")
-            raise FileNotFoundError(f"No output files found in {output_dir}")
-    
-    # Look for other tracks (drums, bass, etc.) if not already found
-    possible_tracks = ['drums', 'bass', 'other']
-    # Only search for other tracks if expected_output_dir exists and is accessible
-    if os.path.exists(expected_output_dir) and os.path.isdir(expected_output_dir):
-        for track in possible_tracks:
-            if track not in other_tracks:
-                track_path = os.path.join(expected_output_dir, f'{track}.mp3')
-                if not os.path.exists(track_path):
-                    track_path = os.path.join(expected_output_dir, f'{track}.wav')
-                if os.path.exists(track_path):
-                    other_tracks[track] = track_path
-                    print(f"Found {track} track: {track_path}")
-    
-    # Create a dictionary with all tracks
-    all_tracks = {}
-    if vocals_path and os.path.exists(vocals_path):
-        all_tracks['vocals'] = vocals_path
-    if instrumental_path and os.path.exists(instrumental_path):
-        all_tracks['instrumental'] = instrumental_path
-    # Add other tracks
-    for track_name, track_path in other_tracks.items():
-        if track_path and os.path.exists(track_path):
-            all_tracks[track_name] = track_path
+    all_tracks = {'vocals': vocals_path, 'instrumental': instrumental_path}
     
     # Print all found tracks
-    print("\nFound the following separated tracks:")
+    print("\nSeparated tracks:")
     for track_name, track_path in all_tracks.items():
         print(f"- {track_name}: {track_path}")
     
-    # Check if we have any tracks at all
-    if not all_tracks:
-        raise FileNotFoundError(f"No separated audio files found in {output_dir}")
-    
-    print(f"PROGRESS:100:Separation complete")
-    print(f"Vocals file: {all_tracks.get('vocals', 'Not found')}")
-    print(f"Instrumental file: {all_tracks.get('instrumental', 'Not found')}")
+    progress(100, "Separation complete")
+    print(f"Vocals file: {all_tracks['vocals']}")
+    print(f"Instrumental file: {all_tracks['instrumental']}")
     
     # Print the output paths in a format that can be easily parsed by the calling code
     # Use double quotes to ensure proper parsing in TypeScript
@@ -296,11 +205,6 @@ def separate_vocals(input_file, output_dir):
     if 'instrumental' in all_tracks:
         print(f'INSTRUMENTAL_PATH="{all_tracks["instrumental"].replace("\\", "/")}"')
     
-    # Also print paths for other tracks if available
-    for track_name, track_path in other_tracks.items():
-        if os.path.exists(track_path):
-            print(f'{track_name.upper()}_PATH="{track_path.replace("\\", "/")}"')
-    
     # Return the paths to all separated files
     return all_tracks
 
@@ -310,11 +214,23 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Separate vocals from a song using Demucs.")
     parser.add_argument("input_file", help="Path to the input audio file")
     parser.add_argument("--output_dir", "-o", default="separated", help="Directory where separated tracks will be saved")
+    parser.add_argument("--model", "-n", default="htdemucs_ft", help="Demucs model (htdemucs is faster, htdemucs_ft gives better vocals)")
+    parser.add_argument("--wav", action="store_true", help="Save the stems as WAV instead of MP3")
+    parser.add_argument("--events", choices=EVENT_MODES, default="text", help="jsonl: write only JSON-lines events (progress, result, error) to stdout and the log to stderr")
     args = parser.parse_args()
     
-    # Call the separation function
-    all_tracks = separate_vocals(args.input_file, args.output_dir)
+    events = open_stdout_events(args.events)
+    try:
+        # Call the separation function
+        all_tracks = separate_vocals(args.input_file, args.output_dir, args.model, mp3=not args.wav, events=events)
+    except Exception as e:
+        if events:
+            events.emit('error', error=str(e))
+        print(f"Error: {str(e)}", file=sys.stderr)
+        sys.exit(1)
+    if events:
+        events.emit('result', **all_tracks)
     
     print(f"\nSeparation complete!")
     for track_name, track_path in all_tracks.items():
-        print(f"{track_name.capitalize()}: {track_path}")
\ No newline at end of file
+        print(f"{track_name.capitalize()}: {track_path}")
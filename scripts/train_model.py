@@ -2,28 +2,468 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import sys
+import json
+import time
+import signal
 import argparse
 import shutil
+import threading
 import subprocess
 
-def train_voice_model(voice_file, model_name, so_vits_svc_dir):
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from scripts.audio_cache import load_audio
+from scripts.events import EVENT_MODES, open_event_writer, open_stdout_events
+from scripts.mixer import write_wav
+from scripts.publish import publish_file
+
+# so-vits-svc trains on mono 44.1 kHz audio; the model registry fingerprints the same decode
+TRAINING_SAMPLE_RATE = 44100
+
+# so-vits-svc regenerates configs/config.json from this template during preprocessing
+CONFIG_TEMPLATE_PATH = os.path.join('configs_template', 'config_template.json')
+
+def training_config(so_vits_svc_dir, **options):
+    """Describe everything that determines the weights `train_voice_model` produces.
+    
+    Used as part of the model registry key, so a change to the so-vits-svc config
+    template or to any training option results in a new model being trained.
+    
+    Args:
+        so_vits_svc_dir (str): Path to the so-vits-svc directory.
+        **options: Training options passed to `train_voice_model`.
+    
+    Returns:
+        dict: JSON serializable description of the training setup.
+    """
+    template_path = os.path.join(so_vits_svc_dir, CONFIG_TEMPLATE_PATH)
+    template = None
+    if os.path.exists(template_path):
+        with open(template_path, 'r', encoding='utf-8') as f:
+            template = json.load(f)
+    return {
+        'trainer': 'so-vits-svc',
+        'config_template': template,
+        # Unset options are left out so they do not change the key
+        'options': {name: value for name, value in options.items() if value is not None},
+    }
+
+# Lines so-vits-svc's train.py logs while training
+LOSSES_PATTERN = re.compile(r'Losses:\s*\[([^\]]*)\],\s*step:\s*(\d+)')
+LEGACY_LOSSES_PATTERN = re.compile(r'\[((?:\s*-?[\d.]+(?:e[-+]?\d+)?\s*,){6}\s*-?[\d.]+(?:e[-+]?\d+)?)\s*\]\s*$', re.IGNORECASE)
+EPOCH_PATTERN = re.compile(r'Train Epoch:\s*(\d+)')
+CHECKPOINT_PATTERN = re.compile(r'Saving model and optimizer state at iteration (\d+) to (\S+)')
+# Reported by scripts/train_worker.py when training on CPU ranks
+THROUGHPUT_PATTERN = re.compile(r'Throughput: batch (\d+), ([\d.]+) samples/sec, (\d+) ranks')
+
+# Names of the losses train.py logs, in order
+LOSS_NAMES = ['disc', 'gen', 'fm', 'mel', 'kl']
+MEL_LOSS_INDEX = LOSS_NAMES.index('mel')
+
+def parse_trainer_line(line):
+    """Parse one line of so-vits-svc train.py output.
+    
+    Returns:
+        dict: {'type': 'losses', 'step', 'losses'}, {'type': 'epoch', 'epoch'} or
+        {'type': 'checkpoint', 'step', 'path'} or
+        {'type': 'throughput', 'batch', 'samples_per_sec', 'ranks'}; None for any other line.
+    """
+    match = LOSSES_PATTERN.search(line)
+    if match:
+        losses = [float(value) for value in match.group(1).split(',') if value.strip()]
+        return {'type': 'losses', 'step': int(match.group(2)), 'losses': losses}
+    match = LEGACY_LOSSES_PATTERN.search(line)
+    if match:
+        # Older releases log [*losses, step, lr]
+        values = [float(value) for value in match.group(1).split(',')]
+        return {'type': 'losses', 'step': int(values[-2]), 'losses': values[:-2]}
+    match = EPOCH_PATTERN.search(line)
+    if match:
+        return {'type': 'epoch', 'epoch': int(match.group(1))}
+    match = CHECKPOINT_PATTERN.search(line)
+    if match:
+        return {'type': 'checkpoint', 'step': int(match.group(1)), 'path': match.group(2)}
+    match = THROUGHPUT_PATTERN.search(line)
+    if match:
+        return {'type': 'throughput', 'batch': int(match.group(1)),
+                'samples_per_sec': float(match.group(2)), 'ranks': int(match.group(3))}
+    return None
+
+class LossPlateau:
+    """Early stopping on a loss that stopped improving.
+    
+    Losses are averaged over each checkpoint interval; training is considered to
+    have plateaued when `patience` consecutive intervals fail to improve on the
+    best average by more than `min_delta`.
+    """
+    
+    def __init__(self, patience, min_delta=0.01):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best = None
+        self.stale_intervals = 0
+        self._window = []
+    
+    def add(self, value):
+        self._window.append(value)
+    
+    def end_interval(self):
+        """Close the current interval. Returns True if training should stop."""
+        if not self._window:
+            return False
+        average = sum(self._window) / len(self._window)
+        self._window = []
+        if self.best is None or average < self.best - self.min_delta:
+            self.best = average
+            self.stale_intervals = 0
+        else:
+            self.stale_intervals += 1
+        return self.stale_intervals >= self.patience
+
+class TrainingTelemetry:
+    """Turn parsed train.py output into JSON-lines training events.
+    
+    Emits 'step' events (step, epoch, losses, steps_per_sec, eta_seconds),
+    'epoch', 'checkpoint' and 'throughput' events while training runs. The ETA
+    uses whichever ends training first: the step budget, the time budget, or
+    the configured number of epochs at the epoch rate seen so far.
+    """
+    
+    def __init__(self, events, max_steps=None, max_minutes=None, total_epochs=None):
+        self.events = events
+        self.max_steps = max_steps
+        self.max_minutes = max_minutes
+        self.total_epochs = total_epochs
+        self.start_time = time.time()
+        self.epoch = None
+        self.first_epoch = None
+        self.first_epoch_time = None
+        self.last_step = None
+        self.last_step_time = None
+        self.steps_per_sec = None
+    
+    def _eta(self, now):
+        estimates = []
+        if self.max_minutes:
+            estimates.append(max(0.0, self.start_time + self.max_minutes * 60 - now))
+        if self.max_steps and self.steps_per_sec:
+            estimates.append(max(0, self.max_steps - self.last_step) / self.steps_per_sec)
+        if self.total_epochs and self.epoch is not None and self.epoch > self.first_epoch:
+            seconds_per_epoch = (now - self.first_epoch_time) / (self.epoch - self.first_epoch)
+            estimates.append(max(0, self.total_epochs - self.epoch + 1) * seconds_per_epoch)
+        return round(min(estimates), 1) if estimates else None
+    
+    def on_record(self, record):
+        now = time.time()
+        if record['type'] == 'epoch':
+            if record['epoch'] == self.epoch:
+                return
+            self.epoch = record['epoch']
+            if self.first_epoch is None:
+                self.first_epoch = self.epoch
+                self.first_epoch_time = now
+            self.events.emit('epoch', epoch=self.epoch, eta_seconds=self._eta(now))
+        elif record['type'] == 'losses':
+            step = record['step']
+            if self.last_step is not None and step > self.last_step and now > self.last_step_time:
+                rate = (step - self.last_step) / (now - self.last_step_time)
+                # Smooth the rate, the log interval is only a few hundred steps
+                self.steps_per_sec = rate if self.steps_per_sec is None else 0.7 * self.steps_per_sec + 0.3 * rate
+            self.last_step = step
+            self.last_step_time = now
+            losses = record['losses']
+            if len(losses) == len(LOSS_NAMES):
+                losses = dict(zip(LOSS_NAMES, losses))
+            self.events.emit(
+                'step',
+                step=step,
+                epoch=self.epoch,
+                losses=losses,
+                steps_per_sec=round(self.steps_per_sec, 4) if self.steps_per_sec else None,
+                eta_seconds=self._eta(now),
+                elapsed_seconds=round(now - self.start_time, 1)
+            )
+        elif record['type'] == 'checkpoint':
+            self.events.emit('checkpoint', step=record['step'], path=record['path'])
+        elif record['type'] == 'throughput':
+            self.events.emit('throughput', samples_per_sec=record['samples_per_sec'], ranks=record['ranks'])
+
+def _configured_epochs(config_path):
+    try:
+        with open(config_path, 'r', encoding='utf-8') as f:
+            return json.load(f)['train']['epochs']
+    except (OSError, ValueError, KeyError):
+        return None
+
+def _checkpoint_step(file_name, prefix):
+    match = re.match(rf'{prefix}_(\d+)\.pth$', file_name)
+    return int(match.group(1)) if match else None
+
+def latest_checkpoint(log_dir, prefix='G'):
+    """Return the path of the highest-step `<prefix>_<step>.pth` in `log_dir`, or None.
+    
+    Step 0 is never returned: it is either the copied base model or the
+    untrained weights train.py saves before its first step.
+    """
+    if not os.path.isdir(log_dir):
+        return None
+    checkpoints = [(_checkpoint_step(name, prefix), name) for name in os.listdir(log_dir)]
+    checkpoints = [(step, name) for step, name in checkpoints if step]
+    if not checkpoints:
+        return None
+    return os.path.join(log_dir, max(checkpoints)[1])
+
+def install_base_checkpoint(log_dir, base_model, base_discriminator=None):
+    """Make a pretrained G/D pair the starting point of the next train.py run.
+    
+    train.py resumes from the latest G_*.pth/D_*.pth in its log directory, so any
+    existing checkpoints are moved into a `previous_<timestamp>` subdirectory and
+    the base pair is copied in as G_0.pth/D_0.pth.
+    
+    Args:
+        log_dir (str): so-vits-svc log directory (logs/44k).
+        base_model (str): Path to the pretrained generator checkpoint.
+        base_discriminator (str): Path to the pretrained discriminator checkpoint.
+            Defaults to the D_*.pth next to `base_model`.
+    """
+    if not os.path.exists(base_model):
+        raise FileNotFoundError(f"Base model not found at {base_model}")
+    if not base_discriminator:
+        base_dir, base_name = os.path.split(base_model)
+        if base_name.startswith('G_'):
+            candidate = os.path.join(base_dir, 'D_' + base_name[2:])
+            if os.path.exists(candidate):
+                base_discriminator = candidate
+    if base_discriminator and not os.path.exists(base_discriminator):
+        raise FileNotFoundError(f"Base discriminator not found at {base_discriminator}")
+    
+    os.makedirs(log_dir, exist_ok=True)
+    existing = [name for name in os.listdir(log_dir)
+                if _checkpoint_step(name, 'G') is not None or _checkpoint_step(name, 'D') is not None]
+    if existing:
+        archive_dir = os.path.join(log_dir, time.strftime('previous_%Y%m%d_%H%M%S'))
+        os.makedirs(archive_dir, exist_ok=True)
+        for name in existing:
+            shutil.move(os.path.join(log_dir, name), os.path.join(archive_dir, name))
+        print(f"Moved {len(existing)} existing checkpoints to {archive_dir}")
+    
+    # No hardlinks: the trainer may rewrite its checkpoints in place, which must not touch the base model
+    publish_file(base_model, os.path.join(log_dir, 'G_0.pth'), hardlink=False)
+    print(f"Fine-tuning from base generator {base_model}")
+    if base_discriminator:
+        publish_file(base_discriminator, os.path.join(log_dir, 'D_0.pth'), hardlink=False)
+        print(f"Fine-tuning from base discriminator {base_discriminator}")
+    else:
+        print("Warning: no base discriminator found, the discriminator will start from scratch")
+
+def fit_eval_interval(config_path, max_steps):
+    """Lower train.eval_interval in a so-vits-svc config so `max_steps` ends on a checkpoint.
+    
+    train.py only saves checkpoints every eval_interval steps, so with the
+    default interval a short step budget would end before anything is saved.
+    The interval is split evenly into the budget instead.
+    
+    Args:
+        config_path (str): Path to the generated configs/config.json.
+        max_steps (int): Step budget of the run.
+    
+    Returns:
+        int: The eval_interval the config now uses.
+    """
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    interval = config['train']['eval_interval']
+    checkpoints = -(-max_steps // interval)
+    fitted = max(1, -(-max_steps // checkpoints))
+    if fitted != interval:
+        config['train']['eval_interval'] = fitted
+        with open(config_path, 'w', encoding='utf-8') as f:
+            json.dump(config, f, indent=2)
+        print(f"Saving a checkpoint every {fitted} steps (was {interval}) to fit the {max_steps} step budget")
+    return fitted
+
+def _stop_process(process):
+    """Stop train.py and the worker processes it spawned."""
+    if process.poll() is not None:
+        return
+    if os.name == 'posix':
+        os.killpg(process.pid, signal.SIGTERM)
+    else:
+        process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        if os.name == 'posix':
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+        process.wait()
+
+# Share of the time budget train.py may overrun while it finishes its next checkpoint
+CHECKPOINT_GRACE = 0.25
+
+def run_trainer(command, cwd=None, max_minutes=None, max_steps=None, patience=None, min_delta=0.01, on_record=None,
+                wait_for_checkpoint=True):
+    """Run train.py, echoing its output, until it exits or a budget runs out.
+    
+    train.py keeps no state between checkpoints, so stopping it mid-interval
+    throws away every step since the last save. Unless `wait_for_checkpoint`
+    is False, a budget that runs out lets training continue until the next
+    checkpoint is on disk and stops it then. The time budget may overrun by
+    `CHECKPOINT_GRACE` of itself before train.py is stopped regardless.
+    
+    Args:
+        command (list): Command line that starts the trainer.
+        cwd (str): Working directory for the trainer.
+        max_minutes (float): Wall-clock budget in minutes.
+        max_steps (int): Stop once this global step has been logged.
+        patience (int): Stop after this many checkpoint intervals without the
+            mel loss improving (train.py does not log a validation loss).
+        min_delta (float): Minimum mel loss decrease that counts as improvement.
+        on_record (callable): Called with every record `parse_trainer_line` recognizes.
+        wait_for_checkpoint (bool): Finish the current checkpoint interval
+            before stopping.
+    
+    Returns:
+        str: Why training ended: 'completed', 'time_budget', 'step_budget' or 'plateau'.
+    """
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
+    popen_kwargs = {'start_new_session': True} if os.name == 'posix' else {}
+    process = subprocess.Popen(command, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                               text=True, errors='replace', bufsize=1, **popen_kwargs)
+    
+    stop_reason = []
+    pending_stop = []
+    
+    def stop(reason):
+        if not stop_reason:
+            stop_reason.append(pending_stop[0] if pending_stop else reason)
+            print(f"\nStopping training: {stop_reason[0].replace('_', ' ')}")
+            _stop_process(process)
+    
+    def stop_at_checkpoint(reason):
+        if not wait_for_checkpoint:
+            stop(reason)
+        elif not stop_reason and not pending_stop:
+            pending_stop.append(reason)
+            print(f"\n{reason.replace('_', ' ').capitalize()} reached, stopping after the next checkpoint")
+    
+    # The time budget is enforced from timers so a silent trainer still gets stopped
+    timers = []
+    if max_minutes:
+        timers.append(threading.Timer(max_minutes * 60, stop_at_checkpoint, args=('time_budget',)))
+        if wait_for_checkpoint:
+            timers.append(threading.Timer(max_minutes * 60 * (1 + CHECKPOINT_GRACE), stop, args=('time_budget',)))
+        for timer in timers:
+            timer.daemon = True
+            timer.start()
+    
+    plateau = LossPlateau(patience, min_delta) if patience else None
+    # train.py logs each save before writing the file, so a checkpoint is only
+    # complete once a line that is not part of the save follows it
+    saving = False
+    try:
+        for line in process.stdout:
+            print(line, end='')
+            if stop_reason:
+                continue
+            record = parse_trainer_line(line)
+            if record is not None and record['type'] == 'checkpoint':
+                saving = True
+            elif saving:
+                saving = False
+                if pending_stop:
+                    stop(pending_stop[0])
+                    continue
+            if record is None:
+                continue
+            if on_record:
+                on_record(record)
+            if record['type'] == 'losses':
+                if plateau and len(record['losses']) > MEL_LOSS_INDEX:
+                    plateau.add(record['losses'][MEL_LOSS_INDEX])
+                if max_steps and record['step'] >= max_steps:
+                    stop_at_checkpoint('step_budget')
+            elif record['type'] == 'checkpoint':
+                if max_steps and record['step'] >= max_steps:
+                    stop_at_checkpoint('step_budget')
+                elif plateau and plateau.end_interval():
+                    stop_at_checkpoint('plateau')
+        process.wait()
+    except BaseException:
+        _stop_process(process)
+        raise
+    finally:
+        for timer in timers:
+            timer.cancel()
+    
+    if stop_reason:
+        return stop_reason[0]
+    if pending_stop and process.returncode == 0:
+        # train.py finished on its own after its last checkpoint
+        return pending_stop[0]
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, command)
+    return 'completed'
+
+def train_voice_model(voice_file, model_name, so_vits_svc_dir, base_model=None, base_discriminator=None,
+                      max_minutes=None, max_steps=None, patience=None, min_delta=0.01,
+                      num_ranks=1, threads_per_rank=None, pack_features=False, telemetry=None):
     """Train a voice conversion model using so-vits-svc.
     
     Args:
         voice_file (str): Path to the voice file to train on.
         model_name (str): Name for the trained model.
         so_vits_svc_dir (str): Path to the so-vits-svc directory.
+        base_model (str): Pretrained generator (G_*.pth) to fine-tune from.
+        base_discriminator (str): Pretrained discriminator (D_*.pth) to fine-tune from.
+        max_minutes (float): Stop training after this many minutes.
+        max_steps (int): Stop training after this many steps.
+        patience (int): Stop training after this many checkpoints without the loss improving.
+        min_delta (float): Minimum loss decrease that counts as an improvement.
+        num_ranks (int): Train on the CPU with this many data-parallel processes
+            (see scripts/train_worker.py) instead of running train.py directly.
+        threads_per_rank (int): Threads per CPU rank (default: cores divided by ranks).
+        pack_features (bool): Pack the preprocessed features of each speaker into
+            one memory-mapped shard and have the data loader read from it.
+        telemetry: Where to write JSON-lines training events: a file path or a
+            `scripts.events.EventWriter`.
     
     Returns:
         str: Path to the trained model.
     """
+    events = open_event_writer(telemetry)
+    try:
+        model_path = _train_voice_model(voice_file, model_name, so_vits_svc_dir, base_model, base_discriminator,
+                                        max_minutes, max_steps, patience, min_delta,
+                                        num_ranks, threads_per_rank, pack_features, events)
+    except Exception as e:
+        if events:
+            events.emit('train_failed', error=str(e))
+        raise
+    finally:
+        if events and events is not telemetry:
+            events.close()
+    return model_path
+
+def _train_voice_model(voice_file, model_name, so_vits_svc_dir, base_model, base_discriminator,
+                       max_minutes, max_steps, patience, min_delta,
+                       num_ranks, threads_per_rank, pack_features, events):
     # Ensure so-vits-svc directory exists
     if not os.path.exists(so_vits_svc_dir):
         print(f"ERROR: so-vits-svc directory not found at {so_vits_svc_dir}")
         print(f"Current working directory: {os.getcwd()}")
         print(f"Directory contents: {os.listdir('.')}")
         raise FileNotFoundError(f"so-vits-svc directory not found at {so_vits_svc_dir}")
+    so_vits_svc_dir = os.path.abspath(so_vits_svc_dir)
+    # Resolved now: the training steps below run inside the so-vits-svc directory
+    if base_model:
+        base_model = os.path.abspath(base_model)
+    if base_discriminator:
+        base_discriminator = os.path.abspath(base_discriminator)
+    log_dir = os.path.join(so_vits_svc_dir, 'logs', '44k')
     
     # Create dataset_raw directory if it doesn't exist
     dataset_raw_dir = os.path.join(so_vits_svc_dir, 'dataset_raw', model_name)
@@ -32,44 +472,92 @@ def train_voice_model(voice_file, model_name, so_vits_svc_dir):
     # Copy the voice file to the dataset_raw directory
     voice_file_name = os.path.basename(voice_file)
     voice_file_dest = os.path.join(dataset_raw_dir, voice_file_name)
-    shutil.copy(voice_file, voice_file_dest)
-    
-    # Convert to WAV if needed
-    if not voice_file_dest.lower().endswith('.wav'):
-        wav_file = os.path.splitext(voice_file_dest)[0] + '.wav'
-        subprocess.run(['ffmpeg', '-i', voice_file_dest, wav_file], check=True)
-        os.remove(voice_file_dest)  # Remove the original file
-        voice_file_dest = wav_file
+    if voice_file_dest.lower().endswith('.wav'):
+        # The dataset is only read, so a link is enough
+        publish_file(voice_file, voice_file_dest)
+    else:
+        # Convert to WAV from the shared decode cache (usually already filled by the registry lookup)
+        voice_file_dest = os.path.splitext(voice_file_dest)[0] + '.wav'
+        samples, sample_rate = load_audio(voice_file, TRAINING_SAMPLE_RATE, 1)
+        write_wav(voice_file_dest, samples, sample_rate)
     
     # Change to so-vits-svc directory
     original_dir = os.getcwd()
     os.chdir(so_vits_svc_dir)
     
+    def stage(name):
+        if events:
+            events.emit('stage', stage=name)
+    
     try:
         # Step 1: Resample audio to 44kHz
+        stage('resample')
         print("Resampling audio...")
         subprocess.run(['python', 'resample.py'], check=True)
         
         # Step 2: Preprocess flist and config
+        stage('preprocess_flist_config')
         print("Preprocessing flist and config...")
         subprocess.run(['python', 'preprocess_flist_config.py'], check=True)
         
         # Step 3: Preprocess hubert and f0
+        stage('preprocess_hubert_f0')
         print("Preprocessing hubert and f0...")
         subprocess.run(['python', 'preprocess_hubert_f0.py'], check=True)
         
-        # Step 4: Train the model
-        print("Training the model...")
-        subprocess.run(['python', 'train.py', '--config', 'configs/config.json'], check=True)
+        # Step 3b: Pack the per-clip feature files into one shard per speaker
+        shard_dir = None
+        if pack_features:
+            from scripts.feature_shards import pack_dataset
+            stage('pack_features')
+            print("Packing features...")
+            shard_dir = os.path.join('dataset', '44k')
+            pack_dataset(shard_dir)
         
-        # Get the path to the trained model
-        model_path = os.path.join(so_vits_svc_dir, 'logs', '44k', f"{model_name}.pth")
+        # Step 4: Train the model, optionally starting from a pretrained base
+        if base_model:
+            install_base_checkpoint(log_dir, base_model, base_discriminator)
+        if num_ranks and num_ranks > 1:
+            from scripts.train_worker import worker_command
+            print(f"Training the model on {num_ranks} CPU ranks...")
+            command = worker_command(num_ranks, threads_per_rank, shard_dir=shard_dir)
+        elif shard_dir:
+            from scripts.train_worker import worker_command
+            print("Training the model...")
+            command = worker_command(1, threads_per_rank, device='auto', shard_dir=shard_dir)
+        else:
+            print("Training the model...")
+            command = ['python', 'train.py', '--config', 'configs/config.json']
+        if max_steps:
+            fit_eval_interval(os.path.join('configs', 'config.json'), max_steps)
+        # Checkpoints left by an earlier run that train.py resumes from are not this run's result
+        previous_checkpoint = latest_checkpoint(log_dir, 'G')
+        stage('train')
+        monitor = None
+        if events:
+            monitor = TrainingTelemetry(events, max_steps, max_minutes, _configured_epochs(os.path.join('configs', 'config.json')))
+            events.emit('train_started', command=command, max_steps=max_steps, max_minutes=max_minutes,
+                        total_epochs=monitor.total_epochs)
+        stop_reason = run_trainer(
+            command,
+            max_minutes=max_minutes,
+            max_steps=max_steps,
+            patience=patience,
+            min_delta=min_delta,
+            on_record=monitor.on_record if monitor else None
+        )
+        print(f"Training finished ({stop_reason.replace('_', ' ')})")
         
-        # Verify that the model file exists
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(f"Trained model not found at expected location: {model_path}")
+        # train.py saves the generator as G_<step>.pth; the latest one this run wrote is the model
+        model_path = latest_checkpoint(log_dir, 'G')
+        if not model_path or model_path == previous_checkpoint:
+            raise RuntimeError(f"Training ended ({stop_reason.replace('_', ' ')}) before train.py saved a "
+                               f"checkpoint, so no trained model was produced. Allow more training time or steps.")
         
         print(f"Model trained successfully and saved to: {model_path}")
+        if events:
+            events.emit('train_finished', reason=stop_reason, model_path=model_path,
+                        step=monitor.last_step, elapsed_seconds=round(time.time() - monitor.start_time, 1))
         return model_path
     
     finally:
@@ -81,16 +569,50 @@ def main():
     parser.add_argument('voice_file', help='Path to the voice file to train on')
     parser.add_argument('-n', '--model-name', default='my_voice_model', help='Name for the trained model')
     parser.add_argument('-d', '--so-vits-svc-dir', default='/content/so-vits-svc', help='Path to the so-vits-svc directory')
+    parser.add_argument('-b', '--base-model', help='Pretrained generator checkpoint (G_*.pth) to fine-tune from')
+    parser.add_argument('--base-discriminator', help='Pretrained discriminator checkpoint (D_*.pth), defaults to the D_*.pth next to the base model')
+    parser.add_argument('--max-minutes', type=float, help='Stop training after this many minutes')
+    parser.add_argument('--max-steps', type=int, help='Stop training after this many steps')
+    parser.add_argument('--patience', type=int, help='Stop training after this many checkpoints without the loss improving')
+    parser.add_argument('--min-delta', type=float, default=0.01, help='Minimum loss decrease that counts as an improvement')
+    parser.add_argument('--ranks', type=int, default=1, help='Train on the CPU with this many data-parallel processes')
+    parser.add_argument('--threads-per-rank', type=int, help='Threads per CPU rank (default: cores divided by ranks)')
+    parser.add_argument('--pack-features', action='store_true', help='Pack the preprocessed features into memory-mapped shards for the data loader')
+    parser.add_argument('--telemetry', help="Write JSON-lines training events (step, losses, steps/sec, ETA, checkpoints) to this file; use --events jsonl for stdout")
+    parser.add_argument('--events', choices=EVENT_MODES, default='text', help='jsonl: write only JSON-lines events (training events, result, error) to stdout and the log to stderr')
     
     args = parser.parse_args()
+    if args.events == 'jsonl' and args.telemetry:
+        parser.error("--events jsonl already writes the training events to stdout; drop --telemetry")
+    if args.telemetry == '-':
+        parser.error("--telemetry - would mix the events into the training log; use --events jsonl for events on stdout")
     
+    events = open_stdout_events(args.events)
     try:
-        model_path = train_voice_model(args.voice_file, args.model_name, args.so_vits_svc_dir)
+        model_path = train_voice_model(
+            args.voice_file,
+            args.model_name,
+            args.so_vits_svc_dir,
+            base_model=args.base_model,
+            base_discriminator=args.base_discriminator,
+            max_minutes=args.max_minutes,
+            max_steps=args.max_steps,
+            patience=args.patience,
+            min_delta=args.min_delta,
+            num_ranks=args.ranks,
+            threads_per_rank=args.threads_per_rank,
+            pack_features=args.pack_features,
+            telemetry=events or args.telemetry
+        )
+        if events:
+            events.emit('result', model_path=model_path)
         # Print the model path to stdout for the TypeScript code to capture
         # Use double quotes to ensure proper parsing in TypeScript
         print(f'MODEL_PATH="{model_path.replace("\\", "/")}"')
         return 0
     except Exception as e:
+        if events:
+            events.emit('error', error=str(e))
         print(f"Error: {str(e)}", file=sys.stderr)
         return 1
 
@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""CPU data-parallel training for so-vits-svc.
+
+so-vits-svc's train.py only trains on CUDA devices (one process per GPU). This
+worker runs its `run()` function on the CPU instead: each local rank is a
+separate process, the ranks synchronize gradients over the gloo backend on
+localhost, and the machine's cores are split between them. It must be started
+from inside the so-vits-svc directory.
+
+It can also serve the training data from packed feature shards (see
+scripts/feature_shards.py), on the CPU or on the available GPUs.
+"""
+
+import os
+import sys
+import time
+import shutil
+import socket
+import argparse
+import functools
+import subprocess
+
+# Import our modules
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+WORKER_PATH = os.path.abspath(__file__)
+
+# Scratch model directory under logs/ that benchmarks train in, so they never touch logs/44k
+BENCHMARK_MODEL_NAME = 'rank_benchmark'
+
+def default_threads_per_rank(num_ranks):
+    """Split the available cores evenly between `num_ranks` processes."""
+    return max(1, (os.cpu_count() or 1) // num_ranks)
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+class ThroughputLoader:
+    """Wrap the training DataLoader to report samples/sec across all ranks."""
+
+    def __init__(self, loader, world_size, report_every, verbose):
+        self.loader = loader
+        self.world_size = world_size
+        self.report_every = report_every
+        self.verbose = verbose
+        self.epoch = 0
+        self.batches = 0
+
+    def __len__(self):
+        return len(self.loader)
+
+    def __getattr__(self, name):
+        return getattr(self.loader, name)
+
+    def __iter__(self):
+        self.epoch += 1
+        if hasattr(self.loader.sampler, 'set_epoch'):
+            self.loader.sampler.set_epoch(self.epoch)
+        samples = 0
+        start_time = time.time()
+        for batch_idx, batch in enumerate(self.loader, 1):
+            yield batch
+            self.batches += 1
+            samples += len(batch[0])
+            if self.verbose and batch_idx % self.report_every == 0:
+                elapsed = time.time() - start_time
+                # Every rank processes its own shard of the same size
+                samples_per_sec = samples * self.world_size / elapsed if elapsed > 0 else 0.0
+                print(f"Throughput: batch {self.batches}, {samples_per_sec:.2f} samples/sec, {self.world_size} ranks", flush=True)
+
+def _patch_for_cpu(train_module):
+    """Redirect train.py's CUDA/NCCL calls to the CPU and the gloo backend."""
+    import torch
+    import torch.distributed as dist
+    from torch.nn.parallel import DistributedDataParallel
+
+    init_process_group = dist.init_process_group
+
+    def gloo_init_process_group(*args, **kwargs):
+        if args:
+            args = args[1:]
+        kwargs['backend'] = 'gloo'
+        return init_process_group(*args, **kwargs)
+
+    dist.init_process_group = gloo_init_process_group
+    torch.cuda.set_device = lambda device: None
+    torch.Tensor.cuda = lambda self, *args, **kwargs: self
+    torch.nn.Module.cuda = lambda self, *args, **kwargs: self
+    train_module.DDP = lambda module, device_ids=None, **kwargs: DistributedDataParallel(module, **kwargs)
+
+def _patch_data_loader(train_module, rank, world_size, report_every, cpu_workers=None, shard_paths=None):
+    """Shard the training set between ranks and report throughput.
+
+    train.py feeds every rank the whole dataset; give each rank its own shard
+    of the training set (the first loader it builds) so adding ranks adds
+    throughput. On the CPU the loader workers are capped at `cpu_workers`.
+    """
+    from torch.utils.data.distributed import DistributedSampler
+
+    data_loader_class = train_module.DataLoader
+    wrapped = []
+
+    def patched_data_loader(dataset, *args, **kwargs):
+        if cpu_workers is not None:
+            kwargs['pin_memory'] = False
+            kwargs['num_workers'] = min(kwargs.get('num_workers', 0), cpu_workers)
+            if kwargs['num_workers'] == 0:
+                kwargs.pop('persistent_workers', None)
+                kwargs.pop('prefetch_factor', None)
+        if shard_paths and kwargs.get('num_workers') and kwargs.get('worker_init_fn') is None:
+            from scripts.feature_shards import shard_worker_init_fn
+            kwargs['worker_init_fn'] = functools.partial(shard_worker_init_fn, shard_paths)
+        if wrapped:
+            return data_loader_class(dataset, *args, **kwargs)
+        if world_size > 1 and kwargs.get('sampler') is None and kwargs.get('batch_sampler') is None:
+            kwargs['sampler'] = DistributedSampler(dataset, num_replicas=world_size, rank=rank, shuffle=True)
+            kwargs['shuffle'] = False
+        loader = ThroughputLoader(data_loader_class(dataset, *args, **kwargs), world_size, report_every, rank == 0)
+        wrapped.append(loader)
+        return loader
+
+    train_module.DataLoader = patched_data_loader
+
+def run_rank(rank, world_size, config_path, model_name, threads, report_every, device='cpu', shard_dir=None):
+    """Train as one rank of the process group (blocks until training ends)."""
+    if device == 'cpu':
+        # Thread pools are sized when torch is first imported
+        os.environ['OMP_NUM_THREADS'] = str(threads)
+        os.environ['MKL_NUM_THREADS'] = str(threads)
+    import torch
+    if device == 'cpu':
+        torch.set_num_threads(threads)
+
+    # train.py reads its config from the command line
+    sys.path.insert(0, os.getcwd())
+    sys.argv = ['train.py', '-c', config_path, '-m', model_name]
+    import train
+    import utils
+
+    hps = utils.get_hparams()
+    shard_paths = None
+    if shard_dir:
+        from scripts.feature_shards import find_shards, install_feature_shards
+        shard_paths = [os.path.abspath(path) for path in find_shards(shard_dir)]
+        install_feature_shards(shard_paths)
+        if rank == 0:
+            print(f"Reading training features from {len(shard_paths)} packed shards", flush=True)
+
+    if device == 'cpu':
+        hps.train.fp16_run = False
+        _patch_for_cpu(train)
+        _patch_data_loader(train, rank, world_size, report_every, cpu_workers=1 if threads < 4 else 2, shard_paths=shard_paths)
+        if rank == 0:
+            print(f"Training on CPU with {world_size} ranks, {threads} threads per rank", flush=True)
+    else:
+        _patch_data_loader(train, rank, world_size, report_every, shard_paths=shard_paths)
+        if rank == 0:
+            print(f"Training on {world_size} GPUs", flush=True)
+    train.run(rank, world_size, hps)
+
+def launch_ranks(num_ranks, config_path, model_name, threads=None, report_every=50, device='cpu', shard_dir=None):
+    """Run rank 0 in this process and ranks 1..N-1 as child processes.
+
+    With device='auto' the ranks run on the GPUs when CUDA is available (one
+    rank per GPU, like train.py) and on the CPU otherwise.
+    """
+    if device == 'auto':
+        import torch
+        device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        if device == 'cuda':
+            num_ranks = torch.cuda.device_count()
+    threads = threads or default_threads_per_rank(num_ranks)
+    os.environ.setdefault('MASTER_ADDR', '127.0.0.1')
+    os.environ.setdefault('MASTER_PORT', str(_free_port()))
+
+    children = []
+    for rank in range(1, num_ranks):
+        children.append(subprocess.Popen([
+            sys.executable, WORKER_PATH,
+            '--rank', str(rank),
+            '--ranks', str(num_ranks),
+            '--threads', str(threads),
+            '--device', device,
+            '-c', config_path,
+            '-m', model_name
+        ] + (['--feature-shards', shard_dir] if shard_dir else [])))
+
+    try:
+        run_rank(0, num_ranks, config_path, model_name, threads, report_every, device, shard_dir)
+    finally:
+        for child in children:
+            if child.poll() is None:
+                child.terminate()
+        for child in children:
+            child.wait()
+
+def worker_command(num_ranks, threads=None, config_path='configs/config.json', model_name='44k',
+                   device='cpu', shard_dir=None):
+    """Command line that starts the worker (run it from the so-vits-svc directory)."""
+    command = ['python', WORKER_PATH, '--ranks', str(num_ranks), '--device', device, '-c', config_path, '-m', model_name]
+    if threads:
+        command += ['--threads', str(threads)]
+    if shard_dir:
+        command += ['--feature-shards', shard_dir]
+    return command
+
+def _seed_benchmark_dir(so_vits_svc_dir):
+    """Create a fresh benchmark model directory holding a copy of the latest logs/44k checkpoint pair.
+
+    Returns:
+        str: The benchmark model directory.
+    """
+    from scripts.publish import publish_file
+    from scripts.train_model import _checkpoint_step
+
+    log_dir = os.path.join(so_vits_svc_dir, 'logs', '44k')
+    benchmark_dir = os.path.join(so_vits_svc_dir, 'logs', BENCHMARK_MODEL_NAME)
+    shutil.rmtree(benchmark_dir, ignore_errors=True)
+    os.makedirs(benchmark_dir)
+    names = os.listdir(log_dir) if os.path.isdir(log_dir) else []
+    for prefix in ('G', 'D'):
+        checkpoints = [(_checkpoint_step(name, prefix), name) for name in names]
+        checkpoints = [(step, name) for step, name in checkpoints if step is not None]
+        if checkpoints:
+            name = max(checkpoints)[1]
+            # A copy: train.py may rewrite its checkpoints in place
+            publish_file(os.path.join(log_dir, name), os.path.join(benchmark_dir, name), hardlink=False)
+    return benchmark_dir
+
+def benchmark_rank_scaling(so_vits_svc_dir, max_ranks, minutes=2.0):
+    """Measure training samples/sec for 1, 2, 4, ... up to `max_ranks` ranks.
+
+    Runs train.py on the already preprocessed dataset for `minutes` per rank
+    count. The first throughput report of each run is treated as warm-up.
+    Each run trains in a scratch model directory (logs/rank_benchmark) seeded
+    with a copy of the latest checkpoint, which is removed afterwards, so the
+    benchmark leaves the real checkpoints in logs/44k untouched.
+
+    Returns:
+        list: One dict per rank count with 'ranks', 'threads_per_rank',
+        'samples_per_sec', 'speedup' and 'efficiency'.
+    """
+    from scripts.train_model import run_trainer
+
+    rank_counts = []
+    ranks = 1
+    while ranks < max_ranks:
+        rank_counts.append(ranks)
+        ranks *= 2
+    rank_counts.append(max_ranks)
+
+    results = []
+    for ranks in rank_counts:
+        threads = default_threads_per_rank(ranks)
+        print(f"\n===== BENCHMARK: {ranks} RANKS x {threads} THREADS =====\n")
+        measurements = []
+
+        def on_record(record):
+            if record['type'] == 'throughput':
+                measurements.append(record['samples_per_sec'])
+
+        benchmark_dir = _seed_benchmark_dir(so_vits_svc_dir)
+        try:
+            run_trainer(worker_command(ranks, threads, model_name=BENCHMARK_MODEL_NAME), cwd=so_vits_svc_dir,
+                        max_minutes=minutes, on_record=on_record, wait_for_checkpoint=False)
+        finally:
+            shutil.rmtree(benchmark_dir, ignore_errors=True)
+        steady = measurements[1:] or measurements
+        samples_per_sec = sorted(steady)[len(steady) // 2] if steady else 0.0
+        results.append({'ranks': ranks, 'threads_per_rank': threads, 'samples_per_sec': samples_per_sec})
+
+    baseline = results[0]['samples_per_sec']
+    for result in results:
+        result['speedup'] = result['samples_per_sec'] / baseline if baseline else 0.0
+        result['efficiency'] = result['speedup'] / result['ranks']
+
+    print("\nranks  threads/rank  samples/sec  speedup  efficiency")
+    for result in results:
+        print(f"{result['ranks']:>5}  {result['threads_per_rank']:>12}  {result['samples_per_sec']:>11.2f}  "
+              f"{result['speedup']:>7.2f}  {result['efficiency']:>10.0%}")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description='Train a so-vits-svc model on the CPU with several data-parallel processes')
+    parser.add_argument('--ranks', type=int, default=1, help='Number of local ranks (processes)')
+    parser.add_argument('--threads', type=int, help='Threads per rank (default: cores divided by ranks)')
+    parser.add_argument('--rank', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--device', choices=['cpu', 'cuda', 'auto'], default='cpu', help='Train on the CPU, on the GPUs, or on the GPUs when available')
+    parser.add_argument('--feature-shards', help='Read training features from the packed shards under this dataset directory (e.g. dataset/44k)')
+    parser.add_argument('-c', '--config', default='configs/config.json', help='Path to the so-vits-svc config, relative to the so-vits-svc directory')
+    parser.add_argument('-m', '--model', default='44k', help='so-vits-svc model directory name under logs/')
+    parser.add_argument('--report-every', type=int, default=50, help='Report samples/sec every this many batches')
+    parser.add_argument('--benchmark-ranks', type=int, help='Instead of training, report samples/sec scaling from 1 to this many ranks')
+    parser.add_argument('--minutes', type=float, default=2.0, help='Minutes to train for each rank count when benchmarking')
+    parser.add_argument('-d', '--so-vits-svc-dir', default='so-vits-svc', help='Path to the so-vits-svc directory (benchmark only)')
+
+    args = parser.parse_args()
+
+    try:
+        if args.benchmark_ranks:
+            benchmark_rank_scaling(args.so_vits_svc_dir, args.benchmark_ranks, args.minutes)
+        elif args.rank is not None:
+            run_rank(args.rank, args.ranks, args.config, args.model,
+                     args.threads or default_threads_per_rank(args.ranks), args.report_every,
+                     args.device, args.feature_shards)
+        else:
+            launch_ranks(args.ranks, args.config, args.model, args.threads, args.report_every,
+                         args.device, args.feature_shards)
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
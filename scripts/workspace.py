@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Job-scoped working directories for requests that run at the same time.
+
+Every job gets its own directory under the workspace root, and all of its
+inputs, intermediate files and outputs live there. Concurrent requests
+therefore never share a path, and cleaning a job up is a single rmtree. The
+root is `$JOB_WORKSPACE_DIR`, or a directory under the system temp dir.
+
+Workspaces are plain directories named after their job id, so any process
+(for example another worker of the pool) can reopen a job by id. Directories
+left behind by a crashed process are removed by `prune_workspaces`.
+"""
+
+import os
+import re
+import sys
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+
+# Workspaces not touched for this long are considered abandoned
+DEFAULT_MAX_AGE_SECONDS = 24 * 3600
+
+_JOB_ID = re.compile(r'^[A-Za-z0-9_-]+$')
+
+def default_workspace_root():
+    """Return the directory job workspaces are created in."""
+    return os.environ.get('JOB_WORKSPACE_DIR') or os.path.join(tempfile.gettempdir(), 'ia-conversor-jobs')
+
+class Workspace:
+    """A job's private directory.
+
+    Args:
+        job_id (str): Id of an existing job to reopen; a new job is created if None.
+        root (str): Workspace root (default: `default_workspace_root()`).
+    """
+
+    def __init__(self, job_id=None, root=None):
+        self.root = os.path.abspath(root or default_workspace_root())
+        if job_id is None:
+            os.makedirs(self.root, exist_ok=True)
+            # Time first so `ls` lists jobs in creation order; the random part makes the name unique
+            job_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:12]}"
+            self.job_id = job_id
+            os.mkdir(self.dir)
+        else:
+            if not _JOB_ID.match(job_id):
+                raise ValueError(f"Invalid job id: {job_id}")
+            self.job_id = job_id
+            if not os.path.isdir(self.dir):
+                raise FileNotFoundError(f"No workspace for job {job_id} in {self.root}")
+
+    @property
+    def dir(self):
+        return os.path.join(self.root, self.job_id)
+
+    def path(self, name):
+        """Return the exact path of artifact `name` (e.g. 'input.wav' or 'separated/vocals.wav').
+
+        Parent directories are created. Names that would leave the workspace are rejected.
+        """
+        path = os.path.normpath(os.path.join(self.dir, name))
+        if os.path.isabs(name) or not path.startswith(self.dir + os.sep):
+            raise ValueError(f"Artifact name must be a relative path inside the workspace: {name}")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def paths(self, names):
+        """Return {name: exact path} for several artifacts."""
+        return {name: self.path(name) for name in names}
+
+    def cleanup(self):
+        """Remove the workspace and everything in it."""
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+def prune_workspaces(root=None, max_age_seconds=DEFAULT_MAX_AGE_SECONDS):
+    """Remove workspaces that have not been modified for `max_age_seconds`.
+
+    Returns:
+        list: Ids of the removed jobs.
+    """
+    root = root or default_workspace_root()
+    if not os.path.isdir(root):
+        return []
+    cutoff = time.time() - max_age_seconds
+    removed = []
+    for job_id in sorted(os.listdir(root)):
+        job_dir = os.path.join(root, job_id)
+        if os.path.isdir(job_dir) and _JOB_ID.match(job_id) and os.path.getmtime(job_dir) < cutoff:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            removed.append(job_id)
+    return removed
+
+def main():
+    parser = argparse.ArgumentParser(description='Create, remove or prune job workspaces')
+    parser.add_argument('command', choices=['create', 'cleanup', 'prune', 'list'], help='Action to perform')
+    parser.add_argument('job_id', nargs='?', help='Job to remove (cleanup)')
+    parser.add_argument('--root', help='Workspace root (default: $JOB_WORKSPACE_DIR or the system temp dir)')
+    parser.add_argument('--max-age', type=float, default=DEFAULT_MAX_AGE_SECONDS / 3600,
+                        help='Prune workspaces older than this many hours')
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'create':
+            workspace = Workspace(root=args.root)
+            print(f"Created workspace {workspace.dir}")
+            print(f'JOB_ID="{workspace.job_id}"')
+            print(f'WORKSPACE_PATH="{workspace.dir.replace(os.sep, "/")}"')
+        elif args.command == 'cleanup':
+            if not args.job_id:
+                parser.error('cleanup needs a job id')
+            Workspace(args.job_id, root=args.root).cleanup()
+            print(f"Removed workspace of job {args.job_id}")
+        elif args.command == 'prune':
+            removed = prune_workspaces(args.root, args.max_age * 3600)
+            print(f"Removed {len(removed)} abandoned workspace(s)")
+        else:
+            root = args.root or default_workspace_root()
+            for job_id in sorted(os.listdir(root)) if os.path.isdir(root) else []:
+                print(job_id)
+        return 0
+    except Exception as e:
+        print(f"Error: {str(e)}", file=sys.stderr)
+        return 1
+
+if __name__ == '__main__':
+    sys.exit(main())
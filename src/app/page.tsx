@@ -118,7 +118,7 @@ export default function Home() {
       // Merge the converted vocal track with the instrumental track
       setProgress('Merging the converted vocal track with the instrumental track');
       setProgressValue(80);
-      const mergedAudio = await mergeAudio(convertedVocalTrack, instrumentalTrack);
+      const mergedAudio = await mergeAudio(convertedVocalTrack, instrumentalTrack, 'mp3');
 
       // Convert the merged audio (Buffer) to a Blob
       setProgress('Converting the merged audio (Buffer) to a Blob');
@@ -0,0 +1,226 @@
+import {spawn, ChildProcess} from 'child_process';
+import path from 'path';
+
+/**
+ * @fileOverview Pool of persistent Python workers (scripts/rpc_worker.py) spoken to over JSON-RPC on stdio.
+ *
+ * Spawning a Python process per request pays for the interpreter, NumPy and torch imports every time.
+ * Each worker here stays alive between requests, so those imports and the Demucs models used for separation
+ * are reused. so-vits-svc conversion and training still run in a child process that loads its model per request.
+ * A worker handles one request at a time, so the pool size, set with the PYTHON_WORKERS environment variable
+ * (default 1), is the number of requests that run in parallel.
+ */
+
+/**
+ * Error returned by a worker for a failed call.
+ */
+export class PythonWorkerError extends Error {
+  /**
+   * JSON-RPC error code (-32000 when the stage itself failed).
+   */
+  code: number;
+  data?: unknown;
+
+  constructor(message: string, code: number, data?: unknown) {
+    super(message);
+    this.name = 'PythonWorkerError';
+    this.code = code;
+    this.data = data;
+  }
+}
+
+/**
+ * Event sent by a worker while a call runs, e.g. {event: 'progress', stage: 'separate', percent: 25, message: '...'}
+ * (see scripts/events.py).
+ */
+export interface PythonWorkerEvent {
+  event: string;
+  time: number;
+  [field: string]: unknown;
+}
+
+interface PendingCall {
+  resolve: (result: any) => void;
+  reject: (error: Error) => void;
+  onEvent?: (event: PythonWorkerEvent) => void;
+}
+
+class PythonWorker {
+  private process: ChildProcess | null = null;
+  private buffer = '';
+  private nextId = 1;
+  private pending = new Map<number, PendingCall>();
+
+  /**
+   * Number of calls sent to this worker that have not been answered yet.
+   */
+  get load(): number {
+    return this.pending.size;
+  }
+
+  private start(): ChildProcess {
+    const workerScript = path.join(process.cwd(), 'scripts', 'rpc_worker.py');
+    const child = spawn(process.env.PYTHON || 'python', [workerScript], {stdio: ['pipe', 'pipe', 'pipe']});
+    this.buffer = '';
+
+    child.stdout!.on('data', (data: Buffer) => {
+      this.buffer += data.toString();
+      let newline;
+      while ((newline = this.buffer.indexOf('\n')) !== -1) {
+        const line = this.buffer.slice(0, newline).trim();
+        this.buffer = this.buffer.slice(newline + 1);
+        if (line) {
+          this.handleMessage(line);
+        }
+      }
+    });
+
+    // Everything the stages print goes to the worker's stderr
+    child.stderr!.on('data', (data: Buffer) => {
+      console.log(`Python worker ${child.pid}: ${data.toString().trimEnd()}`);
+    });
+
+    child.on('exit', (code, signal) => {
+      if (this.process === child) {
+        this.process = null;
+      }
+      // The next call starts a new worker; calls still in flight on this one are lost
+      this.failPending(new Error(`Python worker exited (code ${code}, signal ${signal})`));
+    });
+
+    // Writing to a worker that just died fails with EPIPE; unhandled, that error would take down the server
+    child.stdin!.on('error', (err: Error) => {
+      console.error(`Python worker ${child.pid} stopped accepting requests:`, err.message);
+      if (this.process === child) {
+        this.process = null;
+      }
+      this.failPending(err);
+    });
+
+    child.on('error', (err: Error) => {
+      console.error('Failed to start Python worker.', err);
+      if (this.process === child) {
+        this.process = null;
+      }
+      this.failPending(err);
+    });
+
+    this.process = child;
+    return child;
+  }
+
+  private handleMessage(line: string) {
+    let message: any;
+    try {
+      message = JSON.parse(line);
+    } catch (err) {
+      console.error('Unparseable message from Python worker:', line);
+      return;
+    }
+
+    if (message.method === 'event' && message.params) {
+      // Notification carrying an event of a call that is still running
+      const {request_id: requestId, ...event} = message.params;
+      this.pending.get(requestId)?.onEvent?.(event as PythonWorkerEvent);
+      return;
+    }
+
+    const call = this.pending.get(message.id);
+    if (!call) {
+      return;
+    }
+    this.pending.delete(message.id);
+    if (message.error) {
+      call.reject(new PythonWorkerError(message.error.message, message.error.code, message.error.data));
+    } else {
+      call.resolve(message.result);
+    }
+  }
+
+  private failPending(error: Error) {
+    const calls = Array.from(this.pending.values());
+    this.pending.clear();
+    for (const call of calls) {
+      call.reject(error);
+    }
+  }
+
+  call<T>(method: string, params: Record<string, unknown>, onEvent?: (event: PythonWorkerEvent) => void): Promise<T> {
+    const child = this.process || this.start();
+    const id = this.nextId++;
+    return new Promise<T>((resolve, reject) => {
+      this.pending.set(id, {resolve, reject, onEvent});
+      child.stdin!.write(JSON.stringify({jsonrpc: '2.0', id, method, params}) + '\n', (err) => {
+        // Unless the stdin 'error' listener already failed it
+        if (err && this.pending.delete(id)) {
+          reject(err);
+        }
+      });
+    });
+  }
+}
+
+// Keep the pool on globalThis so hot reloads in development do not leak workers
+const globalForWorkers = globalThis as unknown as {pythonWorkers?: PythonWorker[]};
+
+function getWorkers(): PythonWorker[] {
+  if (!globalForWorkers.pythonWorkers) {
+    const size = Math.max(1, parseInt(process.env.PYTHON_WORKERS || '1', 10) || 1);
+    globalForWorkers.pythonWorkers = Array.from({length: size}, () => new PythonWorker());
+  }
+  return globalForWorkers.pythonWorkers;
+}
+
+/**
+ * Calls a method of scripts/rpc_worker.py (e.g. 'separate' or 'merge') on the least busy worker.
+ *
+ * @param method The worker method to call.
+ * @param params The method's keyword arguments.
+ * @param onEvent Optional callback for the progress events the method sends while it runs.
+ * @returns A promise that resolves to the method's result, or rejects with a PythonWorkerError.
+ */
+export function callPythonWorker<T = any>(
+  method: string,
+  params: Record<string, unknown>,
+  onEvent?: (event: PythonWorkerEvent) => void,
+): Promise<T> {
+  const workers = getWorkers();
+  const worker = workers.reduce((idlest, candidate) => (candidate.load < idlest.load ? candidate : idlest));
+  return worker.call<T>(method, params, onEvent);
+}
+
+/**
+ * A job workspace allocated by the Python worker (see scripts/workspace.py).
+ */
+export interface PythonJob {
+  jobId: string;
+  /**
+   * The job's private directory.
+   */
+  workspace: string;
+  /**
+   * Exact path of each artifact requested when the job was created.
+   */
+  paths: Record<string, string>;
+}
+
+/**
+ * Runs `run` with a fresh job workspace and removes the workspace afterwards, so concurrent
+ * requests never share a file.
+ *
+ * @param artifacts Names of the files the job will use (e.g. 'input.wav'); their exact paths are in `job.paths`.
+ * @param run The work to do in the workspace.
+ * @returns A promise that resolves to the result of `run`.
+ */
+export async function withPythonJob<T>(artifacts: string[], run: (job: PythonJob) => Promise<T>): Promise<T> {
+  const {job_id: jobId, workspace, paths} = await callPythonWorker<{job_id: string; workspace: string; paths: Record<string, string>}>(
+    'create_job', {artifacts});
+  try {
+    return await run({jobId, workspace, paths});
+  } finally {
+    // Not awaited: the result does not depend on it, and the worker may be busy with another request
+    callPythonWorker('release_job', {job_id: jobId}).catch((err: Error) => {
+      console.error(`Failed to remove the workspace of job ${jobId}:`, err.message);
+    });
+  }
+}